@@ -0,0 +1,179 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from embed_documents import fold
+
+
+ROMAN = {"i": 1, "ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "x": 10}
+NUMBER = r"(\d{1,2}|[ivx]{1,4})"
+# Patterns run on accent-folded, lowercased lines. Unnumbered headings must end the line or be followed by
+# points/colon, so prose such as "probleme d'equation ou" or "problemes ou limites" is not a heading.
+HEADINGS = (
+    ("exercice", re.compile(rf"^exercice\s*(?:n\s*[°o]\s*)?{NUMBER}(?=$|[\s:.(\-])")),
+    ("probleme", re.compile(rf"^probleme(?:\s*{NUMBER})?\s*(?=$|[:(\-])")),
+    ("situation", re.compile(rf"^situation\s+(?:d\s*['’]?\s*evaluation|complexe|probleme)(?:\s*{NUMBER})?\s*(?=$|[:(\-])")),
+)
+CORRECTION_MARKER = re.compile(
+    r"^(?:corriges?|correction|elements? de (?:correction|reponses?)|proposition de (?:corrige|correction)|solutions?)"
+    r"(?=\s*$|\s*[:(\-]|\s+(?:du|de|des|d['’]|maths|mathematiques|bepc|bac|type|sujet|epreuve|exercices?)\b)"
+)
+QUESTION = re.compile(r"^(\d{1,2})\s*[.)]\s*(?:([a-h])\s*[.)])?(?=\s|$)")
+SUB_QUESTION = re.compile(r"^([a-h])\s*[.)](?=\s|$)")
+LINE = re.compile(r"[^\n]+")
+LABELS = {"exercice": "Exercice", "probleme": "Problème", "situation": "Situation d'évaluation"}
+
+
+@dataclass
+class Segment:
+    kind: str
+    number: Optional[int]
+    section: str
+    paper: int
+    start: int
+    end: int
+    questions: List[str] = field(default_factory=list)
+
+    @property
+    def key(self) -> Tuple[str, Optional[int]]:
+        return self.kind, self.number
+
+    @property
+    def slug(self) -> str:
+        if self.kind == "preamble":
+            base = "intro"
+        elif self.kind == "corrige":
+            base = "corrige"
+        else:
+            base = f"{'ex' if self.kind == 'exercice' else self.kind}{self.number or ''}"
+            if self.section == "corrige":
+                base += "_corrige"
+        return f"p{self.paper + 1}_{base}" if self.paper else base
+
+    @property
+    def label(self) -> str:
+        if self.kind == "preamble":
+            label = "introduction"
+        elif self.kind == "corrige":
+            label = "corrigé"
+        else:
+            label = LABELS[self.kind] + (f" {self.number}" if self.number else "")
+            if self.section == "corrige":
+                label += " (corrigé)"
+        return f"sujet {self.paper + 1} - {label}" if self.paper else label
+
+
+def parse_number(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(value) if value.isdigit() else ROMAN.get(value)
+
+
+def classify_line(line: str) -> Optional[Tuple[str, Optional[int]]]:
+    folded = fold(line.strip())
+    for kind, pattern in HEADINGS:
+        match = pattern.match(folded)
+        if match:
+            number = parse_number(match.group(1))
+            if kind == "exercice" and number is None:
+                return None
+            return kind, number
+    if len(folded) <= 60 and "|" not in folded and CORRECTION_MARKER.match(folded):
+        return "marker", None
+    return None
+
+
+def find_questions(text: str) -> List[str]:
+    # Only numbering that follows on (1, 2, 2.a, 2.b, 3...) counts, so stray "3." values in formulas are skipped.
+    questions: List[str] = []
+    current = 0
+    letter = ""
+    for match in LINE.finditer(text):
+        line = match.group(0).strip()
+        question = QUESTION.match(line)
+        if question:
+            number = int(question.group(1))
+            sub = question.group(2) or ""
+            if number == current + 1:
+                current, letter = number, ""
+                questions.append(str(number))
+            if number == current and sub and sub == chr(ord(letter or "`") + 1):
+                letter = sub
+                questions.append(f"{number}.{sub}")
+            continue
+        sub_question = SUB_QUESTION.match(line)
+        if sub_question and current and sub_question.group(1) == chr(ord(letter or "`") + 1):
+            letter = sub_question.group(1)
+            questions.append(f"{current}.{letter}")
+    return questions
+
+
+def segment_annale(text: str) -> List[Segment]:
+    # Sujet exercises, then the corrigé; a correction heading only counts when numbering restarts after it.
+    events: List[Tuple[int, str, Optional[int]]] = []
+    for match in LINE.finditer(text):
+        found = classify_line(match.group(0))
+        if found:
+            events.append((match.start(), found[0], found[1]))
+    if not any(kind != "marker" for _, kind, _ in events):
+        return []
+
+    segments: List[Segment] = []
+    paper = 0
+    section = "sujet"
+    seen: Set[Tuple[str, Optional[int]]] = set()
+    marker: Optional[int] = None
+    for offset, kind, number in events:
+        if kind == "marker":
+            if not segments:
+                section = "corrige"
+            elif marker is None:
+                marker = offset
+            continue
+        key = (kind, number)
+        start = offset
+        if key in seen:
+            if marker is not None and section == "sujet":
+                section = "corrige"
+                start = marker
+            else:
+                paper += 1
+                section = "sujet" if marker is None else section
+            seen = set()
+        marker = None
+        seen.add(key)
+        segments.append(Segment(kind, number, section, paper, start, len(text)))
+    if marker is not None and section == "sujet":
+        segments.append(Segment("corrige", None, "corrige", paper, marker, len(text)))
+
+    if segments[0].start > 0 and text[: segments[0].start].strip():
+        segments.insert(0, Segment("preamble", None, segments[0].section, 0, 0, segments[0].start))
+    for segment, following in zip(segments, segments[1:]):
+        if segment.kind != "preamble":
+            segment.end = following.start
+    for segment in segments:
+        if segment.kind not in ("preamble", "corrige"):
+            segment.questions = find_questions(text[segment.start:segment.end])
+    # Headings extracted out of reading order leave bodies with nothing but the heading line.
+    return [segment for segment in segments if "\n" in text[segment.start:segment.end].strip()]
+
+
+def link_corrections(segments: List[Segment]) -> Dict[int, int]:
+    # Sujet exercise -> its correction, and per-exercise correction -> its exercise.
+    links: Dict[int, int] = {}
+    corrections: Dict[Tuple[int, Tuple[str, Optional[int]]], int] = {}
+    whole_paper: Dict[int, int] = {}
+    for index, segment in enumerate(segments):
+        if segment.kind == "corrige":
+            whole_paper[segment.paper] = index
+        elif segment.section == "corrige" and segment.kind != "preamble":
+            corrections[(segment.paper, segment.key)] = index
+    for index, segment in enumerate(segments):
+        if segment.section != "sujet" or segment.kind == "preamble":
+            continue
+        target = corrections.get((segment.paper, segment.key), whole_paper.get(segment.paper))
+        if target is not None:
+            links[index] = target
+            if segments[target].kind != "corrige":
+                links[target] = index
+    return links
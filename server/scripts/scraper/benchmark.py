@@ -0,0 +1,297 @@
+import argparse
+import contextlib
+import functools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# PyMuPDF prints its own messages (e.g. the fitz deprecation notice) to stdout, which holds the report.
+os.environ.setdefault("PYMUPDF_MESSAGE", "fd:2")
+
+import fitz  # noqa: E402
+
+from download_pdfs import download_all, download_file  # noqa: E402
+from extract_text import build_payload, extract_text  # noqa: E402
+from scrape_urls import collect_links, crawl_source_pages, fetch_html  # noqa: E402
+from structure_content import build_documents  # noqa: E402
+
+
+WORDS = (
+    "triangle rectangle hypotenuse theoreme pythagore thales calcul litteral equation inequation "
+    "fonction affine droite repere coordonnees vecteur cercle angle inscrit statistique moyenne "
+    "probabilite pyramide cone sphere volume aire perimetre racine carree puissance fraction"
+).split()
+
+
+def percentile(values: Sequence[float], rank: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(rank / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+class RssSampler:
+    # Resident memory while one stage runs, sampled from /proc/self/statm; ru_maxrss is the
+    # process-wide high-water mark, so after the heaviest stage it stops telling stages apart.
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.start: Optional[float] = None
+        self.peak: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self.start = current_rss_mb()
+        self.peak = self.start
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def report(self) -> Dict[str, Optional[float]]:
+        if self.start is None or self.peak is None:
+            return {"rssStartMb": None, "rssPeakMb": None, "rssGrowthMb": None}
+        return {
+            "rssStartMb": round(self.start, 1),
+            "rssPeakMb": round(self.peak, 1),
+            "rssGrowthMb": round(self.peak - self.start, 1),
+        }
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_corpus(root: Path, listings: int, items: int, pdfs: int, pages: int, seed: int = 7) -> Dict[str, int]:
+    rng = random.Random(seed)
+    (root / "listings").mkdir(parents=True, exist_ok=True)
+    (root / "docs").mkdir(parents=True, exist_ok=True)
+    (root / "files").mkdir(parents=True, exist_ok=True)
+
+    for listing in range(listings):
+        cards = []
+        for item in range(items):
+            number = (listing * items + item) % max(1, pdfs)
+            year = 2000 + (listing * items + item) % 25
+            cards.append(
+                f'<div class="card"><h3>Sujet BEPC maths {year} zone {item % 3 + 1}</h3>'
+                f'<p>{sentence(rng)}</p>'
+                f'<a href="/docs/bepc-maths-{listing}-{item}.html">Voir le sujet</a>'
+                f'<a href="/files/bepc-maths-{number}.pdf">Télécharger</a></div>'
+            )
+            (root / "docs" / f"bepc-maths-{listing}-{item}.html").write_text(
+                f"<html><head><title>Epreuve BEPC maths {year}</title></head><body>"
+                f'<a href="/files/bepc-maths-{number}.pdf">Télécharger</a></body></html>',
+                encoding="utf-8",
+            )
+        (root / "listings" / f"listing-{listing}.html").write_text(
+            "<html><body>" + "".join(cards) + "</body></html>", encoding="utf-8"
+        )
+
+    for number in range(pdfs):
+        doc = fitz.open()
+        for page_index in range(pages):
+            page = doc.new_page()
+            lines = [f"BEPC maths - sujet {number} - page {page_index + 1}", f"Exercice {page_index + 1}"]
+            lines.extend(sentence(rng) for _ in range(30))
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), "\n".join(lines), fontsize=9)
+        doc.save(root / "files" / f"bepc-maths-{number}.pdf")
+        doc.close()
+    return {"listings": listings, "itemsPerListing": items, "pdfs": pdfs, "pagesPerPdf": pages}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def serve(root: Path) -> Tuple[ThreadingHTTPServer, str]:
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def timed(items: Sequence[object], work: Callable[[object], object]) -> Iterator[Tuple[float, object]]:
+    for item in items:
+        started = time.perf_counter()
+        result = work(item)
+        yield time.perf_counter() - started, result
+
+
+def stage_report(
+    name: str, latencies: List[float], elapsed: float, units: float, unit: str, memory: RssSampler
+) -> Dict[str, object]:
+    return {
+        "stage": name,
+        "count": len(latencies),
+        "seconds": round(elapsed, 4),
+        "throughput": round(units / elapsed, 2) if elapsed else None,
+        "throughputUnit": f"{unit}/s",
+        "p50Ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 3),
+        **memory.report(),
+    }
+
+
+def run_benchmarks(root: Path, base_url: str, corpus: Dict[str, int], workers: int) -> List[Dict[str, object]]:
+    reports: List[Dict[str, object]] = []
+    listing_urls = [f"{base_url}/listings/listing-{index}.html" for index in range(corpus["listings"])]
+
+    started = time.perf_counter()
+    latencies: List[float] = []
+    link_count = 0
+    with RssSampler() as memory:
+        for latency, links in timed(
+            listing_urls, lambda url: collect_links(fetch_html(str(url)), str(url), "annale", "mathematiques")
+        ):
+            latencies.append(latency)
+            link_count += len(links)  # type: ignore[arg-type]
+    elapsed = time.perf_counter() - started
+    reports.append(stage_report("collect_links", latencies, elapsed, len(listing_urls), "listings", memory))
+    reports[-1]["links"] = link_count
+
+    started = time.perf_counter()
+    with RssSampler() as memory:
+        crawled = crawl_source_pages(
+            [("annale", url) for url in listing_urls], "mathematiques", concurrency=workers, per_host=workers, delay=0.0
+        )
+    elapsed = time.perf_counter() - started
+    reports.append(
+        {**stage_report("crawl_async", [elapsed], elapsed, len(listing_urls), "listings", memory), "links": len(crawled)}
+    )
+
+    download_root = root / "downloads"
+    download_root.mkdir(exist_ok=True)
+    pdf_urls = [f"{base_url}/files/bepc-maths-{number}.pdf" for number in range(corpus["pdfs"])]
+    started = time.perf_counter()
+    with RssSampler() as memory:
+        latencies = [
+            latency
+            for latency, _ in timed(
+                pdf_urls, lambda url: download_file(str(url), download_root / f"serial-{Path(str(url)).name}")
+            )
+        ]
+    serial_elapsed = time.perf_counter() - started
+    reports.append(stage_report("download_serial", latencies, serial_elapsed, len(pdf_urls), "files", memory))
+
+    jobs = [(url, download_root / f"parallel-{Path(url).name}", {}) for url in pdf_urls]
+    started = time.perf_counter()
+    with RssSampler() as memory:
+        download_all(jobs, workers=workers, per_host=workers)  # type: ignore[arg-type]
+    elapsed = time.perf_counter() - started
+    reports.append(stage_report("download_parallel", [elapsed], elapsed, len(pdf_urls), "files", memory))
+
+    pdf_paths = sorted(download_root.glob("parallel-*.pdf"))
+    started = time.perf_counter()
+    payloads: List[Dict[str, object]] = []
+    latencies = []
+    with RssSampler() as memory:
+        for path, (latency, text) in zip(pdf_paths, timed(pdf_paths, lambda path: extract_text(Path(str(path))))):
+            latencies.append(latency)
+            payloads.append(build_payload(path, Path("annales") / path.name, str(text)))
+    elapsed = time.perf_counter() - started
+    reports.append(
+        stage_report("extract_text", latencies, elapsed, len(pdf_paths) * corpus["pagesPerPdf"], "pages", memory)
+    )
+
+    started = time.perf_counter()
+    latencies = []
+    documents = 0
+    with RssSampler() as memory:
+        for latency, result in timed(payloads, lambda payload: build_documents(payload, "mathematiques", "document")):  # type: ignore[arg-type]
+            latencies.append(latency)
+            documents += len(result[0])  # type: ignore[index]
+    elapsed = time.perf_counter() - started
+    reports.append(stage_report("structure_content", latencies, elapsed, len(payloads), "files", memory))
+    reports[-1]["documents"] = documents
+    return reports
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the scraper pipeline on a synthetic local corpus")
+    parser.add_argument("--listings", type=int, default=5, help="Number of synthetic listing pages")
+    parser.add_argument("--items", type=int, default=100, help="Cards per listing page")
+    parser.add_argument("--pdfs", type=int, default=20, help="Number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per synthetic PDF")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrency for the parallel stages")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpus directory")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    root = Path(tempfile.mkdtemp(prefix="notria-bench-"))
+    server = None
+    try:
+        started = time.perf_counter()
+        corpus = generate_corpus(root / "site", args.listings, args.items, args.pdfs, args.pages)
+        generation_seconds = time.perf_counter() - started
+        server, base_url = serve(root / "site")
+        # The stages print progress; keep stdout for the JSON report.
+        with contextlib.redirect_stdout(sys.stderr):
+            stages = run_benchmarks(root, base_url, corpus, args.workers)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "generatedAt": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {**corpus, "generationSeconds": round(generation_seconds, 3)},
+        "stages": stages,
+        "peakRssMb": round(peak_rss_mb(), 1),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"Benchmark report written: {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
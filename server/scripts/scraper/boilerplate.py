@@ -0,0 +1,105 @@
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from annale_segments import classify_line
+
+
+# Bump when the cleaning rules change, so structured documents are rebuilt.
+BOILERPLATE_VERSION = "layout-1"
+BAND_BLOCKS = 2
+MIN_PAGE_SHARE = 0.5
+MAX_FURNITURE_LENGTH = 120
+LEGACY_MIN_COUNT = 8
+SPACES = re.compile(r"[ \t]+")
+WHITESPACE = re.compile(r"\s+")
+DIGITS = re.compile(r"\d+")
+
+Band = Tuple[int, int, str]
+
+
+def signature(line: str) -> str:
+    # "Page 3 / 12" and "Page 4 / 12" share a signature; so do running headers carrying a date or page.
+    return DIGITS.sub("#", WHITESPACE.sub(" ", line.strip().lower()))
+
+
+def band_blocks(pages: List[Dict[str, object]]) -> List[Tuple[int, Band]]:
+    # The top and bottom blocks of every page, by vertical position: where running headers and footers live.
+    bands: List[Tuple[int, Band]] = []
+    for page in pages:
+        blocks = sorted(page.get("blocks") or [], key=lambda block: (block["bbox"][1], block["bbox"][0]))  # type: ignore[index]
+        for index, block in enumerate(blocks):
+            if index < BAND_BLOCKS:
+                position = "top"
+            elif index >= len(blocks) - BAND_BLOCKS:
+                position = "bottom"
+            else:
+                continue
+            bands.append((int(page["page"]), (int(block["start"]), int(block["end"]), position)))  # type: ignore[call-overload]
+    return bands
+
+
+def page_furniture(content: str, pages: List[Dict[str, object]], bands: List[Tuple[int, Band]]) -> Set[Tuple[str, str]]:
+    # (position, signature) pairs found in the same band on enough distinct pages; the threshold
+    # scales with the page count, so a two-page paper with a running header is cleaned as well.
+    seen: Dict[Tuple[str, str], Set[int]] = {}
+    samples: Dict[Tuple[str, str], str] = {}
+    for page_number, (start, end, position) in bands:
+        for line in content[start:end].split("\n"):
+            stripped = line.strip()
+            if not stripped or len(stripped) > MAX_FURNITURE_LENGTH:
+                continue
+            key = (position, signature(stripped))
+            seen.setdefault(key, set()).add(page_number)
+            samples.setdefault(key, stripped)
+    threshold = max(2, math.ceil(MIN_PAGE_SHARE * len(pages)))
+    furniture: Set[Tuple[str, str]] = set()
+    for key, page_numbers in seen.items():
+        if len(page_numbers) < threshold:
+            continue
+        heading = classify_line(samples[key])
+        # An "Exercice 1" at the top of several pages is content, not furniture.
+        if heading is not None and heading[0] != "marker":
+            continue
+        furniture.add(key)
+    return furniture
+
+
+def repeated_lines(lines: List[str]) -> Set[str]:
+    freq: Dict[str, int] = {}
+    for line in lines:
+        freq[line] = freq.get(line, 0) + 1
+    return {line for line, count in freq.items() if count >= LEGACY_MIN_COUNT and len(line) <= MAX_FURNITURE_LENGTH}
+
+
+def clean_content(raw_content: str, pages: Optional[List[Dict[str, object]]] = None) -> Tuple[str, List[int]]:
+    # (paragraphs joined by blank lines, page of each paragraph); no pages without page layout.
+    if not pages:
+        lines = [line.strip() for line in raw_content.split("\n") if line.strip()]
+        repeated = repeated_lines(lines)
+        return "\n\n".join(SPACES.sub(" ", line).strip() for line in lines if line not in repeated), []
+
+    bands = band_blocks(pages)
+    furniture = page_furniture(raw_content, pages, bands)
+    intervals = sorted(band for _, band in bands if band[0] < band[1])
+    starts = [int(page["start"]) for page in pages]  # type: ignore[call-overload]
+    numbers = [int(page["page"]) for page in pages]  # type: ignore[call-overload]
+
+    kept: List[str] = []
+    line_pages: List[int] = []
+    page_index = 0
+    band_index = 0
+    offset = 0
+    for line in raw_content.split("\n"):
+        stripped = line.strip()
+        if stripped:
+            while page_index + 1 < len(starts) and starts[page_index + 1] <= offset:
+                page_index += 1
+            while band_index < len(intervals) and intervals[band_index][1] <= offset:
+                band_index += 1
+            in_band = band_index < len(intervals) and intervals[band_index][0] <= offset
+            if not (furniture and in_band and (intervals[band_index][2], signature(stripped)) in furniture):
+                kept.append(SPACES.sub(" ", stripped))
+                line_pages.append(numbers[page_index])
+        offset += len(line) + 1
+    return "\n\n".join(kept), line_pages
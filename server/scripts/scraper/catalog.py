@@ -0,0 +1,389 @@
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from corpus import iter_structured
+from manifest import sha256_text
+
+
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    source_type TEXT,
+    title TEXT,
+    digest TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (url, subject)
+);
+CREATE INDEX IF NOT EXISTS urls_subject ON urls (subject, source_type);
+CREATE INDEX IF NOT EXISTS urls_updated ON urls (updated_at);
+CREATE TABLE IF NOT EXISTS downloads (
+    url TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    source_type TEXT,
+    file TEXT,
+    status TEXT NOT NULL,
+    reason TEXT,
+    validation TEXT,
+    pages INTEGER,
+    bytes INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (url, subject)
+);
+CREATE INDEX IF NOT EXISTS downloads_status ON downloads (subject, status);
+CREATE INDEX IF NOT EXISTS downloads_updated ON downloads (updated_at);
+CREATE TABLE IF NOT EXISTS extracted (
+    key TEXT PRIMARY KEY,
+    subject TEXT,
+    pdf_file TEXT,
+    relative_path TEXT,
+    is_scanned INTEGER NOT NULL,
+    error TEXT,
+    pages INTEGER,
+    chars INTEGER,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extracted_subject ON extracted (subject, is_scanned);
+CREATE INDEX IF NOT EXISTS extracted_updated ON extracted (updated_at);
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    source_type TEXT,
+    chapter TEXT,
+    year INTEGER,
+    zone TEXT,
+    title TEXT,
+    pdf_file TEXT,
+    token_count INTEGER,
+    page_start INTEGER,
+    page_end INTEGER,
+    metadata TEXT NOT NULL,
+    content TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    removed_at REAL
+);
+CREATE INDEX IF NOT EXISTS documents_subject ON documents (subject, source_type);
+CREATE INDEX IF NOT EXISTS documents_chapter ON documents (chapter);
+CREATE INDEX IF NOT EXISTS documents_year_zone ON documents (year, zone);
+CREATE INDEX IF NOT EXISTS documents_updated ON documents (updated_at);
+"""
+
+# Rows are only rewritten, and updated_at only moves, when their digest changes, so
+# "changed since" queries do not see files a stage merely re-visited.
+UPSERTS = {
+    "urls": (
+        "url, subject, source_type, title, digest, first_seen, last_seen, updated_at",
+        "(url, subject)",
+        "source_type = excluded.source_type, title = excluded.title, digest = excluded.digest, "
+        "last_seen = excluded.last_seen, "
+        "updated_at = CASE WHEN urls.digest != excluded.digest THEN excluded.updated_at ELSE urls.updated_at END",
+    ),
+    "downloads": (
+        "url, subject, source_type, file, status, reason, validation, pages, bytes, etag, last_modified, digest, updated_at",
+        "(url, subject)",
+        "source_type = excluded.source_type, file = excluded.file, status = excluded.status, "
+        "reason = excluded.reason, validation = excluded.validation, pages = excluded.pages, bytes = excluded.bytes, etag = excluded.etag, "
+        "last_modified = excluded.last_modified, digest = excluded.digest, updated_at = excluded.updated_at",
+    ),
+    "extracted": (
+        "key, subject, pdf_file, relative_path, is_scanned, error, pages, chars, digest, updated_at",
+        "(key)",
+        "subject = excluded.subject, pdf_file = excluded.pdf_file, relative_path = excluded.relative_path, "
+        "is_scanned = excluded.is_scanned, error = excluded.error, pages = excluded.pages, chars = excluded.chars, "
+        "digest = excluded.digest, updated_at = excluded.updated_at",
+    ),
+    "documents": (
+        "id, subject, source_type, chapter, year, zone, title, pdf_file, token_count, page_start, page_end, "
+        "metadata, content, digest, updated_at, removed_at",
+        "(id)",
+        "subject = excluded.subject, source_type = excluded.source_type, chapter = excluded.chapter, "
+        "year = excluded.year, zone = excluded.zone, title = excluded.title, pdf_file = excluded.pdf_file, "
+        "token_count = excluded.token_count, page_start = excluded.page_start, page_end = excluded.page_end, "
+        "metadata = excluded.metadata, content = excluded.content, digest = excluded.digest, "
+        "updated_at = excluded.updated_at, removed_at = NULL",
+    ),
+}
+# urls keep moving last_seen on every crawl; the other tables are left untouched when nothing changed.
+CHANGED = {
+    "urls": "",
+    "downloads": " WHERE downloads.digest != excluded.digest",
+    "extracted": " WHERE extracted.digest != excluded.digest",
+    "documents": " WHERE documents.digest != excluded.digest OR documents.removed_at IS NOT NULL",
+}
+QUERY_FIELDS = ("subject", "source_type", "chapter", "year", "zone")
+
+
+def default_catalog_path(server_root: Path) -> Path:
+    return server_root / "data" / "catalog.sqlite3"
+
+
+def row_digest(values: Sequence[object]) -> str:
+    return sha256_text(json.dumps(list(values), ensure_ascii=False, sort_keys=True, default=str))
+
+
+class Catalog:
+    def __init__(self, path: Path, root: Path, batch_size: int = BATCH_SIZE) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Paths are stored relative to the server root, like the manifest keys of each stage.
+        self.root = root
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.pending: Dict[str, List[Tuple[object, ...]]] = {table: [] for table in UPSERTS}
+        self.removed: List[str] = []
+        # Download threads in pipeline.py add rows while the main thread structures documents.
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def relative(self, path: Path) -> str:
+        try:
+            return path.resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _add(self, table: str, row: Tuple[object, ...]) -> None:
+        with self.lock:
+            self.pending[table].append(row)
+            full = len(self.pending[table]) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending = {table: rows for table, rows in self.pending.items() if rows}
+            removed = self.removed
+            self.pending = {table: [] for table in UPSERTS}
+            self.removed = []
+            if not pending and not removed:
+                return
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for table, rows in pending.items():
+                    columns, conflict, updates = UPSERTS[table]
+                    placeholders = ", ".join("?" for _ in columns.split(","))
+                    self.conn.executemany(
+                        f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+                        f"ON CONFLICT {conflict} DO UPDATE SET {updates}{CHANGED[table]}",
+                        rows,
+                    )
+                if removed:
+                    now = time.time()
+                    self.conn.executemany(
+                        "UPDATE documents SET removed_at = ?, updated_at = ? WHERE id = ? AND removed_at IS NULL",
+                        [(now, now, document_id) for document_id in removed],
+                    )
+
+    def add_urls(self, subject: str, links: Iterable[Dict[str, str]]) -> None:
+        now = time.time()
+        for link in links:
+            values = (link.get("sourceType"), link.get("title"))
+            self._add("urls", (link["url"], subject, *values, row_digest(values), now, now, now))
+
+    def add_download(
+        self,
+        subject: str,
+        item: Dict[str, object],
+        size: Optional[int] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        values = (
+            item.get("sourceType"),
+            item.get("file") or None,
+            item["status"],
+            item.get("reason"),
+            item.get("validation"),
+            item.get("pages"),
+            size,
+            etag,
+            last_modified,
+        )
+        self._add("downloads", (item["url"], subject, *values, row_digest(values), time.time()))
+
+    def add_extracted(self, output_path: Path, payload: Dict[str, object]) -> None:
+        key = self.relative(output_path)
+        parts = key.split("/")
+        content = payload.get("content")
+        pages = payload.get("pages")
+        values = (
+            parts[2] if len(parts) > 3 and parts[:2] == ["data", "extracted"] else None,
+            payload.get("pdfFile"),
+            payload.get("relativePath"),
+            1 if payload.get("isScanned") else 0,
+            payload.get("error"),
+            len(pages) if isinstance(pages, list) else None,
+            len(content) if isinstance(content, str) else None,
+        )
+        digest = row_digest(values + ((sha256_text(content) if isinstance(content, str) else None),))
+        self._add("extracted", (key, *values, digest, time.time()))
+
+    def add_documents(self, documents: Iterable[Tuple[str, Dict[str, object]]]) -> None:
+        now = time.time()
+        for document_id, document in documents:
+            metadata = dict(document.get("metadata") or {})  # type: ignore[arg-type]
+            content = str(document.get("content", ""))
+            values = (
+                document_id.split("/", 1)[0],
+                document.get("sourceType"),
+                document.get("chapter"),
+                metadata.get("year"),
+                metadata.get("zone"),
+                document.get("title"),
+                metadata.get("pdfFile"),
+                metadata.get("tokenCount"),
+                metadata.get("pageStart"),
+                metadata.get("pageEnd"),
+                json.dumps(metadata, ensure_ascii=False, sort_keys=True),
+                content,
+            )
+            self._add("documents", (document_id, *values, row_digest(values), now, None))
+
+    def remove_documents(self, document_ids: Iterable[str]) -> None:
+        with self.lock:
+            self.removed.extend(document_ids)
+
+    def find_documents(
+        self,
+        changed_since: Optional[float] = None,
+        include_removed: bool = False,
+        limit: Optional[int] = None,
+        **filters: object,
+    ) -> List[Dict[str, object]]:
+        self.flush()
+        clauses = [f"{field} = ?" for field in QUERY_FIELDS if filters.get(field) is not None]
+        params: List[object] = [filters[field] for field in QUERY_FIELDS if filters.get(field) is not None]
+        if changed_since is not None:
+            clauses.append("updated_at >= ?")
+            params.append(changed_since)
+        if not include_removed:
+            clauses.append("removed_at IS NULL")
+        sql = (
+            "SELECT id, subject, source_type, chapter, year, zone, title, token_count, updated_at, removed_at "
+            "FROM documents" + (f" WHERE {' AND '.join(clauses)}" if clauses else "") + " ORDER BY updated_at DESC, id"
+        )
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        columns = ("id", "subject", "sourceType", "chapter", "year", "zone", "title", "tokenCount", "updatedAt", "removedAt")
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql, params)]
+
+    def changes_since(self, since: float) -> Dict[str, int]:
+        self.flush()
+        return {
+            table: int(self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE updated_at >= ?", (since,)).fetchone()[0])
+            for table in UPSERTS
+        }
+
+
+def add_catalog_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--catalog", default=None, help="SQLite catalog path (default: data/catalog.sqlite3)")
+    parser.add_argument("--no-catalog", action="store_true", help="Do not record this run in the SQLite catalog")
+
+
+def open_catalog(args: argparse.Namespace, server_root: Path) -> Optional[Catalog]:
+    if args.no_catalog:
+        return None
+    return Catalog(Path(args.catalog) if args.catalog else default_catalog_path(server_root), server_root)
+
+
+def parse_since(value: str) -> float:
+    # "36h", "2d", "90m" relative to now, or an ISO date/time such as 2026-10-16 or 2026-10-16T08:00.
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value.strip())
+    if match:
+        return time.time() - float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return datetime.fromisoformat(value.strip()).timestamp()
+
+
+def import_existing(catalog: Catalog, script_dir: Path, server_root: Path) -> Dict[str, int]:
+    # Backfill from the JSON files the stages already wrote, e.g. before the first cataloged run.
+    counts = {"urls": 0, "downloads": 0, "documents": 0}
+    for urls_path in sorted(script_dir.glob("urls_*.json")):
+        links = json.loads(urls_path.read_text(encoding="utf-8"))
+        catalog.add_urls(urls_path.stem[len("urls_"):], links)
+        counts["urls"] += len(links)
+    for report_path in sorted(script_dir.glob("download_report_*.json")):
+        subject = report_path.stem[len("download_report_"):]
+        for item in json.loads(report_path.read_text(encoding="utf-8")).get("items", []):
+            catalog.add_download(subject, item)
+            counts["downloads"] += 1
+    raw_root = server_root / "data" / "raw"
+    if raw_root.exists():
+        for document_id, _, load_document in iter_structured(raw_root):
+            catalog.add_documents([(document_id, load_document())])
+            counts["documents"] += 1
+    catalog.flush()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query the SQLite catalog of crawled, downloaded and structured documents")
+    parser.add_argument("--catalog", default=None, help="SQLite catalog path (default: data/catalog.sqlite3)")
+    parser.add_argument("--import", dest="import_existing", action="store_true", help="Backfill from existing JSON outputs")
+    parser.add_argument("--subject", default=None, help="Only documents of this subject slug")
+    parser.add_argument("--source-type", default=None, help="Only documents of this source type (cours, exercice, annale, livre)")
+    parser.add_argument("--chapter", default=None, help="Only documents of this chapter")
+    parser.add_argument("--year", type=int, default=None, help="Only documents of this year")
+    parser.add_argument("--zone", default=None, help="Only documents of this zone")
+    parser.add_argument("--changed-since", default=None, help="Only rows changed since e.g. 24h, 2d or 2026-10-16")
+    parser.add_argument("--include-removed", action="store_true", help="Also list documents removed as stale")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum documents printed (0 for all)")
+    args = parser.parse_args()
+
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    catalog = Catalog(Path(args.catalog) if args.catalog else default_catalog_path(server_root), server_root)
+    if args.import_existing:
+        counts = import_existing(catalog, script_dir, server_root)
+        print("Imported " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+
+    since = parse_since(args.changed_since) if args.changed_since else None
+    if since is not None:
+        print("Changed rows: " + ", ".join(f"{table}={count}" for table, count in catalog.changes_since(since).items()))
+    started = time.perf_counter()
+    rows = catalog.find_documents(
+        changed_since=since,
+        include_removed=args.include_removed,
+        limit=args.limit or None,
+        subject=args.subject,
+        source_type=args.source_type,
+        chapter=args.chapter,
+        year=args.year,
+        zone=args.zone,
+    )
+    elapsed = time.perf_counter() - started
+    for row in rows:
+        removed = " (removed)" if row["removedAt"] else ""
+        print(f"{row['id']}  {row['sourceType']}  year={row['year']} zone={row['zone']}  {row['title']}{removed}")
+    print(f"{len(rows)} documents in {elapsed * 1000:.1f}ms")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
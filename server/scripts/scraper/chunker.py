@@ -0,0 +1,215 @@
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+EXERCISE_BOUNDARY = re.compile(
+    r"^(?:exercice|exercise|probl[eè]me|partie|situation d'[ée]valuation)\s*(?:n[°o]\s*)?[0-9ivx]+\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+|\n")
+WORD = re.compile(r"\S+")
+APPROX_PIECE = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]+|_+")
+CACHE_MAX_CHARS = 4096
+
+
+def approx_encode(text: str) -> Tuple[str, ...]:
+    pieces: List[str] = []
+    for match in APPROX_PIECE.finditer(text):
+        piece = match.group(0)
+        if len(piece) <= 4 or not piece[0].isalpha():
+            pieces.append(piece)
+            continue
+        # Long words become several sub-word pieces, roughly like BPE vocabularies do for French.
+        width = math.ceil(len(piece) / math.ceil(len(piece) / 4))
+        pieces.extend(piece[index:index + width] for index in range(0, len(piece), width))
+    return tuple(pieces)
+
+
+def whitespace_encode(text: str) -> Tuple[str, ...]:
+    return tuple(text.split())
+
+
+def _tiktoken_encoder(name: str) -> Callable[[str], Tuple[int, ...]]:
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(name or "cl100k_base")
+    return lambda text: tuple(encoding.encode(text, disallowed_special=()))
+
+
+def _hf_encoder(path: str) -> Callable[[str], Tuple[int, ...]]:
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(path)
+    return lambda text: tuple(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+TOKENIZER_FACTORIES: Dict[str, Callable[[str], Callable[[str], tuple]]] = {
+    "approx": lambda _: approx_encode,
+    "whitespace": lambda _: whitespace_encode,
+    "tiktoken": _tiktoken_encoder,
+    "hf": _hf_encoder,
+}
+
+
+class Tokenizer:
+    def __init__(self, spec: str = "approx", cache_size: int = 16384) -> None:
+        kind, _, option = spec.partition(":")
+        if kind not in TOKENIZER_FACTORIES:
+            raise ValueError(f"unknown tokenizer: {spec} (expected one of {', '.join(TOKENIZER_FACTORIES)})")
+        self.spec = spec
+        self._encode = TOKENIZER_FACTORIES[kind](option)
+        self._cached_encode = lru_cache(maxsize=cache_size)(self._encode)
+
+    def encode(self, text: str) -> tuple:
+        if len(text) > CACHE_MAX_CHARS:
+            return self._encode(text)
+        return self._cached_encode(text)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+
+_TOKENIZERS: Dict[str, Tokenizer] = {}
+
+
+def get_tokenizer(spec: str = "approx") -> Tokenizer:
+    tokenizer = _TOKENIZERS.get(spec)
+    if tokenizer is None:
+        tokenizer = Tokenizer(spec)
+        _TOKENIZERS[spec] = tokenizer
+    return tokenizer
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    token_count: int
+
+
+Span = Tuple[int, int]
+
+
+def _split_spans(text: str, start: int, end: int, boundary: "re.Pattern[str]") -> List[Span]:
+    spans: List[Span] = []
+    cursor = start
+    for match in boundary.finditer(text, start, end):
+        if match.start() > cursor:
+            spans.append((cursor, match.start()))
+        cursor = max(cursor, match.end())
+    if cursor < end:
+        spans.append((cursor, end))
+    return [(left, right) for left, right in spans if text[left:right].strip()]
+
+
+def _split_at_starts(text: str, start: int, end: int, boundary: "re.Pattern[str]") -> List[Span]:
+    cuts = [match.start() for match in boundary.finditer(text, start, end) if match.start() > start]
+    edges = [start] + cuts + [end]
+    return [(left, right) for left, right in zip(edges, edges[1:]) if text[left:right].strip()]
+
+
+@dataclass
+class Chunker:
+    tokenizer_spec: str = "approx"
+    overlap_tokens: int = 0
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        return get_tokenizer(self.tokenizer_spec)
+
+    def count(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def _units(self, text: str, span: Span, max_tokens: int, level: int = 0) -> List[Span]:
+        left, right = span
+        if self.count(text[left:right]) <= max_tokens:
+            return [span]
+        splitters = [
+            lambda: _split_at_starts(text, left, right, EXERCISE_BOUNDARY),
+            lambda: _split_spans(text, left, right, PARAGRAPH_BOUNDARY),
+            lambda: _split_spans(text, left, right, SENTENCE_BOUNDARY),
+        ]
+        for depth in range(level, len(splitters)):
+            parts = splitters[depth]()
+            if len(parts) > 1:
+                units: List[Span] = []
+                for part in parts:
+                    units.extend(self._units(text, part, max_tokens, depth + 1))
+                return units
+        return self._word_windows(text, span, max_tokens)
+
+    def _word_windows(self, text: str, span: Span, max_tokens: int) -> List[Span]:
+        words = [(match.start(), match.end()) for match in WORD.finditer(text, span[0], span[1])]
+        windows: List[Span] = []
+        index = 0
+        while index < len(words):
+            stop = index + 1
+            used = self.count(text[words[index][0]:words[index][1]])
+            while stop < len(words):
+                cost = self.count(text[words[stop][0]:words[stop][1]])
+                if used + cost > max_tokens:
+                    break
+                used += cost
+                stop += 1
+            while stop - index > 1 and self.count(text[words[index][0]:words[stop - 1][1]]) > max_tokens:
+                stop -= 1
+            windows.append((words[index][0], words[stop - 1][1]))
+            index = stop
+        return windows
+
+    def chunk(self, text: str, max_tokens: int) -> List[Chunk]:
+        if not text.strip():
+            return []
+        max_tokens = max(1, max_tokens)
+        overlap = min(max(0, self.overlap_tokens), max_tokens // 2)
+        units = self._units(text, (0, len(text)), max_tokens)
+        costs = [self.count(text[left:right]) for left, right in units]
+
+        chunks: List[Chunk] = []
+        first = 0
+        # First unit the next chunk must include, so it never only repeats the previous chunk's tail.
+        fresh = 0
+        while first < len(units):
+            last = first
+            used = costs[first]
+            while last + 1 < len(units) and used + costs[last + 1] <= max_tokens:
+                last += 1
+                used += costs[last]
+            while last > first and self.count(text[units[first][0]:units[last][1]]) > max_tokens:
+                last -= 1
+            if last < fresh:
+                # The carried overlap left no room for a new unit: start this chunk without it.
+                first = fresh
+                continue
+            start, end = units[first][0], units[last][1]
+            chunks.append(Chunk(text=text[start:end], start=start, end=end, token_count=self.count(text[start:end])))
+            if last + 1 >= len(units):
+                break
+            fresh = last + 1
+            next_first = fresh
+            carried = 0
+            while (
+                overlap
+                and next_first - 1 > first
+                and carried + costs[next_first - 1] <= overlap
+                and carried + costs[next_first - 1] + costs[fresh] <= max_tokens
+            ):
+                carried += costs[next_first - 1]
+                next_first -= 1
+            first = next_first
+        return chunks
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int,
+    tokenizer_spec: str = "approx",
+    overlap_tokens: int = 0,
+    chunker: Optional[Chunker] = None,
+) -> List[Chunk]:
+    return (chunker or Chunker(tokenizer_spec, overlap_tokens)).chunk(text, max_tokens)
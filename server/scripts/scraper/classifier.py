@@ -0,0 +1,71 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, Iterable, Pattern, Set, Tuple
+
+
+Tag = Hashable
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: Dict[str, dict]) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+
+class Scan:
+    __slots__ = ("keywords", "tags", "_by_tag")
+
+    def __init__(self, keywords: FrozenSet[str], by_tag: Dict[Tag, FrozenSet[str]]) -> None:
+        self.keywords = keywords
+        self._by_tag = by_tag
+        self.tags = frozenset(by_tag)
+
+    def has(self, tag: Tag) -> bool:
+        return tag in self._by_tag
+
+    def hits(self, tag: Tag) -> FrozenSet[str]:
+        return self._by_tag.get(tag, frozenset())
+
+
+class KeywordMatcher:
+    def __init__(self, tagged_keywords: Iterable[Tuple[str, Tag]], cache_size: int = 65536) -> None:
+        self.tags_by_keyword: Dict[str, Set[Tag]] = {}
+        for keyword, tag in tagged_keywords:
+            keyword = keyword.lower()
+            if keyword:
+                self.tags_by_keyword.setdefault(keyword, set()).add(tag)
+        keywords = sorted(self.tags_by_keyword)
+        # Lookahead keeps matches zero-width, so overlapping keywords are all seen in one pass;
+        # the trie-shaped pattern yields the longest keyword at each position.
+        self.pattern: Pattern[str] = re.compile("(?=(" + _trie_pattern(keywords) + "))") if keywords else re.compile("(?!)")
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(other for other in keywords if keyword.startswith(other)) for keyword in keywords
+        }
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def _scan(self, text: str) -> Scan:
+        found: Set[str] = set()
+        for match in self.pattern.finditer(text.lower()):
+            longest = match.group(1)
+            if longest:
+                found.update(self._prefixes[longest])
+        by_tag: Dict[Tag, Set[str]] = {}
+        for keyword in found:
+            for tag in self.tags_by_keyword[keyword]:
+                by_tag.setdefault(tag, set()).add(keyword)
+        return Scan(frozenset(found), {tag: frozenset(hits) for tag, hits in by_tag.items()})
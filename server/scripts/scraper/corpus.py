@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from jsonl_store import INDEX_NAME, ShardedJsonlReader
+from manifest import Manifest, sha256_bytes
+
+
+SIDECAR_NAMES = {"duplicates.json", "manifest.json"}
+
+
+def iter_extracted(
+    extracted_root: Path, server_root: Path, manifest: Manifest
+) -> Iterator[Tuple[str, Dict[str, str], Callable[[], Dict[str, object]], str]]:
+    for extracted_file in extracted_root.rglob("*.json"):
+        if extracted_file.name in SIDECAR_NAMES:
+            continue
+        yield (
+            extracted_file.relative_to(server_root).as_posix(),
+            {"extracted": manifest.file_digest(extracted_file)},
+            lambda path=extracted_file: json.loads(path.read_text(encoding="utf-8")),
+            extracted_file.stem,
+        )
+
+    for index_path in extracted_root.rglob(INDEX_NAME):
+        reader = ShardedJsonlReader(index_path.parent)
+        store_key = index_path.parent.relative_to(server_root).as_posix()
+        for record_key in sorted(reader.index):
+            yield (
+                f"{store_key}#{record_key}",
+                {"extracted": sha256_bytes(reader.read_raw(record_key))},
+                lambda record_key=record_key, reader=reader: reader.get(record_key),
+                Path(record_key).stem,
+            )
+
+
+def iter_structured(raw_root: Path, subject_slug: Optional[str] = None) -> Iterator[Tuple[str, Path, Callable[[], Dict[str, object]]]]:
+    # Document ids are the paths structure_content.py writes, e.g. mathematiques/annales/thales.json.
+    # The path is the file holding the document (the shard index for jsonl stores).
+    json_root = raw_root / subject_slug if subject_slug else raw_root
+    for document_file in sorted(json_root.rglob("*.json")):
+        relative = document_file.relative_to(raw_root)
+        if relative.parts[0] == "jsonl" or document_file.name in SIDECAR_NAMES:
+            continue
+        yield (
+            relative.as_posix(),
+            document_file,
+            lambda path=document_file: json.loads(path.read_text(encoding="utf-8")),
+        )
+
+    jsonl_root = raw_root / "jsonl"
+    for index_path in sorted(jsonl_root.glob(f"{subject_slug or '*'}/{INDEX_NAME}")):
+        reader = ShardedJsonlReader(index_path.parent)
+        for record_key in sorted(reader.index):
+            yield record_key, index_path, lambda record_key=record_key, reader=reader: reader.get(record_key)
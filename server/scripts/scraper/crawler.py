@@ -0,0 +1,124 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from http_client import host_of
+
+
+CrawlTask = Tuple[str, Hashable]
+FetchFn = Callable[[str], Any]
+HandleFn = Callable[[str, Any, Hashable], Iterable[CrawlTask]]
+ErrorFn = Callable[[str, Hashable, Exception], None]
+
+
+class HostLimiter:
+    def __init__(self, per_host: int = 2, delay: float = 0.0) -> None:
+        self.per_host = max(1, per_host)
+        self.delay = max(0.0, delay)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+    async def acquire(self, host: str) -> None:
+        await self._semaphore(host).acquire()
+        if not self.delay:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self, host: str) -> None:
+        self._semaphore(host).release()
+
+
+class Frontier:
+    def __init__(self, fetch: FetchFn, executor: ThreadPoolExecutor, limiter: HostLimiter) -> None:
+        self.fetch = fetch
+        self.executor = executor
+        self.limiter = limiter
+        self.queue: "asyncio.Queue[CrawlTask]" = asyncio.Queue()
+        self.fetched: Dict[str, "asyncio.Future[Any]"] = {}
+        self.scheduled: Set[CrawlTask] = set()
+        self.stats = {"tasks": 0, "fetches": 0, "shared_fetches": 0}
+
+    def add(self, url: str, context: Hashable) -> None:
+        task = (url, context)
+        if task in self.scheduled:
+            return
+        self.scheduled.add(task)
+        self.stats["tasks"] += 1
+        self.queue.put_nowait(task)
+
+    async def fetch_once(self, url: str) -> Any:
+        future = self.fetched.get(url)
+        if future is not None:
+            self.stats["shared_fetches"] += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.fetched[url] = future
+        host = host_of(url)
+        await self.limiter.acquire(host)
+        try:
+            self.stats["fetches"] += 1
+            page = await loop.run_in_executor(self.executor, self.fetch, url)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else awaits this url.
+            future.exception()
+            raise
+        finally:
+            self.limiter.release(host)
+        future.set_result(page)
+        return page
+
+
+async def _worker(frontier: Frontier, handle: HandleFn, on_error: Optional[ErrorFn]) -> None:
+    while True:
+        url, context = await frontier.queue.get()
+        try:
+            page = await frontier.fetch_once(url)
+            for child_url, child_context in handle(url, page, context):
+                frontier.add(child_url, child_context)
+        except Exception as exc:
+            if on_error is not None:
+                on_error(url, context, exc)
+        finally:
+            frontier.queue.task_done()
+
+
+async def crawl_async(
+    seeds: Iterable[CrawlTask],
+    fetch: FetchFn,
+    handle: HandleFn,
+    on_error: Optional[ErrorFn] = None,
+    concurrency: int = 8,
+    per_host: int = 2,
+    delay: float = 0.0,
+) -> Dict[str, int]:
+    concurrency = max(1, concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        frontier = Frontier(fetch, executor, HostLimiter(per_host, delay))
+        for url, context in seeds:
+            frontier.add(url, context)
+        workers = [asyncio.create_task(_worker(frontier, handle, on_error)) for _ in range(concurrency)]
+        try:
+            await frontier.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    return dict(frontier.stats)
+
+
+def crawl(seeds: Iterable[CrawlTask], fetch: FetchFn, handle: HandleFn, **options: Any) -> Dict[str, int]:
+    return asyncio.run(crawl_async(seeds, fetch, handle, **options))
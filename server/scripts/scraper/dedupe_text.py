@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from corpus import iter_extracted
+from manifest import Manifest, default_manifest_path
+
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+DUPLICATES_NAME = "duplicates.json"
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_words(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return WORD.findall(folded)
+
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    words = normalize_words(text)
+    if len(words) < size:
+        words = words + [""] * (size - len(words)) if words else []
+    hashed: Set[int] = set()
+    for index in range(0, max(0, len(words) - size + 1)):
+        gram = " ".join(words[index:index + size]).encode("utf-8")
+        hashed.add(int.from_bytes(hashlib.blake2b(gram, digest_size=4).digest(), "little"))
+    return hashed
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, seed: int = 1) -> None:
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, shingle_set: Iterable[int]) -> Tuple[int, ...]:
+        values = list(shingle_set)
+        if not values:
+            return tuple([MAX_HASH] * self.num_perm)
+        return tuple(
+            min(((a * value + b) % MERSENNE_PRIME) & MAX_HASH for value in values) for a, b in self.params
+        )
+
+
+def estimate_similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    same = sum(1 for a, b in zip(left, right) if a == b)
+    return same / len(left) if left else 0.0
+
+
+class LshIndex:
+    def __init__(self, bands: int = 16, rows: int = 8) -> None:
+        self.bands = bands
+        self.rows = rows
+        self.buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def add(self, key: str, signature: Tuple[int, ...]) -> None:
+        self.signatures[key] = signature
+        for band in range(self.bands):
+            start = band * self.rows
+            self.buckets[band].setdefault(signature[start:start + self.rows], []).append(key)
+
+    def candidate_pairs(self) -> Set[Tuple[str, str]]:
+        pairs: Set[Tuple[str, str]] = set()
+        for buckets in self.buckets:
+            for keys in buckets.values():
+                if len(keys) < 2:
+                    continue
+                for index, left in enumerate(keys):
+                    for right in keys[index + 1:]:
+                        pairs.add((left, right) if left < right else (right, left))
+        return pairs
+
+
+def find_clusters(
+    documents: Dict[str, str],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 16,
+) -> List[Dict[str, object]]:
+    rows = max(1, num_perm // bands)
+    hasher = MinHasher(num_perm=bands * rows)
+    index = LshIndex(bands=bands, rows=rows)
+    for key, text in documents.items():
+        index.add(key, hasher.signature(shingles(text)))
+
+    parent: Dict[str, str] = {key: key for key in documents}
+
+    def root(key: str) -> str:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    similarities: Dict[Tuple[str, str], float] = {}
+    for left, right in index.candidate_pairs():
+        similarity = estimate_similarity(index.signatures[left], index.signatures[right])
+        if similarity >= threshold:
+            similarities[(left, right)] = similarity
+            parent[root(left)] = root(right)
+
+    groups: Dict[str, List[str]] = {}
+    for key in documents:
+        groups.setdefault(root(key), []).append(key)
+
+    clusters: List[Dict[str, object]] = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        canonical = min(members, key=lambda key: (-len(documents[key]), key))
+        duplicates = []
+        for key in sorted(members):
+            if key == canonical:
+                continue
+            pair = (key, canonical) if key < canonical else (canonical, key)
+            similarity = similarities.get(pair)
+            if similarity is None:
+                similarity = estimate_similarity(index.signatures[key], index.signatures[canonical])
+            duplicates.append({"key": key, "similarity": round(similarity, 3)})
+        clusters.append({"canonical": canonical, "duplicates": duplicates})
+    clusters.sort(key=lambda cluster: str(cluster["canonical"]))
+    return clusters
+
+
+def load_duplicate_map(server_root: Path, subject_slug: Optional[str] = None) -> Dict[str, str]:
+    # duplicates.json sits in the folder dedupe_text.py compared: data/extracted for a run over every
+    # subject, data/extracted/<subject> for one subject. Each document follows the newest file covering it.
+    extracted_root = server_root / "data" / "extracted"
+    if not extracted_root.exists():
+        return {}
+    if subject_slug:
+        subjects = [subject_slug]
+    else:
+        subjects = sorted(path.name for path in extracted_root.iterdir() if path.is_dir())
+    paths = [extracted_root / DUPLICATES_NAME] + [extracted_root / subject / DUPLICATES_NAME for subject in subjects]
+    mapping: Dict[str, str] = {}
+    for path in sorted((path for path in paths if path.exists()), key=lambda path: path.stat().st_mtime):
+        scope = path.parent.relative_to(server_root).as_posix() + "/"
+        mapping = {key: canonical for key, canonical in mapping.items() if not key.startswith(scope)}
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        for cluster in payload.get("clusters", []):
+            for duplicate in cluster.get("duplicates", []):
+                mapping[duplicate["key"]] = cluster["canonical"]
+    return mapping
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate extracted documents")
+    parser.add_argument(
+        "--subject",
+        default=None,
+        help="Optional subject slug. If set, only compares data/extracted/<subject>.",
+    )
+    parser.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated Jaccard similarity")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash permutations")
+    parser.add_argument("--bands", type=int, default=16, help="LSH bands (rows per band = num-perm / bands)")
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    subject_slug: Optional[str] = re.sub(r"[^a-z0-9-]+", "-", args.subject.lower()).strip("-") if args.subject else None
+    extracted_root = server_root / "data" / "extracted"
+    if subject_slug:
+        extracted_root = extracted_root / subject_slug
+
+    if not extracted_root.exists():
+        raise FileNotFoundError("Missing server/data/extracted. Run extract_text.py first.")
+
+    manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+    documents: Dict[str, str] = {}
+    for key, _, load_payload, _ in iter_extracted(extracted_root, server_root, manifest):
+        payload = load_payload()
+        content = str(payload.get("content", ""))
+        if payload.get("isScanned") or not content.strip():
+            continue
+        documents[key] = content
+    manifest.save()
+
+    clusters = find_clusters(documents, threshold=args.threshold, num_perm=args.num_perm, bands=args.bands)
+    duplicate_count = sum(len(cluster["duplicates"]) for cluster in clusters)  # type: ignore[arg-type]
+    output_path = extracted_root / DUPLICATES_NAME
+    output_path.write_text(
+        json.dumps(
+            {
+                "threshold": args.threshold,
+                "documents": len(documents),
+                "duplicates": duplicate_count,
+                "clusters": clusters,
+            },
+            ensure_ascii=False,
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    for cluster in clusters:
+        print(f"Canonical {cluster['canonical']}")
+        for duplicate in cluster["duplicates"]:  # type: ignore[union-attr]
+            print(f"  = {duplicate['key']} ({duplicate['similarity']})")
+    print(f"Done. {duplicate_count} duplicates in {len(clusters)} clusters over {len(documents)} documents")
+    print(f"Duplicates written: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
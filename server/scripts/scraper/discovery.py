@@ -0,0 +1,196 @@
+import re
+import xml.etree.ElementTree as ElementTree
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from http_cache import CachedPage, HttpCache
+from http_client import host_of
+
+
+# Query parameters that page through a listing (Joomla/edocman uses start and limitstart, WordPress page/paged)
+# and ones that only reorder or resize it; neither makes a link a document.
+PAGINATION_PARAMS = {"start", "limitstart", "page", "paged"}
+ORDERING_PARAMS = {"limit", "sort", "order", "ordering", "direction", "dir"}
+PAGE_PATH = re.compile(r"/page/(\d+)/?$")
+SITEMAP_LINE = re.compile(r"^\s*sitemap\s*:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+DEFAULT_MAX_DEPTH = 50
+DEFAULT_MAX_PAGES = 500
+DEFAULT_MAX_SITEMAP_PAGES = 100
+MAX_SITEMAPS = 20
+
+FetchFn = Callable[[str], CachedPage]
+# (source_type, page_url, subjects) as resolved by scrape_urls.resolve_subject_source_pages.
+SourcePage = Tuple[str, str, Tuple[str, ...]]
+
+
+def split_listing(url: str, dropped: Set[str]) -> Tuple[str, str, str, str]:
+    parts = urlsplit(url)
+    path = PAGE_PATH.sub("", parts.path).rstrip("/") or "/"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key.lower() not in dropped)
+    return parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query)
+
+
+def listing_base(url: str) -> str:
+    # The first page of the listing url belongs to, e.g. .../bepc for .../bepc?start=20.
+    return urlunsplit((*split_listing(url, PAGINATION_PARAMS), ""))
+
+
+def same_listing(url: str, page_url: str) -> bool:
+    # Another page, order or page size of the listing being parsed, never a document.
+    return split_listing(url, PAGINATION_PARAMS | ORDERING_PARAMS) == split_listing(page_url, PAGINATION_PARAMS | ORDERING_PARAMS)
+
+
+def page_offset(url: str) -> int:
+    parts = urlsplit(url)
+    match = PAGE_PATH.search(parts.path)
+    if match:
+        return int(match.group(1))
+    for key, value in parse_qsl(parts.query):
+        if key.lower() in PAGINATION_PARAMS and value.isdigit():
+            return int(value)
+    return 0
+
+
+def pagination_links(page_url: str, hrefs: Iterable[str]) -> List[str]:
+    # Later pages of the same listing, with the same order and page size as page_url.
+    base = listing_base(page_url)
+    found: List[str] = []
+    for href in hrefs:
+        url = urljoin(page_url, href.strip()).split("#", 1)[0]
+        if url != page_url and page_offset(url) > 0 and listing_base(url) == base and url not in found:
+            found.append(url)
+    return found
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_sitemap(text: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    # ([(loc, lastmod)], [child sitemap urls]) of a sitemap or sitemap index.
+    try:
+        root = ElementTree.fromstring(text.encode("utf-8"))
+    except ElementTree.ParseError:
+        return [], []
+    entries: List[Tuple[str, str]] = []
+    children: List[str] = []
+    for node in root:
+        fields = {local_name(child.tag): (child.text or "").strip() for child in node}
+        loc = fields.get("loc")
+        if not loc:
+            continue
+        if local_name(root.tag) == "sitemapindex":
+            children.append(loc)
+        else:
+            entries.append((loc, fields.get("lastmod", "")))
+    return entries, children
+
+
+def robots_sitemaps(text: str) -> List[str]:
+    return SITEMAP_LINE.findall(text)
+
+
+# Listing pages behind each configured seed: pagination links (up to max_depth hops, bounded by max_pages)
+# and sitemap entries that are pages of a seed's listing (bounded by max_sitemap_pages). The budgets are
+# separate so that a large sitemap cannot crowd out the pagination chain.
+class Discovery:
+    def __init__(
+        self,
+        seeds: List[SourcePage],
+        previous_lastmod: Optional[Dict[str, str]] = None,
+        cache: Optional[HttpCache] = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        max_sitemap_pages: int = DEFAULT_MAX_SITEMAP_PAGES,
+        sitemaps: bool = True,
+    ) -> None:
+        self.seeds = seeds
+        self.previous_lastmod = previous_lastmod or {}
+        self.cache = cache
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_sitemap_pages = max_sitemap_pages
+        self.sitemaps = sitemaps
+        self.depth: Dict[str, int] = {page_url: 0 for _, page_url, _ in seeds}
+        self.owner: Dict[str, int] = {page_url: index for index, (_, page_url, _) in enumerate(seeds)}
+        self.lastmod: Dict[str, str] = {}
+        self.reusable: Set[str] = set()
+        self.stats = {"paginated": 0, "sitemap": 0, "over_budget": 0}
+
+    def admit(self, url: str, index: int, depth: int, kind: str) -> bool:
+        # kind is "paginated" or "sitemap", each with its own budget.
+        if url in self.owner:
+            return False
+        limit = self.max_pages if kind == "paginated" else self.max_sitemap_pages
+        if depth > self.max_depth or self.stats[kind] >= limit:
+            self.stats["over_budget"] += 1
+            return False
+        self.owner[url] = index
+        self.depth[url] = depth
+        self.stats[kind] += 1
+        return True
+
+    def follow(self, page: CachedPage, links: Iterable[str]) -> List[str]:
+        # Pagination links that still fit the budget, in page order. They are always revalidated through
+        # the HTTP cache: an unchanged first page says nothing about a new document on page 3.
+        index = self.owner.get(page.url)
+        if index is None:
+            return []
+        children: List[str] = []
+        for url in sorted(links, key=page_offset):
+            if self.admit(url, index, self.depth[page.url] + 1, "paginated"):
+                children.append(url)
+        return children
+
+    def read_sitemaps(self, fetch: FetchFn) -> List[Tuple[int, str]]:
+        # (seed index, url) for sitemap entries that are another page, order or page size of a seed listing.
+        # Other urls below a seed's path are documents or unrelated sections as often as listings.
+        if not self.sitemaps:
+            return []
+        listings: Dict[Tuple[str, str, str, str], int] = {}
+        for index, (_, page_url, _) in enumerate(self.seeds):
+            listings.setdefault(split_listing(page_url, PAGINATION_PARAMS | ORDERING_PARAMS), index)
+        discovered: List[Tuple[int, str]] = []
+        for host in sorted({host_of(page_url) for _, page_url, _ in self.seeds}):
+            for loc, lastmod in self.host_sitemap_entries(host, fetch):
+                index = listings.get(split_listing(loc, PAGINATION_PARAMS | ORDERING_PARAMS))
+                if index is None or not self.admit(loc, index, 1, "sitemap"):
+                    continue
+                self.lastmod[loc] = lastmod
+                if lastmod and self.previous_lastmod.get(loc) == lastmod:
+                    self.reusable.add(loc)
+                discovered.append((index, loc))
+        return discovered
+
+    def host_sitemap_entries(self, host: str, fetch: FetchFn) -> List[Tuple[str, str]]:
+        scheme = next(urlsplit(page_url).scheme for _, page_url, _ in self.seeds if host_of(page_url) == host)
+        root = f"{scheme}://{host}"
+        try:
+            pending = robots_sitemaps(fetch(f"{root}/robots.txt").text)
+        except Exception:
+            pending = []
+        pending = pending or [f"{root}/sitemap.xml"]
+        entries: List[Tuple[str, str]] = []
+        visited: Set[str] = set()
+        while pending and len(visited) < MAX_SITEMAPS:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+            try:
+                found, children = parse_sitemap(fetch(sitemap_url).text)
+            except Exception as exc:
+                print(f"Sitemap {sitemap_url} unavailable: {exc}")
+                continue
+            entries.extend(found)
+            pending.extend(children)
+        return entries
+
+    def fetch(self, url: str, fetch: FetchFn) -> CachedPage:
+        # Sitemap pages whose lastmod is unchanged come from the cache; anything else (or a cache miss)
+        # goes through fetch, which revalidates cached copies with If-None-Match/If-Modified-Since.
+        if url in self.reusable and self.cache is not None:
+            page = self.cache.peek(url)
+            if page is not None:
+                return page
+        return fetch(url)
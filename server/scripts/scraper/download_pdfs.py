@@ -1,17 +1,34 @@
 import json
+import os
 import re
 import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
+import fitz
 import requests
 
+from catalog import add_catalog_arguments, open_catalog
+from http_client import HostSemaphores, build_session, host_of
+from manifest import Manifest, default_manifest_path
+from metrics import DOWNLOAD_BYTES, DOWNLOADS, FETCH_SECONDS, RETRIES, TRACER, add_metrics_arguments, start_stage
+from retry_queue import RetryQueue, default_queue_path, is_retryable_reason, retry_key
+
 
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
     "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36"
 )
+CHUNK_SIZE = 256 * 1024
+# Readers accept the header anywhere in the first KiB; the trailer sits in the last few.
+PDF_MAGIC = b"%PDF-"
+SNIFF_BYTES = 1024
+TAIL_BYTES = 4096
+# What a 416 reports as the full length of the file: "Content-Range: bytes */N".
+UNSATISFIED_RANGE = re.compile(r"^\s*bytes\s+\*/(\d+)\s*$", re.IGNORECASE)
 
 
 def source_dir_name(source_type: str) -> str:
@@ -37,21 +54,273 @@ def infer_filename(title: str, url: str) -> str:
     return f"{base[:120]}.pdf"
 
 
-def download_file(url: str, destination: Path) -> Dict[str, str]:
+def partial_path(destination: Path) -> Path:
+    return destination.with_name(f"{destination.name}.part")
+
+
+def partial_validators_path(destination: Path) -> Path:
+    # ETag / Last-Modified of the response a .part was started from, sent back as If-Range on resume.
+    return destination.with_name(f"{destination.name}.part.json")
+
+
+def read_partial_validators(destination: Path) -> Dict[str, Optional[str]]:
+    try:
+        stored = json.loads(partial_validators_path(destination).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return stored if isinstance(stored, dict) else {}
+
+
+def discard_partial(destination: Path) -> None:
+    partial_path(destination).unlink(missing_ok=True)
+    partial_validators_path(destination).unlink(missing_ok=True)
+
+
+def if_range_value(validators: Dict[str, Optional[str]]) -> Optional[str]:
+    # If-Range only accepts a strong ETag; otherwise the Last-Modified date.
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("lastModified") or None
+
+
+def read_head(path: Path) -> bytes:
+    with path.open("rb") as handle:
+        return handle.read(SNIFF_BYTES)
+
+
+def check_pdf(path: Path) -> Tuple[str, Optional[int]]:
+    # Cheap structural check of a finished download: (validation, page count).
+    size = path.stat().st_size
+    with path.open("rb") as handle:
+        handle.seek(max(0, size - TAIL_BYTES))
+        tail = handle.read()
+    if b"startxref" not in tail or b"%%EOF" not in tail:
+        return "no_trailer", None
+    try:
+        with fitz.open(path, filetype="pdf") as document:
+            if document.needs_pass:
+                return "encrypted", None
+            pages = document.page_count
+    except Exception:
+        return "unreadable", None
+    return ("ok" if pages else "no_pages"), pages
+
+
+def download_file(
+    url: str,
+    destination: Path,
+    session: Optional[requests.Session] = None,
+    chunk_size: int = CHUNK_SIZE,
+    conditional: Optional[Dict[str, str]] = None,
+) -> Dict[str, object]:
+    started = time.perf_counter()
+    host = host_of(url)
+    with TRACER.span("download_file", **{"http.url": url}) as span:
+        result = _download_file(url, destination, session, chunk_size, conditional)
+        if span is not None:
+            span.set("download.status", result["status"])
+            span.set("download.bytes", int(result.get("bytes", 0)))  # type: ignore[call-overload]
+    FETCH_SECONDS.observe(time.perf_counter() - started, stage="download", host=host, outcome=str(result["status"]))
+    DOWNLOAD_BYTES.inc(int(result.get("bytes", 0)), host=host)  # type: ignore[call-overload]
+    return result
+
+
+def _download_file(
+    url: str,
+    destination: Path,
+    session: Optional[requests.Session],
+    chunk_size: int,
+    conditional: Optional[Dict[str, str]],
+) -> Dict[str, object]:
+    client = session or requests
+    part_path = partial_path(destination)
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    stored = read_partial_validators(destination) if offset else {}
+    if_range = if_range_value(stored)
+    if offset and (if_range is None or (offset >= SNIFF_BYTES and PDF_MAGIC not in read_head(part_path))):
+        # Without a validator the remote file may have changed under the .part, and a partial error page
+        # kept by an older run cannot be resumed into a PDF.
+        discard_partial(destination)
+        offset = 0
+    headers = {"User-Agent": USER_AGENT}
+    if offset:
+        # A changed file comes back whole (200) instead of its tail being spliced onto stale bytes.
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = if_range  # type: ignore[assignment]
+    elif conditional:
+        headers.update(conditional)
+
     try:
-        response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=60)
+        response = client.get(url, headers=headers, timeout=60, stream=True)
     except Exception as exc:
         return {"status": "failed", "reason": f"request_error:{exc}"}
 
-    if response.status_code >= 400:
-        return {"status": "failed", "reason": f"http_{response.status_code}"}
+    with response:
+        if response.status_code == 416 and offset:
+            total = UNSATISFIED_RANGE.match(response.headers.get("content-range", ""))
+            if total and int(total.group(1)) == offset:
+                # The previous attempt got every byte and only failed afterwards.
+                return complete_download(part_path, destination, "resumed", 0, stored)
+            discard_partial(destination)
+            RETRIES.inc(stage="download", host=host_of(url))
+            return _download_file(url, destination, session, chunk_size, None)
 
-    content_type = response.headers.get("content-type", "").lower()
-    if "pdf" not in content_type and not destination.name.lower().endswith(".pdf"):
-        return {"status": "failed", "reason": f"non_pdf_content_type:{content_type}"}
+        validators = {
+            "etag": response.headers.get("etag"),
+            "lastModified": response.headers.get("last-modified"),
+        }
+        if response.status_code == 304:
+            return {"status": "not_modified", "reason": "not_modified", **validators}
 
-    destination.write_bytes(response.content)
-    return {"status": "ok", "reason": "downloaded"}
+        if response.status_code >= 400:
+            return {"status": "failed", "reason": f"http_{response.status_code}"}
+
+        # The content type is unreliable (octet-stream PDFs, text/html error pages behind .pdf names),
+        # so the body itself decides: the stream stops as soon as its first bytes are not a PDF header.
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        resumed = offset > 0 and response.status_code == 206
+        head = read_head(part_path) if resumed else b""
+        if resumed:
+            validators = {key: validators[key] or stored.get(key) for key in validators}
+        else:
+            partial_validators_path(destination).write_text(json.dumps(validators), encoding="utf-8")
+        written = 0
+        try:
+            with part_path.open("ab" if resumed else "wb") as handle:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[: SNIFF_BYTES - len(head)]
+                        if len(head) == SNIFF_BYTES and PDF_MAGIC not in head:
+                            break
+                    handle.write(chunk)
+                    written += len(chunk)
+        except Exception as exc:
+            return {"status": "failed", "reason": f"stream_error:{exc}", "bytes": written}
+
+        if PDF_MAGIC not in head:
+            discard_partial(destination)
+            return {
+                "status": "failed",
+                "reason": f"not_pdf:{content_type or 'unknown'}",
+                "validation": "not_pdf",
+                "bytes": written,
+            }
+        expected = response.headers.get("content-length")
+        if expected and expected.isdigit() and not response.headers.get("content-encoding") and written < int(expected):
+            # Kept for a ranged resume on the next attempt.
+            return {"status": "failed", "reason": f"stream_error:truncated {written}/{expected}", "bytes": written}
+
+    return complete_download(part_path, destination, "resumed" if resumed else "downloaded", written, validators)
+
+
+def complete_download(
+    part_path: Path, destination: Path, reason: str, written: int, validators: Dict[str, Optional[str]]
+) -> Dict[str, object]:
+    validation, pages = check_pdf(part_path)
+    if validation != "ok":
+        discard_partial(destination)
+        return {"status": "failed", "reason": f"invalid_pdf:{validation}", "validation": validation, "bytes": written}
+    os.replace(part_path, destination)
+    partial_validators_path(destination).unlink(missing_ok=True)
+    return {
+        "status": "ok",
+        "reason": reason,
+        "validation": validation,
+        "pages": pages,
+        "bytes": written,
+        "etag": validators.get("etag"),
+        "lastModified": validators.get("lastModified"),
+    }
+
+
+def conditional_headers(entry: Optional[Dict[str, object]]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = str(entry["etag"])
+    if entry and entry.get("lastModified"):
+        headers["If-Modified-Since"] = str(entry["lastModified"])
+    return headers
+
+
+def download_all(
+    jobs: List[Tuple[str, Path, Dict[str, str]]],
+    workers: int = 8,
+    per_host: int = 2,
+) -> List[Dict[str, object]]:
+    session = build_session(pool_size=max(workers, per_host))
+    host_limits = HostSemaphores(per_host)
+
+    def run(job: Tuple[str, Path, Dict[str, str]]) -> Dict[str, object]:
+        url, destination, conditional = job
+        with host_limits.for_url(url):
+            return download_file(url, destination, session=session, conditional=conditional)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(run, jobs))
+    finally:
+        session.close()
+
+
+PlannedDownload = Tuple[Dict[str, str], Path, Optional[int]]
+
+
+def plan_downloads(
+    data: List[Dict[str, str]], subject_root: Path, manifest: Manifest, refresh: bool = False
+) -> Tuple[List[PlannedDownload], List[Tuple[str, Path, Dict[str, str]]]]:
+    # A planned entry with no job index is already on disk (or claimed by an earlier url).
+    planned: List[PlannedDownload] = []
+    jobs: List[Tuple[str, Path, Dict[str, str]]] = []
+    claimed = set()
+
+    for item in data:
+        source_type = item.get("sourceType", "cours")
+        title = item.get("title", "document")
+        url = item.get("url")
+        if not url:
+            continue
+
+        source_dir = subject_root / source_dir_name(source_type)
+        source_dir.mkdir(parents=True, exist_ok=True)
+
+        filename = infer_filename(title, url)
+        destination = source_dir / filename
+        entry = {"url": url, "title": title, "sourceType": source_type}
+
+        if destination in claimed:
+            planned.append((entry, destination, None))
+            continue
+        conditional: Dict[str, str] = {}
+        if destination.exists():
+            previous = manifest.get("download", url)
+            if previous is None:
+                manifest.record("download", url, {"url": url}, [destination])
+            conditional = conditional_headers(previous) if refresh else {}
+            if not conditional:
+                planned.append((entry, destination, None))
+                continue
+        claimed.add(destination)
+        planned.append((entry, destination, len(jobs)))
+        jobs.append((url, destination, conditional))
+    return planned, jobs
+
+
+def queue_download_failure(
+    queue: RetryQueue, entry: Dict[str, str], subject_slug: str, destination: Path, server_root: Path, reason: str
+) -> bool:
+    retryable = is_retryable_reason(reason)
+    queue.enqueue_failure(
+        "download",
+        retry_key(subject_slug, entry["url"]),
+        host_of(entry["url"]),
+        {**entry, "subject": subject_slug, "file": destination.relative_to(server_root).as_posix()},
+        reason,
+        retryable=retryable,
+    )
+    return retryable
 
 
 def main() -> None:
@@ -61,6 +330,21 @@ def main() -> None:
         default="mathematiques",
         help="Subject slug (used to resolve urls_<subject>.json and output folder)",
     )
+    parser.add_argument("--workers", type=int, default=8, help="Number of parallel downloads")
+    parser.add_argument("--per-host", type=int, default=2, help="Maximum concurrent downloads per host")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate existing files with If-None-Match/If-Modified-Since instead of skipping them",
+    )
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument(
+        "--retry-queue",
+        default=None,
+        help="Failure queue drained by retry_failures.py (default: data/retry_queue.sqlite3)",
+    )
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     script_dir = Path(__file__).resolve().parent
@@ -73,90 +357,130 @@ def main() -> None:
 
     if not urls_path.exists():
         raise FileNotFoundError(f"Missing {urls_path}. Run scrape_urls.py first.")
+    with start_stage("download", args, server_root):
+        data = json.loads(urls_path.read_text(encoding="utf-8"))
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        queue = RetryQueue(Path(args.retry_queue) if args.retry_queue else default_queue_path(server_root))
+        counts = {"cours": 0, "exercice": 0, "annale": 0, "livre": 0}
+        downloaded = 0
+        skipped_existing = 0
+        failed = 0
+        rejected = 0
+        failures: List[Dict[str, str]] = []
+        report_items: List[Dict[str, object]] = []
 
-    data = json.loads(urls_path.read_text(encoding="utf-8"))
-    counts = {"cours": 0, "exercice": 0, "annale": 0, "livre": 0}
-    downloaded = 0
-    skipped_existing = 0
-    failed = 0
-    failures: List[Dict[str, str]] = []
-    report_items: List[Dict[str, str]] = []
+        planned, jobs = plan_downloads(data, pdf_root / subject_slug, manifest, args.refresh)
+        print(f"Downloading {len(jobs)} files with {args.workers} workers ({args.per_host} per host)")
+        results = download_all(jobs, workers=args.workers, per_host=args.per_host)
+        bytes_downloaded = 0
 
-    for item in data:
-        source_type = item.get("sourceType", "cours")
-        title = item.get("title", "document")
-        url = item.get("url")
-        if not url:
-            continue
+        for entry, destination, job_index in planned:
+            url = entry["url"]
+            source_type = entry["sourceType"]
+            if job_index is None:
+                skipped_existing += 1
+                report_items.append(
+                    {
+                        **entry,
+                        "file": str(destination.relative_to(server_root)).replace("\\", "/"),
+                        "status": "skipped_existing",
+                        "reason": "already_exists",
+                    }
+                )
+                continue
 
-        source_dir = pdf_root / subject_slug / source_dir_name(source_type)
-        source_dir.mkdir(parents=True, exist_ok=True)
+            result = results[job_index]
+            status = result["status"]
+            reason = str(result["reason"])
+            bytes_downloaded += int(result.get("bytes", 0))
 
-        filename = infer_filename(title, url)
-        destination = source_dir / filename
+            if status != "failed":
+                queue.resolve("download", retry_key(subject_slug, url))
+                queue.record_success(host_of(url))
 
-        if destination.exists():
-            skipped_existing += 1
-            report_items.append(
-                {
-                    "url": url,
-                    "title": title,
-                    "sourceType": source_type,
-                    "file": str(destination.relative_to(server_root)).replace("\\", "/"),
-                    "status": "skipped_existing",
-                    "reason": "already_exists",
-                }
-            )
-            continue
+            if status == "not_modified":
+                skipped_existing += 1
+                report_items.append(
+                    {
+                        **entry,
+                        "file": str(destination.relative_to(server_root)).replace("\\", "/"),
+                        "status": "skipped_existing",
+                        "reason": reason,
+                    }
+                )
+            elif status == "ok":
+                manifest.record(
+                    "download",
+                    url,
+                    {"url": url},
+                    [destination],
+                    etag=result.get("etag"),
+                    lastModified=result.get("lastModified"),
+                )
+                downloaded += 1
+                counts[source_type] = counts.get(source_type, 0) + 1
+                print(f"  -> downloaded {destination.name}")
+                report_items.append(
+                    {
+                        **entry,
+                        "file": str(destination.relative_to(server_root)).replace("\\", "/"),
+                        "status": "downloaded",
+                        "reason": reason,
+                        "validation": result["validation"],
+                        "pages": result["pages"],
+                    }
+                )
+            else:
+                failed += 1
+                retryable = queue_download_failure(queue, entry, subject_slug, destination, server_root, reason)
+                print(f"  ! failed {url} ({reason}{', queued for retry' if retryable else ''})")
+                failure = {**entry, "reason": reason}
+                failures.append(failure)
+                item: Dict[str, object] = {**failure, "status": "failed", "file": ""}
+                if result.get("validation"):
+                    rejected += 1
+                    item["validation"] = result["validation"]
+                report_items.append(item)
 
-        result = download_file(url, destination)
-        status = result["status"]
-        reason = result["reason"]
-
-        if status == "ok":
-            downloaded += 1
-            counts[source_type] = counts.get(source_type, 0) + 1
-            print(f"  -> downloaded {destination.name}")
-            report_items.append(
-                {
-                    "url": url,
-                    "title": title,
-                    "sourceType": source_type,
-                    "file": str(destination.relative_to(server_root)).replace("\\", "/"),
-                    "status": "downloaded",
-                    "reason": reason,
-                }
-            )
-        else:
-            failed += 1
-            print(f"  ! failed {url} ({reason})")
-            failure = {
-                "url": url,
-                "title": title,
-                "sourceType": source_type,
-                "reason": reason,
-            }
-            failures.append(failure)
-            report_items.append({**failure, "status": "failed", "file": ""})
-
-    summary = {
-        "totalUrls": len(data),
-        "downloaded": downloaded,
-        "skippedExisting": skipped_existing,
-        "failed": failed,
-        "downloadedBySourceType": counts,
-    }
+        for item in report_items:
+            DOWNLOADS.inc(result=item["status"])
+        catalog = open_catalog(args, server_root)
+        if catalog is not None:
+            job_results = {entry["url"]: results[job_index] for entry, _, job_index in planned if job_index is not None}
+            for item in report_items:
+                result = job_results.get(item["url"], {})
+                catalog.add_download(
+                    subject_slug,
+                    item,
+                    size=int(result["bytes"]) if result.get("bytes") else None,
+                    etag=result.get("etag"),  # type: ignore[arg-type]
+                    last_modified=result.get("lastModified"),  # type: ignore[arg-type]
+                )
+            catalog.close()
 
-    report_payload = {"summary": summary, "items": report_items}
-    report_path.write_text(json.dumps(report_payload, ensure_ascii=False, indent=2), encoding="utf-8")
-    failed_path.write_text(json.dumps(failures, ensure_ascii=False, indent=2), encoding="utf-8")
+        summary = {
+            "totalUrls": len(data),
+            "downloaded": downloaded,
+            "skippedExisting": skipped_existing,
+            "failed": failed,
+            "rejectedInvalidPdf": rejected,
+            "bytesDownloaded": bytes_downloaded,
+            "downloadedBySourceType": counts,
+        }
 
-    print(
-        "Download summary: "
-        f"downloaded={downloaded}, skipped_existing={skipped_existing}, failed={failed}"
-    )
-    print(f"Report written: {report_path}")
-    print(f"Failed URLs written: {failed_path}")
+        manifest.save()
+        queue.close()
+        report_payload = {"summary": summary, "items": report_items}
+        report_path.write_text(json.dumps(report_payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        failed_path.write_text(json.dumps(failures, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        print(
+            "Download summary: "
+            f"downloaded={downloaded}, skipped_existing={skipped_existing}, failed={failed} "
+            f"(rejected as not a valid PDF: {rejected})"
+        )
+        print(f"Report written: {report_path}")
+        print(f"Failed URLs written: {failed_path}")
 
 
 if __name__ == "__main__":
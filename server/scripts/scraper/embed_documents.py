@@ -0,0 +1,371 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import unicodedata
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from chunker import Chunker
+from corpus import iter_structured
+from manifest import Manifest, default_manifest_path, sha256_text
+from metrics import TRACER, add_metrics_arguments, start_stage
+
+try:
+    import numpy
+except ImportError:  # optional dependency, vectors are packed with the array module without it
+    numpy = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # optional dependency, only needed for --model st:<name>
+    SentenceTransformer = None
+
+
+INDEX_VERSION = 1
+HEADER_NAME = "index.json"
+SIDECAR_NAME = "chunks.jsonl"
+DTYPES = {"float32": ("f32", 4, "f"), "float16": ("f16", 2, "e")}
+# Same budget as the server-side chunker (rag.service.ts DEFAULT_CHUNK_CONFIG).
+DEFAULT_MAX_TOKENS = 800
+DEFAULT_OVERLAP_TOKENS = 100
+WORD = re.compile(r"[^\W_]+")
+METADATA_FIELDS = ("year", "zone", "pageStart", "pageEnd")
+
+
+def fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def hashed_features(text: str) -> Dict[int, int]:
+    # Unigrams and bigrams over accent-folded words; crc32 keeps the buckets stable across runs.
+    words = WORD.findall(fold(text))
+    counts: Dict[int, int] = {}
+    for term in words + [f"{left} {right}" for left, right in zip(words, words[1:])]:
+        bucket = zlib.crc32(term.encode("utf-8"))
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+class Embedder:
+    spec = ""
+    dim = 0
+    # Corpus-fitted models change every vector when the corpus changes, so nothing is reused.
+    fitted = False
+
+    def fit(self, texts: Sequence[str]) -> None:
+        pass
+
+    def encode(self, texts: Sequence[str]) -> List[Sequence[float]]:
+        raise NotImplementedError
+
+    def extra(self) -> Dict[str, object]:
+        return {}
+
+
+class HashingEmbedder(Embedder):
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+        self.spec = f"hashing:{dim}"
+        self.idf: Optional[List[float]] = None
+
+    def weights(self, text: str) -> Dict[int, float]:
+        vector: Dict[int, float] = {}
+        for bucket, count in hashed_features(text).items():
+            index = bucket % self.dim
+            sign = 1.0 if (bucket >> 31) & 1 else -1.0
+            weight = 1.0 + math.log(count)
+            if self.idf is not None:
+                weight *= self.idf[index]
+            vector[index] = vector.get(index, 0.0) + sign * weight
+        return vector
+
+    def encode(self, texts: Sequence[str]) -> List[Sequence[float]]:
+        rows: List[Sequence[float]] = []
+        for text in texts:
+            row = [0.0] * self.dim
+            for index, value in self.weights(text).items():
+                row[index] = value
+            norm = math.sqrt(sum(value * value for value in row))
+            rows.append([value / norm for value in row] if norm else row)
+        return rows
+
+
+class TfidfEmbedder(HashingEmbedder):
+    fitted = True
+
+    def __init__(self, dim: int = 384) -> None:
+        super().__init__(dim)
+        self.spec = f"tfidf:{dim}"
+
+    def fit(self, texts: Sequence[str]) -> None:
+        frequencies = [0] * self.dim
+        for text in texts:
+            for index in {bucket % self.dim for bucket in hashed_features(text)}:
+                frequencies[index] += 1
+        total = len(texts)
+        self.idf = [math.log((1 + total) / (1 + frequency)) + 1.0 for frequency in frequencies]
+
+    def extra(self) -> Dict[str, object]:
+        # Queries have to be weighted with the same idf to land in the same space.
+        return {"idf": [round(value, 6) for value in self.idf or []]}
+
+
+class SentenceTransformerEmbedder(Embedder):
+    def __init__(self, name: str) -> None:
+        if SentenceTransformer is None:
+            raise RuntimeError(
+                "the st embedding model requires the 'sentence-transformers' package (pip install sentence-transformers)"
+            )
+        self.model = SentenceTransformer(name)
+        self.spec = f"st:{name}"
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+
+    def encode(self, texts: Sequence[str]) -> List[Sequence[float]]:
+        return list(self.model.encode(list(texts), normalize_embeddings=True, show_progress_bar=False))
+
+
+def build_embedder(spec: str) -> Embedder:
+    kind, _, option = spec.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(option or 384))
+    if kind == "tfidf":
+        return TfidfEmbedder(int(option or 384))
+    if kind == "st":
+        return SentenceTransformerEmbedder(option or "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    raise ValueError(f"unknown embedding model: {spec} (expected hashing[:dim], tfidf[:dim] or st:<name>)")
+
+
+def pack_rows(rows: Sequence[Sequence[float]], dtype: str) -> bytes:
+    if numpy is not None:
+        return numpy.asarray(rows, dtype="<f4" if dtype == "float32" else "<f2").tobytes()
+    _, _, code = DTYPES[dtype]
+    if code == "e":
+        return b"".join(struct.pack(f"<{len(row)}e", *row) for row in rows)
+    packed = array("f", (float(value) for row in rows for value in row))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class ChunkRecord:
+    __slots__ = ("chunk_id", "doc_id", "index", "total", "start", "end", "text", "sha", "meta")
+
+    def __init__(
+        self, doc_id: str, index: int, total: int, start: int, end: int, text: str, meta: Dict[str, object]
+    ) -> None:
+        self.chunk_id = f"{doc_id}#{index}"
+        self.doc_id = doc_id
+        self.index = index
+        self.total = total
+        self.start = start
+        self.end = end
+        self.text = text
+        self.sha = sha256_text(text)[:16]
+        self.meta = meta
+
+    def sidecar(self, row: int) -> Dict[str, object]:
+        return {
+            "row": row,
+            "id": self.chunk_id,
+            "docId": self.doc_id,
+            "chunkIndex": self.index,
+            "totalChunks": self.total,
+            "start": self.start,
+            "end": self.end,
+            "sha": self.sha,
+            **self.meta,
+        }
+
+
+def document_chunks(doc_id: str, document: Dict[str, object], chunker: Chunker, max_tokens: int) -> Iterator[ChunkRecord]:
+    content = str(document.get("content", ""))
+    metadata = document.get("metadata") or {}
+    meta: Dict[str, object] = {
+        "title": document.get("title"),
+        "subject": document.get("subject"),
+        "sourceType": document.get("sourceType"),
+        "chapter": document.get("chapter"),
+    }
+    meta.update({field: metadata.get(field) for field in METADATA_FIELDS if metadata.get(field) is not None})  # type: ignore[union-attr]
+    chunks = chunker.chunk(content, max_tokens)
+    for index, chunk in enumerate(chunks):
+        yield ChunkRecord(doc_id, index, len(chunks), chunk.start, chunk.end, chunk.text, meta)
+
+
+def load_previous(output_dir: Path, spec: str, dtype: str) -> Dict[str, bytes]:
+    # sha -> packed vector bytes from the last run, so unchanged chunks are not embedded again.
+    header_path = output_dir / HEADER_NAME
+    if not header_path.exists():
+        return {}
+    header = json.loads(header_path.read_text(encoding="utf-8"))
+    if header.get("model") != spec or header.get("dtype") != dtype or header.get("fitted"):
+        return {}
+    row_bytes = int(header["dim"]) * DTYPES[dtype][1]
+    previous: Dict[str, bytes] = {}
+    with (output_dir / str(header["vectors"])).open("rb") as vectors, (output_dir / SIDECAR_NAME).open(encoding="utf-8") as sidecar:
+        for line in sidecar:
+            entry = json.loads(line)
+            vectors.seek(int(entry["row"]) * row_bytes)
+            previous[str(entry["sha"])] = vectors.read(row_bytes)
+    return previous
+
+
+def open_vectors(output_dir: Path) -> Tuple[Dict[str, object], object]:
+    # Zero-copy view of the matrix: a numpy memmap when numpy is installed, else a read-only mmap.
+    header = json.loads((output_dir / HEADER_NAME).read_text(encoding="utf-8"))
+    path = output_dir / str(header["vectors"])
+    if numpy is not None:
+        dtype = "<f4" if header["dtype"] == "float32" else "<f2"
+        return header, numpy.memmap(path, dtype=dtype, mode="r", shape=(int(header["count"]), int(header["dim"])))
+    with path.open("rb") as handle:
+        return header, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) if header["count"] else b""
+
+
+def write_index(
+    output_dir: Path,
+    records: List[ChunkRecord],
+    embedder: Embedder,
+    dtype: str,
+    batch_size: int,
+    stats: Dict[str, int],
+) -> None:
+    suffix, width, _ = DTYPES[dtype]
+    vectors_name = f"vectors.{suffix}"
+    previous = {} if embedder.fitted else load_previous(output_dir, embedder.spec, dtype)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tmp_vectors = output_dir / f"{vectors_name}.tmp"
+    tmp_sidecar = output_dir / f"{SIDECAR_NAME}.tmp"
+
+    with tmp_vectors.open("wb") as vectors, tmp_sidecar.open("w", encoding="utf-8") as sidecar:
+        for offset in range(0, len(records), batch_size):
+            batch = records[offset:offset + batch_size]
+            missing = [record for record in batch if record.sha not in previous]
+            with TRACER.span("embed_batch", size=len(batch), embedded=len(missing)):
+                embedded = dict(zip((record.sha for record in missing), embedder.encode([record.text for record in missing])))
+            stats["embedded"] += len(missing)
+            stats["reused"] += len(batch) - len(missing)
+            fresh = {sha: pack_rows([row], dtype) for sha, row in embedded.items()}
+            for row, record in enumerate(batch, start=offset):
+                vectors.write(fresh[record.sha] if record.sha in fresh else previous[record.sha])
+                sidecar.write(json.dumps(record.sidecar(row), ensure_ascii=False, separators=(",", ":")) + "\n")
+            print(f"  embedded {min(offset + batch_size, len(records))}/{len(records)} chunks")
+
+    header = {
+        "version": INDEX_VERSION,
+        "model": embedder.spec,
+        "fitted": embedder.fitted,
+        "dim": embedder.dim,
+        "dtype": dtype,
+        "byteOrder": "little",
+        "normalized": True,
+        "count": len(records),
+        "rowBytes": embedder.dim * width,
+        "vectors": vectors_name,
+        "sidecar": SIDECAR_NAME,
+        "createdAt": int(time.time()),
+        **embedder.extra(),
+    }
+    # The matrix and sidecar are swapped in before the header that describes them.
+    os.replace(tmp_vectors, output_dir / vectors_name)
+    os.replace(tmp_sidecar, output_dir / SIDECAR_NAME)
+    tmp_header = output_dir / f"{HEADER_NAME}.tmp"
+    tmp_header.write_text(json.dumps(header, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_header, output_dir / HEADER_NAME)
+    for stale in output_dir.glob("vectors.*"):
+        if stale.name != vectors_name and not stale.name.endswith(".tmp"):
+            stale.unlink()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Embed structured documents into a memory-mapped vector file")
+    parser.add_argument(
+        "--subject",
+        default=None,
+        help="Optional subject slug. If set, reads raw/<subject> and writes embeddings/<subject>.",
+    )
+    parser.add_argument(
+        "--model",
+        default="hashing:384",
+        help="hashing[:dim] and tfidf[:dim] are offline and deterministic; st:<name> uses sentence-transformers",
+    )
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32", help="Stored vector precision")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks embedded per model call")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="Token budget per embedded chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=DEFAULT_OVERLAP_TOKENS, help="Tokens shared by neighbour chunks")
+    parser.add_argument(
+        "--tokenizer",
+        default="approx",
+        help="Tokenizer used for chunk budgets: approx, whitespace, tiktoken:<encoding> or hf:<tokenizer.json>",
+    )
+    parser.add_argument("--output-dir", default=None, help="Index directory (default: data/embeddings/<subject or all>)")
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="Rebuild the index even if no document changed")
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    subject_slug = re.sub(r"[^a-z0-9-]+", "-", args.subject.lower()).strip("-") if args.subject else None
+    raw_root = server_root / "data" / "raw"
+    output_dir = Path(args.output_dir) if args.output_dir else server_root / "data" / "embeddings" / (subject_slug or "all")
+    if not raw_root.exists():
+        raise FileNotFoundError("Missing server/data/raw. Run structure_content.py first.")
+
+    with start_stage("embed", args, server_root):
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        documents = list(iter_structured(raw_root, subject_slug))
+        sources = sorted({str(path) for _, path, _ in documents})
+        inputs = {
+            "documents": sha256_text(json.dumps([[path, manifest.file_digest(Path(path))] for path in sources])),
+            "model": args.model,
+            "dtype": args.dtype,
+            "chunker": f"{args.tokenizer}:{args.max_tokens}:{args.overlap_tokens}",
+        }
+        key = output_dir.resolve().as_posix()
+        if not args.force and manifest.is_fresh("embed", key, inputs):
+            manifest.save()
+            print(f"Embeddings up to date: {output_dir}")
+            return
+
+        chunker = Chunker(args.tokenizer, args.overlap_tokens)
+        records = [
+            record
+            for doc_id, _, load_document in documents
+            for record in document_chunks(doc_id, load_document(), chunker, args.max_tokens)
+        ]
+        embedder = build_embedder(args.model)
+        embedder.fit([record.text for record in records])
+        print(f"Embedding {len(records)} chunks from {len(documents)} documents with {embedder.spec} ({embedder.dim} dims)")
+
+        stats = {"embedded": 0, "reused": 0}
+        started = time.perf_counter()
+        write_index(output_dir, records, embedder, args.dtype, max(1, args.batch_size), stats)
+        elapsed = time.perf_counter() - started
+
+        manifest.record(
+            "embed",
+            key,
+            inputs,
+            [output_dir / HEADER_NAME, output_dir / SIDECAR_NAME, output_dir / f"vectors.{DTYPES[args.dtype][0]}"],
+        )
+        manifest.save()
+        print(
+            f"Done. {len(records)} vectors ({stats['embedded']} embedded, {stats['reused']} reused) "
+            f"in {elapsed:.1f}s -> {output_dir}"
+        )
+
+
+if __name__ == "__main__":
+    main()
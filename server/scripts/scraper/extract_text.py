@@ -1,11 +1,21 @@
 import json
 import argparse
+import os
 import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 import fitz
 
+from catalog import Catalog, add_catalog_arguments, open_catalog
+from jsonl_store import COMPRESSIONS, ShardedJsonlReader, ShardedJsonlWriter
+from manifest import Manifest, default_manifest_path
+from metrics import EXTRACT_PAGE_SECONDS, EXTRACTED_FILES, SCANNED_RATIO, TRACER, add_metrics_arguments, start_stage
+
 
 def extract_text(pdf_path: Path) -> str:
     if not pdf_path.exists() or pdf_path.stat().st_size == 0:
@@ -18,10 +28,268 @@ def extract_text(pdf_path: Path) -> str:
     return "\n".join(chunks).strip()
 
 
+PageRecord = Dict[str, object]
+
+
+def page_record(page: "fitz.Page") -> PageRecord:
+    text = page.get_text()
+    blocks: List[Dict[str, object]] = []
+    cursor = 0
+    for x0, y0, x1, y1, block_text, _, block_type in page.get_text("blocks"):
+        if block_type != 0:
+            continue
+        offset = text.find(block_text, cursor)
+        if offset < 0:
+            continue
+        cursor = offset + len(block_text)
+        blocks.append({"bbox": [round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1)], "start": offset, "end": cursor})
+    return {"page": page.number + 1, "text": text, "blocks": blocks}
+
+
+def iter_pages(pdf_path: Path, start: int = 0, stop: Optional[int] = None) -> Iterator[PageRecord]:
+    if not pdf_path.exists() or pdf_path.stat().st_size == 0:
+        raise ValueError("empty_file")
+    doc = fitz.open(pdf_path)
+    try:
+        for index in range(start, doc.page_count if stop is None else min(stop, doc.page_count)):
+            yield page_record(doc[index])
+    finally:
+        doc.close()
+
+
+def timed_pages(records: Iterable[PageRecord]) -> Iterator[PageRecord]:
+    iterator = iter(records)
+    while True:
+        started = time.perf_counter()
+        record = next(iterator, None)
+        if record is None:
+            return
+        EXTRACT_PAGE_SECONDS.observe(time.perf_counter() - started)
+        yield record
+
+
+def page_entries(records: Iterable[Tuple[int, int, List[Dict[str, object]]]], lead: int, length: int) -> Iterator[Dict[str, object]]:
+    # Offsets are relative to the stripped content: shift by the removed leading whitespace and clamp.
+    def clamp(offset: int) -> int:
+        return min(max(offset - lead, 0), length)
+
+    cursor = 0
+    for page, text_length, blocks in records:
+        yield {
+            "page": page,
+            "start": clamp(cursor),
+            "end": clamp(cursor + text_length),
+            "blocks": [
+                {"bbox": block["bbox"], "start": clamp(cursor + int(block["start"])), "end": clamp(cursor + int(block["end"]))}  # type: ignore[call-overload]
+                for block in blocks
+            ],
+        }
+        cursor += text_length + 1
+
+
+def assemble_pages(records: List[PageRecord]) -> Tuple[str, List[Dict[str, object]]]:
+    joined = "\n".join(str(record["text"]) for record in records)
+    content = joined.strip()
+    lead = len(joined) - len(joined.lstrip())
+    layout = [(int(record["page"]), len(str(record["text"])), list(record["blocks"])) for record in records]  # type: ignore[call-overload]
+    return content, list(page_entries(layout, lead, len(content)))
+
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> Tuple[List[PageRecord], int, float]:
+    started = time.perf_counter()
+    records = list(iter_pages(Path(pdf_path), start, stop))
+    return records, os.getpid(), time.perf_counter() - started
+
+
+def plan_page_ranges(pdf_path: Path, pages_per_task: int) -> List[Tuple[int, int]]:
+    if not pdf_path.exists() or pdf_path.stat().st_size == 0:
+        raise ValueError("empty_file")
+    doc = fitz.open(pdf_path)
+    page_count = doc.page_count
+    doc.close()
+    if page_count == 0:
+        return [(0, 0)]
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
 def detect_scanned(text: str) -> bool:
     return len(text.strip()) < 50
 
 
+def build_payload(
+    pdf_path: Path, relative: Path, text: str, pages: Optional[List[Dict[str, object]]] = None
+) -> Dict[str, object]:
+    payload: Dict[str, object] = {
+        "pdfFile": pdf_path.name,
+        "relativePath": str(relative).replace("\\", "/"),
+        "isScanned": detect_scanned(text),
+        "content": text,
+    }
+    if pages is not None:
+        payload["pages"] = pages
+    return payload
+
+
+# Writes a JSON string body piece by piece; the result equals json.dumps(text.strip()) without the quotes.
+class StrippedJsonString:
+    def __init__(self, handle: TextIO) -> None:
+        self.handle = handle
+        self.lead = 0
+        self.length = 0
+        self.started = False
+        self.pending = ""
+
+    def write(self, piece: str) -> None:
+        if not self.started:
+            stripped = piece.lstrip()
+            self.lead += len(piece) - len(stripped)
+            if not stripped:
+                return
+            self.started = True
+            piece = stripped
+        body = piece.rstrip()
+        if not body:
+            self.pending += piece
+            return
+        self._emit(self.pending + body)
+        self.pending = piece[len(body):]
+
+    def _emit(self, text: str) -> None:
+        self.handle.write(json.dumps(text, ensure_ascii=False)[1:-1])
+        self.length += len(text)
+
+
+def stream_payload(pdf_path: Path, relative: Path, output_path: Path) -> Dict[str, object]:
+    relative_path = str(relative).replace("\\", "/")
+    tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+    try:
+        is_scanned = _stream_payload(pdf_path, relative_path, tmp_path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, output_path)
+    return {"pdfFile": pdf_path.name, "relativePath": relative_path, "isScanned": is_scanned}
+
+
+def _stream_payload(pdf_path: Path, relative_path: str, tmp_path: Path) -> bool:
+    # Same bytes as json.dumps(build_payload(...), indent=2); the content is spooled first because
+    # isScanned comes before it and is only known once every page has been read.
+    with tmp_path.open("w", encoding="utf-8") as handle, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as spool, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as body:
+        content = StrippedJsonString(body)
+        for index, record in enumerate(timed_pages(iter_pages(pdf_path))):
+            if index:
+                content.write("\n")
+            content.write(str(record["text"]))
+            spool.write(json.dumps([record["page"], len(str(record["text"])), record["blocks"]]) + "\n")
+        is_scanned = content.length < 50
+        handle.write("{\n")
+        handle.write(f'  "pdfFile": {json.dumps(pdf_path.name, ensure_ascii=False)},\n')
+        handle.write(f'  "relativePath": {json.dumps(relative_path, ensure_ascii=False)},\n')
+        handle.write(f'  "isScanned": {json.dumps(is_scanned)},\n')
+        handle.write('  "content": "')
+        body.seek(0)
+        shutil.copyfileobj(body, handle)
+        handle.write('",\n  "pages": [')
+        spool.seek(0)
+        layout = (json.loads(line) for line in spool)
+        count = 0
+        for count, entry in enumerate(page_entries(layout, content.lead, content.length), 1):
+            entry_json = json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            handle.write(("," if count > 1 else "") + "\n    " + entry_json)
+        handle.write("\n  ]\n}" if count else "]\n}")
+    return is_scanned
+
+
+def build_error_payload(pdf_path: Path, relative: Path, exc: Exception) -> Dict[str, object]:
+    return {
+        "pdfFile": pdf_path.name,
+        "relativePath": str(relative).replace("\\", "/"),
+        "isScanned": True,
+        "content": "",
+        "error": str(exc),
+    }
+
+
+def record_id(relative: Path) -> str:
+    return relative.with_suffix(".json").as_posix()
+
+
+def write_payload(
+    output_path: Path,
+    payload: Dict[str, object],
+    stats: Dict[str, int],
+    writer: Optional[ShardedJsonlWriter] = None,
+    catalog: Optional[Catalog] = None,
+) -> None:
+    if writer is not None:
+        writer.write(record_id(Path(str(payload["relativePath"]))), payload)
+    else:
+        output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    report_payload(payload, stats)
+    if catalog is not None:
+        catalog.add_extracted(output_path, payload)
+
+
+def report_payload(payload: Dict[str, object], stats: Dict[str, int]) -> None:
+    stats["processed"] += 1
+    relative = payload["relativePath"]
+    if "error" in payload:
+        stats["scanned_skipped"] += 1
+        EXTRACTED_FILES.inc(outcome="error")
+        print(f"  ! failed to extract: {relative} ({payload['error']})")
+    elif payload["isScanned"]:
+        stats["scanned_skipped"] += 1
+        EXTRACTED_FILES.inc(outcome="scanned")
+        print(f"  ! scanned or empty text: {relative}")
+    else:
+        EXTRACTED_FILES.inc(outcome="text")
+
+
+def extract_parallel(
+    pending: List[Tuple[Path, Path, Path]],
+    stats: Dict[str, int],
+    workers: int,
+    pages_per_task: int,
+    writer: Optional[ShardedJsonlWriter] = None,
+    catalog: Optional[Catalog] = None,
+) -> Dict[int, Dict[str, float]]:
+    worker_stats: Dict[int, Dict[str, float]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        submitted: List[Tuple[Path, Path, Path, Optional[Exception], List["Future[Tuple[List[PageRecord], int, float]]"]]] = []
+        for pdf_path, relative, output_path in pending:
+            try:
+                ranges = plan_page_ranges(pdf_path, pages_per_task)
+            except Exception as exc:
+                submitted.append((pdf_path, relative, output_path, exc, []))
+                continue
+            futures = [executor.submit(extract_page_range, str(pdf_path), start, stop) for start, stop in ranges]
+            submitted.append((pdf_path, relative, output_path, None, futures))
+
+        for pdf_path, relative, output_path, error, futures in submitted:
+            print(f"Extracting {relative}")
+            records: List[PageRecord] = []
+            try:
+                if error is not None:
+                    raise error
+                for future in futures:
+                    page_records, pid, elapsed = future.result()
+                    records.extend(page_records)
+                    entry = worker_stats.setdefault(pid, {"tasks": 0, "pages": 0, "seconds": 0.0})
+                    entry["tasks"] += 1
+                    entry["pages"] += len(page_records)
+                    entry["seconds"] += elapsed
+                    if page_records:
+                        EXTRACT_PAGE_SECONDS.observe(elapsed / len(page_records), count=len(page_records))
+                payload = build_payload(pdf_path, relative, *assemble_pages(records))
+            except Exception as exc:
+                payload = build_error_payload(pdf_path, relative, exc)
+            write_payload(output_path, payload, stats, writer, catalog)
+    return worker_stats
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Extract text from downloaded PDFs")
     parser.add_argument(
@@ -29,6 +297,29 @@ def main() -> None:
         default=None,
         help="Optional subject slug. If set, only process data/pdfs/<subject>.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of extraction processes. 1 keeps the serial single-process mode.",
+    )
+    parser.add_argument(
+        "--pages-per-task",
+        type=int,
+        default=64,
+        help="Parallel mode: books longer than this are split into page ranges across workers",
+    )
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="Re-extract every PDF, even when its hash is unchanged")
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json writes one file per PDF; jsonl appends to sharded files under extracted/.../jsonl",
+    )
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="none", help="jsonl shard compression")
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     script_dir = Path(__file__).resolve().parent
@@ -45,52 +336,83 @@ def main() -> None:
         raise FileNotFoundError(f"Missing {pdf_root}. Run download_pdfs.py first.")
 
     output_root.mkdir(parents=True, exist_ok=True)
+    with start_stage("extract", args, server_root):
+        stats: Dict[str, int] = {"processed": 0, "scanned_skipped": 0}
+        pending: List[Tuple[Path, Path, Path]] = []
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        inputs_by_key: Dict[str, Dict[str, str]] = {}
+        writer: Optional[ShardedJsonlWriter] = None
+        reader: Optional[ShardedJsonlReader] = None
+        if args.output_format == "jsonl":
+            reader = ShardedJsonlReader(output_root / "jsonl")
+            writer = ShardedJsonlWriter(output_root / "jsonl", compression=args.compression)
 
-    stats: Dict[str, int] = {"processed": 0, "scanned_skipped": 0}
-
-    for pdf_path in pdf_root.rglob("*.pdf"):
-        relative = pdf_path.relative_to(pdf_root)
-        output_path = output_root / relative.with_suffix(".json")
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-
-        if output_path.exists():
-            continue
+        for pdf_path in pdf_root.rglob("*.pdf"):
+            relative = pdf_path.relative_to(pdf_root)
+            output_path = output_root / relative.with_suffix(".json")
+            if reader is None:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                exists = output_path.exists()
+            else:
+                exists = record_id(relative) in reader
 
-        print(f"Extracting {relative}")
-        try:
-            text = extract_text(pdf_path)
-        except Exception as exc:
-            payload = {
-                "pdfFile": pdf_path.name,
-                "relativePath": str(relative).replace("\\", "/"),
-                "isScanned": True,
-                "content": "",
-                "error": str(exc),
-            }
-            output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-            stats["processed"] += 1
-            stats["scanned_skipped"] += 1
-            print(f"  ! failed to extract: {relative} ({exc})")
-            continue
-        scanned = detect_scanned(text)
+            key = output_path.relative_to(server_root).as_posix()
+            inputs = {"pdf": manifest.file_digest(pdf_path)}
+            if exists and not args.force:
+                if manifest.get("extract", key) is None:
+                    manifest.record("extract", key, inputs, [output_path] if writer is None else [])
+                    continue
+                if manifest.is_fresh("extract", key, inputs):
+                    continue
+            inputs_by_key[key] = inputs
+            pending.append((pdf_path, relative, output_path))
 
-        payload = {
-            "pdfFile": pdf_path.name,
-            "relativePath": str(relative).replace("\\", "/"),
-            "isScanned": scanned,
-            "content": text,
-        }
-        output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        catalog = open_catalog(args, server_root)
+        started = time.perf_counter()
+        if args.workers > 1:
+            worker_stats = extract_parallel(pending, stats, args.workers, args.pages_per_task, writer, catalog)
+            elapsed = time.perf_counter() - started
+            for pid, entry in sorted(worker_stats.items()):
+                rate = entry["pages"] / entry["seconds"] if entry["seconds"] else 0.0
+                print(
+                    f"  worker {pid}: tasks={int(entry['tasks'])}, pages={int(entry['pages'])}, "
+                    f"busy={entry['seconds']:.1f}s, {rate:.1f} pages/s"
+                )
+            total_pages = sum(entry["pages"] for entry in worker_stats.values())
+            if elapsed and total_pages:
+                print(f"  throughput: {total_pages / elapsed:.1f} pages/s over {elapsed:.1f}s wall")
+        else:
+            for pdf_path, relative, output_path in pending:
+                print(f"Extracting {relative}")
+                with TRACER.span("extract_pdf", file=relative.as_posix()):
+                    try:
+                        if writer is None:
+                            # One page in memory at a time; the JSON file is written as pages are read.
+                            payload = stream_payload(pdf_path, relative, output_path)
+                            report_payload(payload, stats)
+                            if catalog is not None:
+                                catalog.add_extracted(output_path, payload)
+                            continue
+                        payload = build_payload(pdf_path, relative, *assemble_pages(list(timed_pages(iter_pages(pdf_path)))))
+                    except Exception as exc:
+                        payload = build_error_payload(pdf_path, relative, exc)
+                    write_payload(output_path, payload, stats, writer, catalog)
 
-        stats["processed"] += 1
-        if scanned:
-            stats["scanned_skipped"] += 1
-            print(f"  ! scanned or empty text: {relative}")
+        if writer is not None:
+            writer.close()
+        if catalog is not None:
+            catalog.close()
+        for _, _, output_path in pending:
+            key = output_path.relative_to(server_root).as_posix()
+            manifest.record("extract", key, inputs_by_key[key], [output_path] if writer is None else [])
+        manifest.save()
 
-    print(
-        f"Done. Extracted {stats['processed']} files, "
-        f"scanned/empty detected: {stats['scanned_skipped']}"
-    )
+        if stats["processed"]:
+            SCANNED_RATIO.set(stats["scanned_skipped"] / stats["processed"])
+        print(
+            f"Done. Extracted {stats['processed']} files, "
+            f"scanned/empty detected: {stats['scanned_skipped']}"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,378 @@
+import re
+from html import unescape
+from typing import Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+except ImportError:  # optional dependency, only needed for --html-parser lxml
+    etree = None
+
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError:  # optional dependency, only needed for --html-parser selectolax
+    SelectolaxParser = None
+
+
+CARD_TAGS = ("article", "div", "li")
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "strong")
+# BeautifulSoup leaves the contents of these tags out of get_text(); the fast backends do the same.
+SKIPPED_TEXT_TAGS = ("script", "style", "template")
+BACKENDS = ("auto", "bs4", "lxml", "selectolax")
+# libxml2 and lexbor keep <title> as raw text while html.parser parses markup inside it,
+# so the fast backends re-parse the raw title source the way BeautifulSoup sees it.
+RAW_TITLE = re.compile(r"<title\b([^>]*)>(.*?)(?:</title\s*>|\Z)", re.IGNORECASE | re.DOTALL)
+# html.parser builds the tree straight from the source tags: an element stays open until its own end tag,
+# end tags with nothing to close are dropped (splitting the text around them) and nothing is implied.
+# libxml2 and lexbor repair the same markup (an unclosed <li> or <p> closed early, a nested <a> or a table
+# moved out of a link, ...), which changes link texts and card headings. The fast backends compare their
+# tree with the source tags and hand pages that do not match to BeautifulSoup.
+UNPARSED_MARKUP = re.compile(
+    r"<!--.*?(?:-->|\Z)|<[!?][^>]*>|<(script|style)\b[^>]*(?<!/)>.*?(?:</\1\s*>|\Z)", re.IGNORECASE | re.DOTALL
+)
+TAG = re.compile(r"<(/?)([a-zA-Z][^\s/>]*)((?:\"[^\"]*\"|'[^']*'|[^'\">])*)>")
+# Elements BeautifulSoup closes as soon as they open.
+VOID_TAGS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image", "img", "input",
+    "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+}
+UNPARSED_TAGS = ("script", "style")
+# libxml2 and lexbor keep markup inside these as text, html.parser parses it.
+TEXT_ONLY_TAGS = ("title", "textarea")
+# Implied by libxml2 and lexbor, and moved around by them; their contents are still compared.
+DOCUMENT_TAGS = ("html", "head", "body")
+
+
+def _join_strings(strings: Iterator[str]) -> str:
+    return " ".join(stripped for stripped in (text.strip() for text in strings) if stripped)
+
+
+def _raw_title(html: str) -> Optional[str]:
+    match = RAW_TITLE.search(UNPARSED_MARKUP.sub(" ", html))
+    if match is None:
+        return None
+    # html.parser reads <title/> as an empty title.
+    return "" if match.group(1).rstrip().endswith("/") else match.group(2)
+
+
+def _add_text(shape: List[str], text: Optional[str]) -> None:
+    # "#" marks a run of visible text; comments and skipped elements inside it do not split it.
+    if text and text.strip() and (not shape or shape[-1] != "#"):
+        shape.append("#")
+
+
+def _source_shape(html: str) -> Optional[List[str]]:
+    # Start ("div") and end ("/div") tags and text runs in the order html.parser nests them,
+    # None if it drops an end tag.
+    shape: List[str] = []
+    stack: List[str] = []
+    source = UNPARSED_MARKUP.sub(" ", html)
+    position = 0
+    for match in TAG.finditer(source):
+        text = source[position:match.start()]
+        _add_text(shape, unescape(text) if "&" in text else text)
+        position = match.end()
+        closing, name = match.group(1), match.group(2).lower()
+        if closing:
+            if name not in stack:
+                return None
+            while True:
+                open_tag = stack.pop()
+                if open_tag not in DOCUMENT_TAGS:
+                    shape.append("/" + open_tag)
+                if open_tag == name:
+                    break
+        elif name in DOCUMENT_TAGS:
+            # Inside content html.parser nests them like any element, libxml2 and lexbor drop them.
+            if name in stack or any(open_tag not in DOCUMENT_TAGS for open_tag in stack):
+                return None
+            stack.append(name)
+        elif name in VOID_TAGS or match.group(3).rstrip().endswith("/"):
+            shape.extend((name, "/" + name))
+        else:
+            stack.append(name)
+            shape.append(name)
+    text = source[position:]
+    _add_text(shape, unescape(text) if "&" in text else text)
+    shape.extend("/" + name for name in reversed(stack) if name not in DOCUMENT_TAGS)
+    return shape
+
+
+def _compared_tag(tag: object) -> bool:
+    # Elements only (not comments or text nodes), minus the ones the source scan leaves out.
+    return isinstance(tag, str) and tag[:1].isalpha() and tag not in DOCUMENT_TAGS and tag not in UNPARSED_TAGS
+
+
+class Anchor:
+    __slots__ = ("href",)
+
+    def __init__(self, href: str) -> None:
+        self.href = href
+
+    def text(self) -> str:
+        raise NotImplementedError
+
+    def card_heading(self) -> Optional[str]:
+        raise NotImplementedError
+
+
+class Document:
+    def anchors(self) -> Iterator[Anchor]:
+        raise NotImplementedError
+
+    def title(self) -> Optional[str]:
+        raise NotImplementedError
+
+
+class HtmlBackend:
+    name = ""
+
+    def parse(self, html: str) -> Document:
+        raise NotImplementedError
+
+
+class SoupAnchor(Anchor):
+    __slots__ = ("node",)
+
+    def __init__(self, node) -> None:
+        super().__init__(node["href"])
+        self.node = node
+
+    def text(self) -> str:
+        return self.node.get_text(" ", strip=True)
+
+    def card_heading(self) -> Optional[str]:
+        card = self.node.find_parent(list(CARD_TAGS))
+        if not card:
+            return None
+        heading = card.find(list(HEADING_TAGS))
+        return heading.get_text(" ", strip=True) if heading else None
+
+
+class SoupDocument(Document):
+    def __init__(self, html: str) -> None:
+        self.soup = BeautifulSoup(html, "html.parser")
+
+    def anchors(self) -> Iterator[Anchor]:
+        for node in self.soup.find_all("a", href=True):
+            yield SoupAnchor(node)
+
+    def title(self) -> Optional[str]:
+        return self.soup.title.get_text(" ", strip=True) if self.soup.title else None
+
+
+class SoupBackend(HtmlBackend):
+    name = "bs4"
+
+    def parse(self, html: str) -> Document:
+        return SoupDocument(html)
+
+
+if etree is not None:
+    LXML_ANCHORS = etree.XPath("//a[@href]")
+    LXML_CARD = etree.XPath("ancestor::*[" + " or ".join(f"self::{tag}" for tag in CARD_TAGS) + "][1]")
+    LXML_HEADING = etree.XPath("(descendant::*[" + " or ".join(f"self::{tag}" for tag in HEADING_TAGS) + "])[1]")
+    LXML_TEXT = etree.XPath(
+        "descendant-or-self::text()[not("
+        + " or ".join(f"ancestor::{tag}" for tag in SKIPPED_TEXT_TAGS)
+        + ")]"
+    )
+
+
+def _lxml_text(node) -> str:
+    return _join_strings(iter(LXML_TEXT(node)))
+
+
+def _lxml_shape(root) -> List[str]:
+    shape: List[str] = []
+    for event, node in etree.iterwalk(root, events=("start", "end")):
+        compared = _compared_tag(node.tag)
+        if event == "start":
+            if compared:
+                shape.append(node.tag)
+            if isinstance(node.tag, str) and node.tag not in UNPARSED_TAGS:
+                _add_text(shape, node.text)
+            if node.tag in TEXT_ONLY_TAGS and "<" in (node.text or ""):
+                shape.append("<")
+        else:
+            if compared:
+                shape.append("/" + node.tag)
+            _add_text(shape, node.tail)
+    return shape
+
+
+class LxmlAnchor(Anchor):
+    __slots__ = ("node",)
+
+    def __init__(self, node) -> None:
+        super().__init__(node.get("href"))
+        self.node = node
+
+    def text(self) -> str:
+        return _lxml_text(self.node)
+
+    def card_heading(self) -> Optional[str]:
+        cards = LXML_CARD(self.node)
+        if not cards:
+            return None
+        headings = LXML_HEADING(cards[0])
+        return _lxml_text(headings[0]) if headings else None
+
+
+class LxmlDocument(Document):
+    def __init__(self, html: str) -> None:
+        self.html = html
+        self.root = etree.fromstring(html, etree.HTMLParser()) if html.strip() else None
+
+    def anchors(self) -> Iterator[Anchor]:
+        if self.root is None:
+            return
+        for node in LXML_ANCHORS(self.root):
+            yield LxmlAnchor(node)
+
+    def title(self) -> Optional[str]:
+        raw = _raw_title(self.html)
+        if raw is None or not raw.strip():
+            return raw and raw.strip()
+        fragment = etree.fromstring(f"<html><body><div>{raw}</div></body></html>", etree.HTMLParser())
+        return _lxml_text(fragment.find("body/div"))
+
+
+class LxmlBackend(HtmlBackend):
+    name = "lxml"
+
+    def __init__(self) -> None:
+        if etree is None:
+            raise RuntimeError("the lxml HTML backend requires the 'lxml' package (pip install lxml)")
+
+    def parse(self, html: str) -> Document:
+        document = LxmlDocument(html)
+        if document.root is not None and _lxml_shape(document.root) != _source_shape(html):
+            return SoupDocument(html)
+        return document
+
+
+def _selectolax_text(node) -> str:
+    strings: List[str] = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.tag == "-text":
+            strings.append(current.text_content or "")
+            continue
+        if current is not node and current.tag in SKIPPED_TEXT_TAGS:
+            continue
+        children = []
+        child = current.child
+        while child is not None:
+            children.append(child)
+            child = child.next
+        stack.extend(reversed(children))
+    return _join_strings(iter(strings))
+
+
+def _selectolax_shape(root) -> List[str]:
+    shape: List[str] = []
+    stack = [(root, False)]
+    while stack:
+        node, closing = stack.pop()
+        if closing:
+            shape.append("/" + node.tag)
+            continue
+        if node.tag == "-text":
+            _add_text(shape, node.text_content)
+            if node.parent is not None and node.parent.tag in TEXT_ONLY_TAGS and "<" in (node.text_content or ""):
+                shape.append("<")
+            continue
+        if _compared_tag(node.tag):
+            shape.append(node.tag)
+            stack.append((node, True))
+        elif node.tag in UNPARSED_TAGS:
+            continue
+        children = []
+        child = node.child
+        while child is not None:
+            children.append(child)
+            child = child.next
+        stack.extend((child, False) for child in reversed(children))
+    return shape
+
+
+class SelectolaxAnchor(Anchor):
+    __slots__ = ("node",)
+
+    def __init__(self, node) -> None:
+        super().__init__(node.attributes.get("href") or "")
+        self.node = node
+
+    def text(self) -> str:
+        return _selectolax_text(self.node)
+
+    def card_heading(self) -> Optional[str]:
+        card = self.node.parent
+        while card is not None and card.tag not in CARD_TAGS:
+            card = card.parent
+        if card is None:
+            return None
+        heading = card.css_first(", ".join(HEADING_TAGS))
+        return _selectolax_text(heading) if heading is not None else None
+
+
+class SelectolaxDocument(Document):
+    def __init__(self, html: str) -> None:
+        self.html = html
+        self.tree = SelectolaxParser(html)
+
+    def anchors(self) -> Iterator[Anchor]:
+        for node in self.tree.css("a[href]"):
+            yield SelectolaxAnchor(node)
+
+    def title(self) -> Optional[str]:
+        raw = _raw_title(self.html)
+        if raw is None or not raw.strip():
+            return raw and raw.strip()
+        fragment = SelectolaxParser(f"<html><body><div>{raw}</div></body></html>").css_first("body > div")
+        return _selectolax_text(fragment)
+
+
+class SelectolaxBackend(HtmlBackend):
+    name = "selectolax"
+
+    def __init__(self) -> None:
+        if SelectolaxParser is None:
+            raise RuntimeError("the selectolax HTML backend requires the 'selectolax' package (pip install selectolax)")
+
+    def parse(self, html: str) -> Document:
+        document = SelectolaxDocument(html)
+        if document.tree.root is not None and _selectolax_shape(document.tree.root) != _source_shape(html):
+            return SoupDocument(html)
+        return document
+
+
+BACKEND_CLASSES = {"bs4": SoupBackend, "lxml": LxmlBackend, "selectolax": SelectolaxBackend}
+_BACKENDS: Dict[str, HtmlBackend] = {}
+_DEFAULT = ["auto"]
+
+
+def resolve_backend_name(name: str) -> str:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown HTML backend: {name} (expected one of {', '.join(BACKENDS)})")
+    if name != "auto":
+        return name
+    return "lxml" if etree is not None else "bs4"
+
+
+def get_backend(name: Optional[str] = None) -> HtmlBackend:
+    resolved = resolve_backend_name(name or _DEFAULT[0])
+    backend = _BACKENDS.get(resolved)
+    if backend is None:
+        backend = BACKEND_CLASSES[resolved]()
+        _BACKENDS[resolved] = backend
+    return backend
+
+
+def set_default_backend(name: str) -> HtmlBackend:
+    backend = get_backend(name)
+    _DEFAULT[0] = backend.name
+    return backend
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from http_client import USER_AGENT
+
+
+CACHE_MODES = ("default", "offline", "refresh")
+
+
+class CacheMiss(Exception):
+    pass
+
+
+@dataclass
+class CachedPage:
+    url: str
+    text: str
+    sha256: str
+    status: str
+
+
+class HttpCache:
+    def __init__(
+        self,
+        root: Path,
+        mode: str = "default",
+        fresh_for: float = 0.0,
+        ttl: float = 30 * 24 * 3600,
+        max_entries: int = 5000,
+    ) -> None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f"unknown cache mode: {mode}")
+        self.root = root
+        self.mode = mode
+        self.fresh_for = fresh_for
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats: Dict[str, int] = {"fresh": 0, "revalidated": 0, "fetched": 0, "replayed": 0, "reused": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = self.root / key[:2]
+        return folder / f"{key}.json", folder / f"{key}.body"
+
+    def _load(self, url: str) -> Optional[Dict[str, object]]:
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))
+        except ValueError:
+            return None
+
+    def _write_meta(self, url: str, meta: Dict[str, object]) -> None:
+        meta_path, _ = self._paths(url)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = meta_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, meta_path)
+
+    def _read_body(self, url: str) -> str:
+        _, body_path = self._paths(url)
+        return body_path.read_text(encoding="utf-8")
+
+    def _hit(self, url: str, meta: Dict[str, object], status: str, **updates: object) -> CachedPage:
+        meta.update(updates)
+        meta["lastAccess"] = time.time()
+        with self._lock:
+            self._write_meta(url, meta)
+            self.stats[status] += 1
+        return CachedPage(url=url, text=self._read_body(url), sha256=str(meta["sha256"]), status=status)
+
+    def _store(self, url: str, response: requests.Response) -> CachedPage:
+        text = response.text
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        meta_path, body_path = self._paths(url)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        previous = self._load(url) or {}
+        if previous.get("sha256") != digest or not body_path.exists():
+            tmp_path = body_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_text(text, encoding="utf-8")
+            os.replace(tmp_path, body_path)
+        now = time.time()
+        meta = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "lastModified": response.headers.get("last-modified"),
+            "sha256": digest,
+            "size": len(text),
+            "storedAt": now,
+            "validatedAt": now,
+            "lastAccess": now,
+            "derived": previous.get("derived", {}) if previous.get("sha256") == digest else {},
+        }
+        with self._lock:
+            self._write_meta(url, meta)
+            self.stats["fetched"] += 1
+        return CachedPage(url=url, text=text, sha256=digest, status="fetched")
+
+    def fetch(self, url: str, session: Optional[requests.Session] = None, timeout: float = 25) -> CachedPage:
+        meta = self._load(url)
+        if self.mode == "offline":
+            if meta is None:
+                with self._lock:
+                    self.stats["misses"] += 1
+                raise CacheMiss(f"not cached: {url}")
+            return self._hit(url, meta, "replayed")
+
+        now = time.time()
+        if meta is not None and self.mode != "refresh":
+            if now - float(meta.get("validatedAt", 0)) < self.fresh_for:
+                return self._hit(url, meta, "fresh")
+
+        headers = {"User-Agent": USER_AGENT}
+        if meta is not None and self.mode != "refresh":
+            if meta.get("etag"):
+                headers["If-None-Match"] = str(meta["etag"])
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = str(meta["lastModified"])
+
+        client = session or requests
+        response = client.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and meta is not None:
+            return self._hit(url, meta, "revalidated", validatedAt=now)
+        response.raise_for_status()
+        return self._store(url, response)
+
+    def peek(self, url: str) -> Optional[CachedPage]:
+        # The stored copy without any request, for pages discovery already knows to be unchanged.
+        meta = self._load(url)
+        if meta is None:
+            return None
+        return self._hit(url, meta, "reused")
+
+    def get_derived(self, page: CachedPage, name: str) -> Optional[object]:
+        meta = self._load(page.url)
+        if meta is None or meta.get("sha256") != page.sha256:
+            return None
+        return meta.get("derived", {}).get(name)  # type: ignore[union-attr]
+
+    def set_derived(self, page: CachedPage, name: str, value: object) -> None:
+        with self._lock:
+            meta = self._load(page.url)
+            if meta is None or meta.get("sha256") != page.sha256:
+                return
+            meta.setdefault("derived", {})[name] = value  # type: ignore[index]
+            self._write_meta(page.url, meta)
+
+    def prune(self) -> int:
+        if not self.root.exists():
+            return 0
+        now = time.time()
+        entries: List[Tuple[float, Path]] = []
+        removed = 0
+        for meta_path in self.root.glob("*/*.json"):
+            try:
+                last_access = float(json.loads(meta_path.read_text(encoding="utf-8")).get("lastAccess", 0))
+            except ValueError:
+                last_access = 0.0
+            if now - last_access > self.ttl:
+                removed += self._evict(meta_path)
+            else:
+                entries.append((last_access, meta_path))
+        entries.sort(reverse=True)
+        for _, meta_path in entries[self.max_entries:]:
+            removed += self._evict(meta_path)
+        return removed
+
+    def _evict(self, meta_path: Path) -> int:
+        meta_path.with_suffix(".body").unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+        return 1
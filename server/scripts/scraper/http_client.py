@@ -0,0 +1,41 @@
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36"
+)
+
+
+def build_session(pool_size: int = 10, user_agent: Optional[str] = None) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = user_agent or USER_AGENT
+    return session
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class HostSemaphores:
+    def __init__(self, per_host: int = 2) -> None:
+        self.per_host = max(1, per_host)
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def for_url(self, url: str) -> threading.BoundedSemaphore:
+        host = host_of(url)
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+        return semaphore
@@ -0,0 +1,167 @@
+import json
+import os
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for --compression zstd
+    zstandard = None
+
+
+INDEX_NAME = "index.jsonl"
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+COMPRESSIONS = ("none", "zstd")
+
+
+def shard_suffix(compression: str) -> str:
+    return ".jsonl.zst" if compression == "zstd" else ".jsonl"
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+
+
+class ShardedJsonlWriter:
+    def __init__(
+        self,
+        root: Path,
+        compression: str = "none",
+        shard_bytes: int = DEFAULT_SHARD_BYTES,
+        fsync: bool = True,
+    ) -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression: {compression}")
+        if compression == "zstd":
+            _require_zstd()
+        self.root = root
+        self.compression = compression
+        self.shard_bytes = shard_bytes
+        self.fsync = fsync
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._compressor = zstandard.ZstdCompressor() if compression == "zstd" else None
+        self._shard_index = self._next_shard_index()
+        self._handle: Optional[BinaryIO] = None
+        self._shard_name = ""
+        self._offset = 0
+        self._pending_index: List[str] = []
+        self.records_written = 0
+
+    def _next_shard_index(self) -> int:
+        existing = [path.name.split(".")[0] for path in self.root.glob("shard-*.jsonl*")]
+        numbers = [int(name.split("-")[1]) for name in existing if name.split("-")[1].isdigit()]
+        return max(numbers, default=-1) + 1
+
+    def _open_shard(self) -> BinaryIO:
+        self._close_shard()
+        self._shard_name = f"shard-{self._shard_index:05d}{shard_suffix(self.compression)}"
+        self._shard_index += 1
+        self._offset = 0
+        self._handle = (self.root / self._shard_name).open("ab")
+        return self._handle
+
+    def _close_shard(self) -> None:
+        if self._handle is None:
+            return
+        self._handle.flush()
+        if self.fsync:
+            os.fsync(self._handle.fileno())
+        self._handle.close()
+        self._handle = None
+        self._flush_index()
+
+    def _flush_index(self) -> None:
+        if not self._pending_index:
+            return
+        with (self.root / INDEX_NAME).open("a", encoding="utf-8") as index:
+            index.write("".join(self._pending_index))
+            index.flush()
+            if self.fsync:
+                os.fsync(index.fileno())
+        self._pending_index = []
+
+    def write(self, record_id: str, record: Dict[str, object]) -> None:
+        data = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        handle = self._handle
+        if handle is None or (self._offset and self._offset + len(data) > self.shard_bytes):
+            handle = self._open_shard()
+        handle.write(data)
+        entry = {"id": record_id, "shard": self._shard_name, "offset": self._offset, "length": len(data)}
+        self._pending_index.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._offset += len(data)
+        self.records_written += 1
+
+    def close(self) -> None:
+        self._close_shard()
+
+    def __enter__(self) -> "ShardedJsonlWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class ShardedJsonlReader:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.index: Dict[str, Tuple[str, int, int]] = {}
+        self._decompressor = None
+        index_path = root / INDEX_NAME
+        if index_path.exists():
+            with index_path.open(encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.index[entry["id"]] = (entry["shard"], int(entry["offset"]), int(entry["length"]))
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (root / INDEX_NAME).exists()
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _decode(self, shard: str, data: bytes) -> Dict[str, object]:
+        if shard.endswith(".zst"):
+            _require_zstd()
+            if self._decompressor is None:
+                self._decompressor = zstandard.ZstdDecompressor()
+            data = self._decompressor.decompress(data)
+        return json.loads(data.decode("utf-8"))
+
+    def get(self, record_id: str) -> Dict[str, object]:
+        shard, offset, length = self.index[record_id]
+        with (self.root / shard).open("rb") as handle:
+            handle.seek(offset)
+            return self._decode(shard, handle.read(length))
+
+    def read_raw(self, record_id: str) -> bytes:
+        shard, offset, length = self.index[record_id]
+        with (self.root / shard).open("rb") as handle:
+            handle.seek(offset)
+            return handle.read(length)
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict[str, object]]]:
+        ordered = sorted(self.index.items(), key=lambda item: (item[1][0], item[1][1]))
+        handle: Optional[BinaryIO] = None
+        current = ""
+        try:
+            for record_id, (shard, offset, length) in ordered:
+                if shard != current:
+                    if handle is not None:
+                        handle.close()
+                    handle = (self.root / shard).open("rb")
+                    current = shard
+                if handle.tell() != offset:
+                    handle.seek(offset)
+                yield record_id, self._decode(shard, handle.read(length))
+        finally:
+            if handle is not None:
+                handle.close()
@@ -0,0 +1,376 @@
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chunker import Chunker
+from corpus import iter_structured
+from embed_documents import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP_TOKENS, WORD, document_chunks, fold
+from manifest import Manifest, default_manifest_path, sha256_text
+from metrics import TRACER, add_metrics_arguments, start_stage
+from structure_content import SUBJECT_LABELS, to_subject_slug
+
+
+INDEX_VERSION = 1
+HEADER_NAME = "index.json"
+DOCS_NAME = "docs.jsonl"
+SHARD_MAGIC = b"LXI1"
+NO_CHAPTER = "_"
+FACETS = ("subject", "chapter", "year", "zone")
+SUBJECT_SLUGS = {label: slug for slug, label in SUBJECT_LABELS.items()}
+
+# Accent-folded, so "à", "été" and "où" are listed as "a", "ete" and "ou".
+STOPWORDS = frozenset(
+    """
+    a au aux avec ce ces cet cette dans de des du elle en est et etre il ils je la le les leur lui ma mais me
+    meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes toi ton
+    tu un une vos votre vous y c d j l m n s t
+    an and are as at be by for from has have in is it its of on or that the this to was were which with
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in WORD.findall(fold(text)) if token not in STOPWORDS]
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data: Sequence[int]) -> List[int]:
+    values: List[int] = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    return values
+
+
+def encode_postings(postings: Sequence[Tuple[int, int]]) -> bytes:
+    # (row, tf) pairs sorted by row; rows are stored as gaps from the previous one.
+    out = bytearray()
+    previous = 0
+    for row, tf in postings:
+        encode_varint(row - previous, out)
+        encode_varint(tf, out)
+        previous = row
+    return bytes(out)
+
+
+def decode_postings(data: Sequence[int]) -> List[Tuple[int, int]]:
+    values = decode_varints(data)
+    postings: List[Tuple[int, int]] = []
+    row = 0
+    for index in range(0, len(values), 2):
+        row += values[index]
+        postings.append((row, values[index + 1]))
+    return postings
+
+
+def shard_key(subject: str, chapter: Optional[str]) -> str:
+    return f"{subject}/{chapter or NO_CHAPTER}"
+
+
+def document_subject(doc_id: str, document: Dict[str, object]) -> str:
+    label = str(document.get("subject") or "")
+    return SUBJECT_SLUGS.get(label) or to_subject_slug(label) or doc_id.split("/", 1)[0]
+
+
+def write_shard(path: Path, postings: Dict[str, List[Tuple[int, int]]], docs: int, length: int) -> None:
+    # Layout: magic, uint32 header size, JSON term dictionary, then the concatenated postings lists.
+    terms: Dict[str, List[int]] = {}
+    blob = bytearray()
+    for term in sorted(postings):
+        encoded = encode_postings(postings[term])
+        terms[term] = [len(blob), len(encoded), len(postings[term])]
+        blob.extend(encoded)
+    header = json.dumps({"docs": docs, "length": length, "terms": terms}, ensure_ascii=False, separators=(",", ":"))
+    header_bytes = header.encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as handle:
+        handle.write(SHARD_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        handle.write(blob)
+
+
+class Shard:
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as handle:
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != SHARD_MAGIC:
+            raise ValueError(f"not a lexical index shard: {path}")
+        (header_size,) = struct.unpack("<I", self.data[4:8])
+        header = json.loads(self.data[8:8 + header_size].decode("utf-8"))
+        self.base = 8 + header_size
+        self.docs = int(header["docs"])
+        self.length = int(header["length"])
+        self.terms: Dict[str, List[int]] = header["terms"]
+
+    def df(self, term: str) -> int:
+        entry = self.terms.get(term)
+        return entry[2] if entry else 0
+
+    def postings(self, term: str) -> List[Tuple[int, int]]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+        offset, size, _ = entry
+        return decode_postings(self.data[self.base + offset:self.base + offset + size])
+
+
+class LexicalIndex:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.header = json.loads((root / HEADER_NAME).read_text(encoding="utf-8"))
+        with (root / DOCS_NAME).open(encoding="utf-8") as handle:
+            self.docs = [json.loads(line) for line in handle]
+        self.k1 = float(self.header["k1"])
+        self.b = float(self.header["b"])
+        self.shards: Dict[str, Shard] = {}
+
+    def shard(self, key: str) -> Shard:
+        if key not in self.shards:
+            self.shards[key] = Shard(self.root / str(self.header["shards"][key]["file"]))
+        return self.shards[key]
+
+    def select_shards(self, subject: Optional[str], chapter: Optional[str]) -> List[str]:
+        selected = []
+        for key in self.header["shards"]:
+            shard_subject, shard_chapter = key.split("/", 1)
+            if subject and shard_subject != subject:
+                continue
+            if chapter and shard_chapter != chapter:
+                continue
+            selected.append(key)
+        return selected
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        subject: Optional[str] = None,
+        chapter: Optional[str] = None,
+        year: Optional[int] = None,
+        zone: Optional[str] = None,
+    ) -> List[Dict[str, object]]:
+        terms = set(tokenize(query))
+        shards = [self.shard(key) for key in self.select_shards(subject, chapter)]
+        docs = sum(shard.docs for shard in shards)
+        if not terms or not docs:
+            return []
+        # Statistics come from the selected shards, so a subject filter also gets subject-local idf.
+        average_length = sum(shard.length for shard in shards) / docs
+        scores: Dict[int, float] = {}
+        for term in terms:
+            df = sum(shard.df(term) for shard in shards)
+            if not df:
+                continue
+            idf = math.log(1.0 + (docs - df + 0.5) / (df + 0.5))
+            for shard in shards:
+                for row, tf in shard.postings(term):
+                    norm = self.k1 * (1.0 - self.b + self.b * self.docs[row]["length"] / average_length)
+                    scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        def allowed(row: int) -> bool:
+            doc = self.docs[row]
+            return (year is None or doc.get("year") == year) and (zone is None or doc.get("zone") == zone)
+
+        ranked = heapq.nlargest(top_k, (item for item in scores.items() if allowed(item[0])), key=lambda item: item[1])
+        return [{**self.docs[row], "score": round(score, 4)} for row, score in ranked]
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        return self.header["facets"]
+
+
+def build_index(
+    output_dir: Path,
+    documents: Iterable[Tuple[str, Dict[str, object]]],
+    chunker: Chunker,
+    max_tokens: int,
+    k1: float,
+    b: float,
+) -> Dict[str, int]:
+    shard_postings: Dict[str, Dict[str, List[Tuple[int, int]]]] = {}
+    shard_sizes: Dict[str, List[int]] = {}
+    facets: Dict[str, Dict[str, int]] = {facet: {} for facet in FACETS}
+    tmp_dir = output_dir.with_name(f"{output_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    row = 0
+    with (tmp_dir / DOCS_NAME).open("w", encoding="utf-8") as docs_file:
+        for doc_id, document in documents:
+            subject = document_subject(doc_id, document)
+            key = shard_key(subject, document.get("chapter"))  # type: ignore[arg-type]
+            postings = shard_postings.setdefault(key, {})
+            sizes = shard_sizes.setdefault(key, [0, 0])
+            title_tokens = tokenize(str(document.get("title") or ""))
+            for record in document_chunks(doc_id, document, chunker, max_tokens):
+                # Titles are repeated on every chunk, the way the embedder sees them through the sidecar.
+                tokens = title_tokens + tokenize(record.text)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    postings.setdefault(token, []).append((row, tf))
+                sizes[0] += 1
+                sizes[1] += len(tokens)
+                entry = {
+                    "row": row,
+                    "id": record.chunk_id,
+                    "docId": doc_id,
+                    "chunkIndex": record.index,
+                    "title": record.meta.get("title"),
+                    "subject": subject,
+                    "sourceType": record.meta.get("sourceType"),
+                    "chapter": record.meta.get("chapter"),
+                    "year": record.meta.get("year"),
+                    "zone": record.meta.get("zone"),
+                    "length": len(tokens),
+                }
+                for facet in FACETS:
+                    if entry[facet] is not None:
+                        values = facets[facet]
+                        values[str(entry[facet])] = values.get(str(entry[facet]), 0) + 1
+                docs_file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                row += 1
+
+    shards: Dict[str, Dict[str, object]] = {}
+    for key, postings in sorted(shard_postings.items()):
+        docs, length = shard_sizes[key]
+        file_name = f"shards/{key}.lxi"
+        with TRACER.span("write_shard", shard=key, terms=len(postings)):
+            write_shard(tmp_dir / file_name, postings, docs, length)
+        shards[key] = {"file": file_name, "docs": docs, "length": length, "terms": len(postings)}
+
+    header = {
+        "version": INDEX_VERSION,
+        "tokenizer": "folded-words",
+        "k1": k1,
+        "b": b,
+        "count": row,
+        "averageLength": round(sum(size[1] for size in shard_sizes.values()) / row, 3) if row else 0.0,
+        "shards": shards,
+        "facets": facets,
+        "createdAt": int(time.time()),
+    }
+    (tmp_dir / HEADER_NAME).write_text(json.dumps(header, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Swap the whole directory so a reader never sees shards from two different builds.
+    old_dir = output_dir.with_name(f"{output_dir.name}.old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if output_dir.exists():
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return {"chunks": row, "shards": len(shards), "terms": sum(len(postings) for postings in shard_postings.values())}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build or query the BM25 inverted index over structured documents")
+    parser.add_argument(
+        "--subject",
+        default=None,
+        help="Optional subject slug. If set, indexes raw/<subject> into lexical_index/<subject> (or filters --query).",
+    )
+    parser.add_argument("--query", default=None, help="Search the existing index instead of building it")
+    parser.add_argument("--top-k", type=int, default=10, help="Number of results printed by --query")
+    parser.add_argument("--chapter", default=None, help="With --query: only search this chapter shard")
+    parser.add_argument("--year", type=int, default=None, help="With --query: only return chunks from this year")
+    parser.add_argument("--zone", default=None, help="With --query: only return chunks from this zone")
+    parser.add_argument("--k1", type=float, default=1.2, help="BM25 term frequency saturation")
+    parser.add_argument("--b", type=float, default=0.75, help="BM25 length normalization")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="Token budget per indexed chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=DEFAULT_OVERLAP_TOKENS, help="Tokens shared by neighbour chunks")
+    parser.add_argument(
+        "--tokenizer",
+        default="approx",
+        help="Tokenizer used for chunk budgets: approx, whitespace, tiktoken:<encoding> or hf:<tokenizer.json>",
+    )
+    parser.add_argument("--output-dir", default=None, help="Index directory (default: data/lexical_index/<subject or all>)")
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="Rebuild the index even if no document changed")
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def run_query(index_dir: Path, args: argparse.Namespace, subject_slug: Optional[str]) -> None:
+    if not (index_dir / HEADER_NAME).exists():
+        raise FileNotFoundError(f"Missing {index_dir / HEADER_NAME}. Run lexical_index.py without --query first.")
+    started = time.perf_counter()
+    index = LexicalIndex(index_dir)
+    loaded = time.perf_counter()
+    hits = index.search(args.query, args.top_k, subject_slug, args.chapter, args.year, args.zone)
+    searched = time.perf_counter()
+    for rank, hit in enumerate(hits, start=1):
+        print(f"{rank:>3}. {hit['score']:>8.3f}  {hit['id']}  ({hit['title']})")
+    print(f"{len(hits)} results in {(searched - loaded) * 1000:.1f}ms (index loaded in {(loaded - started) * 1000:.1f}ms)")
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    subject_slug = to_subject_slug(args.subject) if args.subject else None
+    raw_root = server_root / "data" / "raw"
+    index_root = server_root / "data" / "lexical_index"
+    output_dir = Path(args.output_dir) if args.output_dir else index_root / (subject_slug or "all")
+
+    if args.query is not None:
+        if not args.output_dir and subject_slug and not (output_dir / HEADER_NAME).exists():
+            output_dir = index_root / "all"
+        run_query(output_dir, args, subject_slug)
+        return
+
+    if not raw_root.exists():
+        raise FileNotFoundError("Missing server/data/raw. Run structure_content.py first.")
+    with start_stage("index", args, server_root):
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        documents = list(iter_structured(raw_root, subject_slug))
+        sources = sorted({str(path) for _, path, _ in documents})
+        inputs = {
+            "documents": sha256_text(json.dumps([[path, manifest.file_digest(Path(path))] for path in sources])),
+            "bm25": f"{args.k1}:{args.b}",
+            "chunker": f"{args.tokenizer}:{args.max_tokens}:{args.overlap_tokens}",
+        }
+        key = output_dir.resolve().as_posix()
+        if not args.force and manifest.is_fresh("index", key, inputs):
+            manifest.save()
+            print(f"Lexical index up to date: {output_dir}")
+            return
+
+        chunker = Chunker(args.tokenizer, args.overlap_tokens)
+        started = time.perf_counter()
+        stats = build_index(
+            output_dir,
+            ((doc_id, load_document()) for doc_id, _, load_document in documents),
+            chunker,
+            args.max_tokens,
+            args.k1,
+            args.b,
+        )
+        elapsed = time.perf_counter() - started
+
+        manifest.record("index", key, inputs, [output_dir / HEADER_NAME, output_dir / DOCS_NAME])
+        manifest.save()
+        print(
+            f"Done. Indexed {stats['chunks']} chunks from {len(documents)} documents into {stats['shards']} shards "
+            f"({stats['terms']} shard terms) in {elapsed:.1f}s -> {output_dir}"
+        )
+
+
+if __name__ == "__main__":
+    main()
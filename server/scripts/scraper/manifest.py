@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    return sha256_bytes(text.encode("utf-8"))
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_manifest_path(server_root: Path) -> Path:
+    return server_root / "data" / "pipeline_manifest.json"
+
+
+class Manifest:
+    def __init__(self, path: Path, payload: Optional[Dict[str, object]] = None) -> None:
+        payload = payload or {}
+        self.path = path
+        self.entries: Dict[str, Dict[str, object]] = dict(payload.get("entries", {}))  # type: ignore[arg-type]
+        self.files: Dict[str, Dict[str, object]] = dict(payload.get("files", {}))  # type: ignore[arg-type]
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        if not path.exists():
+            return cls(path)
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        if payload.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, payload)
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": MANIFEST_VERSION, "entries": self.entries, "files": self.files}
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self.files.get(key)
+        if cached and cached.get("size") == stat.st_size and cached.get("mtimeNs") == stat.st_mtime_ns:
+            return str(cached["sha256"])
+        digest = sha256_file(path)
+        self.files[key] = {"size": stat.st_size, "mtimeNs": stat.st_mtime_ns, "sha256": digest}
+        self.dirty = True
+        return digest
+
+    def get(self, stage: str, key: str) -> Optional[Dict[str, object]]:
+        return self.entries.get(f"{stage}:{key}")
+
+    def is_fresh(self, stage: str, key: str, inputs: Dict[str, str]) -> bool:
+        entry = self.get(stage, key)
+        if entry is None or entry.get("inputs") != inputs:
+            return False
+        outputs = entry.get("outputs", {})
+        for output, digest in outputs.items():  # type: ignore[union-attr]
+            path = Path(output)
+            if not path.exists() or self.file_digest(path) != digest:
+                return False
+        return True
+
+    def outputs(self, stage: str, key: str) -> List[Path]:
+        entry = self.get(stage, key) or {}
+        return [Path(output) for output in entry.get("outputs", {})]  # type: ignore[union-attr]
+
+    def record(
+        self,
+        stage: str,
+        key: str,
+        inputs: Dict[str, str],
+        outputs: Iterable[Path] = (),
+        **extra: object,
+    ) -> None:
+        entry: Dict[str, object] = {
+            "inputs": dict(inputs),
+            "outputs": {str(path.resolve()): self.file_digest(path) for path in outputs if path.exists()},
+            "updatedAt": int(time.time()),
+        }
+        entry.update({name: value for name, value in extra.items() if value is not None})
+        self.entries[f"{stage}:{key}"] = entry
+        self.dirty = True
+
+    def forget(self, stage: str, key: str) -> None:
+        if self.entries.pop(f"{stage}:{key}", None) is not None:
+            self.dirty = True
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.write_text(text, encoding="utf-8")
+    return True
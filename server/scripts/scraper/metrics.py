@@ -0,0 +1,356 @@
+import argparse
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SERVICE_NAME = "notria-scraper"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, count: int = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            # Layout: one cumulative slot per bucket, then +Inf, sum.
+            series = self.series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += count
+            series[-2] += count
+            series[-1] += value * count
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        lines: List[str] = []
+        for key, series in items:
+            for index, bound in enumerate(self.buckets):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', _format_value(bound))])} "
+                    f"{_format_value(series[index])}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', '+Inf')])} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "scraper_fetch_seconds", "HTTP fetch latency per host", ["stage", "host", "outcome"]
+)
+DOWNLOAD_BYTES = REGISTRY.counter("scraper_download_bytes_total", "PDF bytes downloaded", ["host"])
+DOWNLOADS = REGISTRY.counter("scraper_downloads_total", "Download attempts by result", ["result"])
+RETRIES = REGISTRY.counter("scraper_retries_total", "Requests retried after a failure", ["stage", "host"])
+LINKS_FOUND = REGISTRY.counter("scraper_links_total", "PDF links collected", ["subject"])
+EXTRACT_PAGE_SECONDS = REGISTRY.histogram(
+    "scraper_extract_page_seconds", "Text extraction time per PDF page", [], buckets=PAGE_BUCKETS
+)
+EXTRACTED_FILES = REGISTRY.counter("scraper_extracted_files_total", "Extracted PDFs by outcome", ["outcome"])
+SCANNED_RATIO = REGISTRY.gauge("scraper_scanned_ratio", "Share of extracted PDFs flagged as scanned or empty")
+CHUNKS_EMITTED = REGISTRY.counter("scraper_chunks_total", "Structured documents emitted", ["subject", "source_type"])
+STAGE_SECONDS = REGISTRY.gauge("scraper_stage_duration_seconds", "Wall time of the last stage run", ["stage"])
+STAGE_LAST_SUCCESS = REGISTRY.gauge(
+    "scraper_stage_last_success_timestamp_seconds", "Unix time the stage last finished", ["stage"]
+)
+STAGE_LAST_FAILURE = REGISTRY.gauge(
+    "scraper_stage_last_failure_timestamp_seconds", "Unix time the stage last failed", ["stage"]
+)
+
+
+def _new_id(size: int) -> str:
+    return secrets.token_hex(size)
+
+
+def _attribute(key: str, value: object) -> Dict[str, object]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str, attributes: Dict[str, object]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = ""
+
+    def set(self, key: str, value: object) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, object]:
+        span: Dict[str, object] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+_CURRENT_SPAN: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_id = _new_id(16)
+        self.root: Optional[Span] = None
+        self.finished: List[Span] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: object) -> Iterator[Optional[Span]]:
+        if not self.enabled:
+            yield None
+            return
+        # Worker threads start with an empty context, so their spans hang off the stage root.
+        parent = _CURRENT_SPAN.get() or self.root
+        span = Span(name, self.trace_id, parent.span_id if parent else "", dict(attributes))
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            span.end_ns = time.time_ns()
+            with self.lock:
+                self.finished.append(span)
+
+    def export(self, path: Path, stage: str) -> None:
+        with self.lock:
+            spans, self.finished = self.finished, []
+        if not spans:
+            return
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attribute("service.name", SERVICE_NAME), _attribute("pipeline.stage", stage)]},
+                    "scopeSpans": [{"scope": {"name": "scraper.metrics"}, "spans": [span.to_otlp() for span in spans]}],
+                }
+            ]
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+TRACER = Tracer()
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="Prometheus textfile to write at the end of the run (default: data/metrics/<stage>.prom)",
+    )
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve /metrics for Prometheus on this port during the run")
+    parser.add_argument("--trace-file", default=None, help="Append OTLP/JSON trace spans to this file")
+
+
+class StageRun:
+    def __init__(self, stage: str, args: argparse.Namespace, server_root: Path) -> None:
+        self.stage = stage
+        self.metrics_path = (
+            Path(args.metrics_file) if args.metrics_file else server_root / "data" / "metrics" / f"{stage}.prom"
+        )
+        self.trace_path = Path(args.trace_file) if args.trace_file else None
+        self.server = REGISTRY.serve(args.metrics_port) if args.metrics_port else None
+        self.started = time.perf_counter()
+        self._root_span = None
+        if self.trace_path is not None:
+            TRACER.enabled = True
+            self._root_span = TRACER.span(stage)
+            TRACER.root = self._root_span.__enter__()
+
+    def __enter__(self) -> "StageRun":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.finish(exc)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        # Failed runs still write their duration, counters and trace, with the failure time instead of a success.
+        STAGE_SECONDS.set(time.perf_counter() - self.started, stage=self.stage)
+        (STAGE_LAST_SUCCESS if error is None else STAGE_LAST_FAILURE).set(time.time(), stage=self.stage)
+        if self._root_span is not None:
+            self._root_span.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+            TRACER.root = None
+            TRACER.export(self.trace_path, self.stage)  # type: ignore[arg-type]
+        REGISTRY.write_textfile(self.metrics_path)
+        if self.server is not None:
+            self.server.shutdown()
+        print(f"Metrics written: {self.metrics_path}")
+
+
+def start_stage(stage: str, args: argparse.Namespace, server_root: Path) -> StageRun:
+    return StageRun(stage, args, server_root)
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz
+
+from catalog import add_catalog_arguments, open_catalog
+from corpus import iter_extracted
+from extract_text import PageRecord, assemble_pages, detect_scanned, iter_pages
+from jsonl_store import ShardedJsonlReader, ShardedJsonlWriter
+from manifest import Manifest, default_manifest_path, sha256_bytes
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # optional dependency, the mupdf engine only needs tesseract language data
+    pytesseract = None
+    Image = None
+
+
+OCR_ENGINES = ("auto", "tesseract", "mupdf")
+PageResult = Tuple[int, str, Optional[float], bool, int, float]
+
+
+def pdf_path_for(key: str, server_root: Path) -> Path:
+    store, _, record = key.partition("#")
+    relative = Path(store).parent / record if record else Path(store)
+    parts = relative.parts
+    if parts[:2] == ("data", "extracted"):
+        relative = Path("data", "pdfs", *parts[2:])
+    return (server_root / relative).with_suffix(".pdf")
+
+
+def page_image_path(cache_root: Path, pdf_digest: str, page_index: int, dpi: int) -> Path:
+    return cache_root / pdf_digest[:2] / pdf_digest / f"page-{page_index + 1:05d}-{dpi}dpi.png"
+
+
+def render_page(pdf_path: str, page_index: int, image_path: Path, dpi: int) -> None:
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = image_path.with_name(f"{image_path.stem}.{os.getpid()}.tmp.png")
+    doc = fitz.open(pdf_path)
+    try:
+        doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).save(str(tmp_path))
+    finally:
+        doc.close()
+    os.replace(tmp_path, image_path)
+
+
+def ocr_tesseract(image_path: Path, lang: str) -> Tuple[str, Optional[float]]:
+    if pytesseract is None:
+        raise RuntimeError("the tesseract OCR engine requires 'pytesseract' and 'Pillow' (pip install pytesseract Pillow)")
+    with Image.open(image_path) as image:
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences: List[float] = []
+    for index, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        line = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(line, []).append(word)
+        confidence = float(data["conf"][index])
+        if confidence >= 0:
+            confidences.append(confidence)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, round(sum(confidences) / len(confidences), 1) if confidences else None
+
+
+def ocr_mupdf(image_path: Path, lang: str) -> Tuple[str, Optional[float]]:
+    pixmap = fitz.Pixmap(str(image_path))
+    doc = fitz.open("pdf", pixmap.pdfocr_tobytes(language=lang))
+    try:
+        return doc[0].get_text(), None
+    finally:
+        doc.close()
+
+
+OCR_FUNCTIONS: Dict[str, Callable[[Path, str], Tuple[str, Optional[float]]]] = {
+    "tesseract": ocr_tesseract,
+    "mupdf": ocr_mupdf,
+}
+
+
+def resolve_engine(name: str) -> str:
+    if name == "auto":
+        return "tesseract" if pytesseract is not None else "mupdf"
+    return name
+
+
+def ocr_page(pdf_path: str, page_index: int, image_path: str, dpi: int, lang: str, engine: str) -> PageResult:
+    started = time.perf_counter()
+    image = Path(image_path)
+    cached = image.exists()
+    if not cached:
+        render_page(pdf_path, page_index, image, dpi)
+    text, confidence = OCR_FUNCTIONS[engine](image, lang)
+    return page_index, text, confidence, cached, os.getpid(), time.perf_counter() - started
+
+
+def apply_ocr(
+    payload: Dict[str, object],
+    pages: List[PageRecord],
+    results: Dict[int, Tuple[str, Optional[float]]],
+    engine: str,
+    lang: str,
+    dpi: int,
+) -> Dict[str, object]:
+    merged = [
+        {"page": record["page"], "text": results[index][0], "blocks": []} if index in results else record
+        for index, record in enumerate(pages)
+    ]
+    content, layout = assemble_pages(merged)
+    confidences = [confidence for _, confidence in results.values() if confidence is not None]
+    updated = dict(payload)
+    updated["content"] = content
+    updated["isScanned"] = detect_scanned(content)
+    updated["pages"] = layout
+    updated["ocr"] = {
+        "engine": engine,
+        "lang": lang,
+        "dpi": dpi,
+        "confidence": round(sum(confidences) / len(confidences), 1) if confidences else None,
+        "pages": [
+            {"page": index + 1, "confidence": results[index][1], "chars": len(results[index][0].strip())}
+            for index in sorted(results)
+        ],
+    }
+    return updated
+
+
+def store_compression(store_root: Path) -> str:
+    return "zstd" if any(store_root.glob("shard-*.jsonl.zst")) else "none"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="OCR scanned PDFs flagged by extract_text.py")
+    parser.add_argument(
+        "--subject",
+        default=None,
+        help="Optional subject slug. If set, only processes data/extracted/<subject>.",
+    )
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="OCR processes")
+    parser.add_argument("--engine", choices=OCR_ENGINES, default="auto", help="auto prefers pytesseract, else MuPDF OCR")
+    parser.add_argument("--lang", default="fra", help="Tesseract language(s), e.g. fra or fra+eng")
+    parser.add_argument("--dpi", type=int, default=300, help="Rasterization resolution for OCR")
+    parser.add_argument(
+        "--min-page-chars",
+        type=int,
+        default=10,
+        help="Pages whose text layer has fewer characters than this are OCR'd",
+    )
+    parser.add_argument("--cache-dir", default=None, help="Rendered page image cache (default: data/ocr_cache)")
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="OCR every scanned file again, even if unchanged")
+    add_catalog_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    extracted_root = server_root / "data" / "extracted"
+    if args.subject:
+        extracted_root = extracted_root / re.sub(r"[^a-z0-9-]+", "-", args.subject.lower()).strip("-")
+    if not extracted_root.exists():
+        raise FileNotFoundError("Missing server/data/extracted. Run extract_text.py first.")
+
+    engine = resolve_engine(args.engine)
+    cache_root = Path(args.cache_dir) if args.cache_dir else server_root / "data" / "ocr_cache"
+    manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+    stats: Dict[str, int] = {"files": 0, "pages": 0, "cached_images": 0, "recovered": 0, "failed": 0, "unchanged": 0}
+
+    settings = {"engine": engine, "lang": args.lang, "dpi": str(args.dpi), "minPageChars": str(args.min_page_chars)}
+    jobs: List[Tuple[str, Dict[str, str], Dict[str, object], Path, List[PageRecord], List[int]]] = []
+    for key, inputs, load_payload, _ in iter_extracted(extracted_root, server_root, manifest):
+        pdf_path = pdf_path_for(key, server_root)
+        if pdf_path.exists():
+            inputs = {**inputs, **settings, "pdf": manifest.file_digest(pdf_path)}
+            if not args.force and manifest.is_fresh("ocr", key, inputs):
+                stats["unchanged"] += 1
+                continue
+        payload = load_payload()
+        if "error" in payload or not (payload.get("isScanned") or "ocr" in payload):
+            continue
+        if not pdf_path.exists():
+            print(f"  ! missing PDF for {key}: {pdf_path}")
+            continue
+        pages = list(iter_pages(pdf_path))
+        blank = [index for index, record in enumerate(pages) if len(str(record["text"]).strip()) < args.min_page_chars]
+        jobs.append((key, inputs, payload, pdf_path, pages, blank))
+
+    writers: Dict[Path, ShardedJsonlWriter] = {}
+    written: List[Tuple[str, Dict[str, str]]] = []
+    workers = max(1, args.workers)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and jobs else None
+    catalog = open_catalog(args, server_root)
+    try:
+        submitted = []
+        for key, inputs, payload, pdf_path, pages, blank in jobs:
+            calls = [
+                (str(pdf_path), index, str(page_image_path(cache_root, inputs["pdf"], index, args.dpi)), args.dpi, args.lang, engine)
+                for index in blank
+            ]
+            futures: List["Future[PageResult]"] = [executor.submit(ocr_page, *call) for call in calls] if executor else []
+            submitted.append((key, inputs, payload, pages, calls, futures))
+
+        for key, inputs, payload, pages, calls, futures in submitted:
+            print(f"OCR {key} ({len(calls)}/{len(pages)} pages without text)")
+            results: Dict[int, Tuple[str, Optional[float]]] = {}
+            try:
+                for result in (future.result() for future in futures) if futures else (ocr_page(*call) for call in calls):
+                    page_index, text, confidence, cached, _, _ = result
+                    results[page_index] = (text, confidence)
+                    stats["pages"] += 1
+                    stats["cached_images"] += int(cached)
+            except Exception as exc:
+                stats["failed"] += 1
+                print(f"  ! OCR failed: {key} ({exc})")
+                continue
+
+            updated = apply_ocr(payload, pages, results, engine, args.lang, args.dpi)
+            store, _, record = key.partition("#")
+            if record:
+                store_root = server_root / store
+                writer = writers.get(store_root)
+                if writer is None:
+                    writer = ShardedJsonlWriter(store_root, compression=store_compression(store_root))
+                    writers[store_root] = writer
+                writer.write(record, updated)
+                # The path extract_text.py records for jsonl stores: the json file the record stands for.
+                output_path = store_root.parent / record
+            else:
+                output_path = server_root / store
+                output_path.write_text(json.dumps(updated, ensure_ascii=False, indent=2), encoding="utf-8")
+            if catalog is not None:
+                catalog.add_extracted(output_path, updated)
+            written.append((key, inputs))
+            stats["files"] += 1
+            if payload.get("isScanned") and not updated["isScanned"]:
+                stats["recovered"] += 1
+            confidence = updated["ocr"]["confidence"]  # type: ignore[index]
+            print(f"  -> {len(str(updated['content']))} chars, confidence={confidence if confidence is not None else 'n/a'}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for writer in writers.values():
+            writer.close()
+        if catalog is not None:
+            catalog.close()
+
+    # Record the rewritten extraction as the input, so the next run sees these files as up to date.
+    readers: Dict[str, ShardedJsonlReader] = {}
+    for key, inputs in written:
+        store, _, record = key.partition("#")
+        if record:
+            reader = readers.setdefault(store, ShardedJsonlReader(server_root / store))
+            manifest.record("ocr", key, {**inputs, "extracted": sha256_bytes(reader.read_raw(record))})
+        else:
+            output_path = server_root / store
+            manifest.record("ocr", key, {**inputs, "extracted": manifest.file_digest(output_path)}, [output_path])
+            extract_entry = manifest.get("extract", key)
+            if extract_entry is not None:
+                # The extract stage owns this file too; refresh its output hash so it is not re-extracted.
+                manifest.record("extract", key, extract_entry["inputs"], [output_path])  # type: ignore[arg-type]
+    manifest.save()
+
+    print(
+        f"Done. OCR'd {stats['files']} files ({stats['pages']} pages, {stats['cached_images']} cached images), "
+        f"recovered: {stats['recovered']}, failed: {stats['failed']}, unchanged: {stats['unchanged']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import argparse
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from catalog import add_catalog_arguments, open_catalog
+from chunker import Chunker
+from dedupe_text import load_duplicate_map
+from download_pdfs import download_file, plan_downloads, queue_download_failure
+from extract_text import assemble_pages, build_error_payload, build_payload, iter_pages, report_payload
+from http_client import HostSemaphores, build_session, host_of
+from jsonl_store import COMPRESSIONS, ShardedJsonlWriter
+from manifest import Manifest, default_manifest_path
+from metrics import EXTRACT_PAGE_SECONDS, SCANNED_RATIO, TRACER, add_metrics_arguments, start_stage
+from retry_queue import RetryQueue, default_queue_path, retry_key
+from structure_content import build_documents, structure_settings, write_documents
+
+
+# (pdf path, path relative to the subject's pdf folder); None marks the end of a producer.
+PdfItem = Optional[Tuple[Path, Path]]
+ExtractedItem = Optional[Tuple[Path, Path, Dict[str, object]]]
+
+
+def extract_document(pdf_path: str, relative: str) -> Tuple[Dict[str, object], int, float]:
+    started = time.perf_counter()
+    path = Path(pdf_path)
+    try:
+        records = list(iter_pages(path))
+        payload = build_payload(path, Path(relative), *assemble_pages(records))
+    except Exception as exc:
+        records = []
+        payload = build_error_payload(path, Path(relative), exc)
+    return payload, len(records), time.perf_counter() - started
+
+
+class Pipeline:
+    def __init__(self, args: argparse.Namespace, server_root: Path, subject_slug: str) -> None:
+        self.args = args
+        self.server_root = server_root
+        self.subject_slug = subject_slug
+        self.pdf_root = server_root / "data" / "pdfs" / subject_slug
+        self.extracted_root = server_root / "data" / "extracted" / subject_slug
+        self.output_root = server_root / "data" / "raw"
+        self.urls_path = Path(__file__).resolve().parent / f"urls_{subject_slug}.json"
+        self.manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        # The manifest is shared by the download threads and the structure loop.
+        self.manifest_lock = threading.Lock()
+        self.chunker = Chunker(args.tokenizer, args.overlap_tokens)
+        # Buffers rows under its own lock, so download threads and the structure loop share it.
+        self.catalog = open_catalog(args, server_root)
+        self.settings = {**structure_settings(args, self.chunker), "persist": "1" if args.persist else "0"}
+        self.pdf_queue: "queue.Queue[PdfItem]" = queue.Queue(maxsize=args.queue_size)
+        self.extracted_queue: "queue.Queue[ExtractedItem]" = queue.Queue(maxsize=args.queue_size)
+        self.stats: Dict[str, int] = {
+            "downloaded": 0,
+            "download_failed": 0,
+            "unchanged": 0,
+            "processed": 0,
+            "scanned_skipped": 0,
+            "documents": 0,
+        }
+        # Exceptions raised in the download and extract threads, re-raised by run() once they are joined.
+        self.errors: List[Exception] = []
+
+    def guarded(self, target: Callable[..., None], *args: object) -> None:
+        try:
+            target(*args)
+        except Exception as exc:
+            self.errors.append(exc)
+
+    def key_for(self, pdf_path: Path) -> str:
+        return pdf_path.relative_to(self.server_root).as_posix()
+
+    def needs_processing(self, pdf_path: Path) -> bool:
+        with self.manifest_lock:
+            inputs = {"pdf": self.manifest.file_digest(pdf_path), **self.settings}
+            if not self.args.force and self.manifest.is_fresh("pipeline", self.key_for(pdf_path), inputs):
+                self.stats["unchanged"] += 1
+                return False
+        return True
+
+    def submit(self, pdf_path: Path) -> None:
+        if self.needs_processing(pdf_path):
+            # Blocks while extraction is behind, which throttles the downloads feeding it.
+            self.pdf_queue.put((pdf_path, pdf_path.relative_to(self.pdf_root)))
+
+    def produce(self, extract_threads: int) -> None:
+        try:
+            if self.args.no_download:
+                for pdf_path in sorted(self.pdf_root.rglob("*.pdf")):
+                    self.submit(pdf_path)
+            else:
+                self.download_and_submit()
+        finally:
+            for _ in range(extract_threads):
+                self.pdf_queue.put(None)
+
+    def download_and_submit(self) -> None:
+        data = json.loads(self.urls_path.read_text(encoding="utf-8"))
+        with self.manifest_lock:
+            planned, jobs = plan_downloads(data, self.pdf_root, self.manifest, self.args.refresh)
+        entries = {destination: entry for entry, destination, _ in planned}
+        for _, destination, job_index in planned:
+            if job_index is None and destination.exists():
+                self.submit(destination)
+
+        print(f"Downloading {len(jobs)} files with {self.args.download_workers} workers ({self.args.per_host} per host)")
+        session = build_session(pool_size=max(self.args.download_workers, self.args.per_host))
+        host_limits = HostSemaphores(self.args.per_host)
+        retry_queue = RetryQueue(Path(self.args.retry_queue) if self.args.retry_queue else default_queue_path(self.server_root))
+        queue_lock = threading.Lock()
+
+        def run(job: Tuple[str, Path, Dict[str, str]]) -> None:
+            url, destination, conditional = job
+            with host_limits.for_url(url):
+                result = download_file(url, destination, session=session, conditional=conditional)
+            reason = str(result["reason"])
+            if result["status"] == "failed":
+                with queue_lock:
+                    self.stats["download_failed"] += 1
+                    queue_download_failure(retry_queue, entries[destination], self.subject_slug, destination, self.server_root, reason)
+                self.record_download(entries[destination], "failed", reason, None, result)
+                print(f"  ! failed {url} ({reason})")
+                return
+            with queue_lock:
+                retry_queue.resolve("download", retry_key(self.subject_slug, url))
+                retry_queue.record_success(host_of(url))
+            if result["status"] == "ok":
+                with self.manifest_lock:
+                    self.stats["downloaded"] += 1
+                    self.manifest.record(
+                        "download",
+                        url,
+                        {"url": url},
+                        [destination],
+                        etag=result.get("etag"),
+                        lastModified=result.get("lastModified"),
+                    )
+                print(f"  -> downloaded {destination.name}")
+            status = "downloaded" if result["status"] == "ok" else "skipped_existing"
+            self.record_download(entries[destination], status, reason, destination, result)
+            self.submit(destination)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.args.download_workers)) as executor:
+                list(executor.map(run, jobs))
+        finally:
+            session.close()
+            retry_queue.close()
+
+    def record_download(
+        self,
+        entry: Dict[str, str],
+        status: str,
+        reason: str,
+        destination: Optional[Path],
+        result: Dict[str, object],
+    ) -> None:
+        if self.catalog is None:
+            return
+        file = destination.relative_to(self.server_root).as_posix() if destination is not None else ""
+        self.catalog.add_download(
+            self.subject_slug,
+            {
+                **entry,
+                "file": file,
+                "status": status,
+                "reason": reason,
+                "validation": result.get("validation"),
+                "pages": result.get("pages"),
+            },
+            size=int(result["bytes"]) if result.get("bytes") else None,  # type: ignore[call-overload]
+            etag=result.get("etag"),  # type: ignore[arg-type]
+            last_modified=result.get("lastModified"),  # type: ignore[arg-type]
+        )
+
+    def extract(self, executor: Optional[ProcessPoolExecutor]) -> None:
+        try:
+            while True:
+                item = self.pdf_queue.get()
+                if item is None:
+                    return
+                pdf_path, relative = item
+                if executor is not None:
+                    payload, pages, elapsed = executor.submit(extract_document, str(pdf_path), str(relative)).result()
+                else:
+                    payload, pages, elapsed = extract_document(str(pdf_path), str(relative))
+                if pages:
+                    EXTRACT_PAGE_SECONDS.observe(elapsed / pages, count=pages)
+                self.extracted_queue.put((pdf_path, relative, payload))
+        except Exception:
+            # Keep taking items so the producer is not left blocked on a full queue.
+            while self.pdf_queue.get() is not None:
+                pass
+            raise
+        finally:
+            self.extracted_queue.put(None)
+
+    def structure(self, producers: int, writer: Optional[ShardedJsonlWriter]) -> None:
+        duplicates = load_duplicate_map(self.server_root, self.subject_slug)
+        finished = 0
+        while finished < producers:
+            item = self.extracted_queue.get()
+            if item is None:
+                finished += 1
+                continue
+            pdf_path, relative, payload = item
+            print(f"Processing {relative}")
+            report_payload(payload, self.stats)
+            extracted_path = self.extracted_root / relative.with_suffix(".json")
+            extracted_key = extracted_path.relative_to(self.server_root).as_posix()
+            if self.args.persist:
+                extracted_path.parent.mkdir(parents=True, exist_ok=True)
+                extracted_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+                if self.catalog is not None:
+                    self.catalog.add_extracted(extracted_path, payload)
+
+            duplicate_of = duplicates.get(extracted_key, "")
+            if duplicate_of:
+                print(f"Skip duplicate of {duplicate_of}: {extracted_key}")
+                documents: List[Tuple[str, Dict[str, object]]] = []
+            else:
+                with TRACER.span("structure_document", key=extracted_key) as span:
+                    documents, skip_reason = build_documents(
+                        payload,
+                        self.subject_slug,
+                        pdf_path.stem,
+                        self.chunker,
+                        segment_annales=not self.args.no_segment_annales,
+                    )
+                    if span is not None:
+                        span.set("chunks", len(documents))
+                if skip_reason:
+                    print(skip_reason)
+            written = write_documents(documents, self.output_root, self.server_root, writer)
+            if self.catalog is not None:
+                self.catalog.add_documents(documents)
+            self.stats["documents"] += len(documents)
+            self.record(pdf_path, extracted_path, extracted_key, duplicate_of, written)
+
+    def record(self, pdf_path: Path, extracted_path: Path, extracted_key: str, duplicate_of: str, written: List[Path]) -> None:
+        key = self.key_for(pdf_path)
+        with self.manifest_lock:
+            pdf_digest = self.manifest.file_digest(pdf_path)
+            stale: Set[Path] = set(self.manifest.outputs("pipeline", key)) - {path.resolve() for path in written}
+            self.manifest.record("pipeline", key, {"pdf": pdf_digest, **self.settings}, written)
+            if self.args.persist:
+                # Same entries extract_text.py and structure_content.py write, so a later
+                # standalone run of either script sees these files as up to date.
+                self.manifest.record("extract", extracted_key, {"pdf": pdf_digest}, [extracted_path])
+                self.manifest.record(
+                    "structure",
+                    extracted_key,
+                    {
+                        "extracted": self.manifest.file_digest(extracted_path),
+                        **structure_settings(self.args, self.chunker),
+                        "duplicateOf": duplicate_of,
+                    },
+                    written,
+                )
+        for stale_path in sorted(stale):
+            if stale_path.exists():
+                stale_path.unlink()
+                print(f"Removed stale -> {stale_path.relative_to(self.server_root)}")
+                if self.catalog is not None:
+                    self.catalog.remove_documents([stale_path.relative_to(self.output_root).as_posix()])
+
+    def run(self) -> None:
+        workers = max(1, self.args.workers)
+        writer: Optional[ShardedJsonlWriter] = None
+        if self.args.output_format == "jsonl":
+            writer = ShardedJsonlWriter(self.output_root / "jsonl" / self.subject_slug, compression=self.args.compression)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        threads = [threading.Thread(target=self.guarded, args=(self.produce, workers), name="download", daemon=True)]
+        threads.extend(
+            threading.Thread(target=self.guarded, args=(self.extract, executor), name=f"extract-{index}", daemon=True)
+            for index in range(workers)
+        )
+        for thread in threads:
+            thread.start()
+        try:
+            self.structure(workers, writer)
+            for thread in threads:
+                thread.join()
+            if self.errors:
+                raise self.errors[0]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if writer is not None:
+                writer.close()
+            if self.catalog is not None:
+                self.catalog.close()
+            self.manifest.save()
+        if self.stats["processed"]:
+            SCANNED_RATIO.set(self.stats["scanned_skipped"] / self.stats["processed"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Download, extract and structure one subject as a single streaming pipeline"
+    )
+    parser.add_argument(
+        "--subject",
+        default="mathematiques",
+        help="Subject slug (used to resolve urls_<subject>.json and the data folders)",
+    )
+    parser.add_argument(
+        "--persist",
+        action="store_true",
+        help="Also write data/extracted/<subject> JSON files, as extract_text.py does",
+    )
+    parser.add_argument(
+        "--no-download",
+        action="store_true",
+        help="Process the PDFs already in data/pdfs/<subject> instead of downloading urls_<subject>.json",
+    )
+    parser.add_argument("--download-workers", type=int, default=8, help="Number of parallel downloads")
+    parser.add_argument("--per-host", type=int, default=2, help="Maximum concurrent downloads per host")
+    parser.add_argument("--workers", type=int, default=2, help="Number of extraction processes")
+    parser.add_argument("--queue-size", type=int, default=16, help="Documents buffered between two stages")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate existing files with If-None-Match/If-Modified-Since instead of skipping them",
+    )
+    parser.add_argument("--force", action="store_true", help="Reprocess every PDF, even when its hash is unchanged")
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json writes one file per document; jsonl appends to sharded files under raw/jsonl/<subject>",
+    )
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="none", help="jsonl shard compression")
+    parser.add_argument(
+        "--tokenizer",
+        default="approx",
+        help="Tokenizer used for chunk budgets: approx, whitespace, tiktoken:<encoding> or hf:<tokenizer.json>",
+    )
+    parser.add_argument("--overlap-tokens", type=int, default=0, help="Tokens repeated between consecutive parts")
+    parser.add_argument(
+        "--no-segment-annales",
+        action="store_true",
+        help="Keep annales as token-budget parts instead of one record per exercise and correction",
+    )
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument(
+        "--retry-queue",
+        default=None,
+        help="Failure queue drained by retry_failures.py (default: data/retry_queue.sqlite3)",
+    )
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    subject_slug = re.sub(r"[^a-z0-9-]+", "-", args.subject.lower()).strip("-") or "mathematiques"
+    with start_stage("pipeline", args, server_root):
+        pipeline = Pipeline(args, server_root, subject_slug)
+        if not args.no_download and not pipeline.urls_path.exists():
+            raise FileNotFoundError(f"Missing {pipeline.urls_path}. Run scrape_urls.py first.")
+        pipeline.pdf_root.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        pipeline.run()
+        stats = pipeline.stats
+        print(
+            f"Done in {time.perf_counter() - started:.1f}s. downloaded={stats['downloaded']}, "
+            f"download_failed={stats['download_failed']}, unchanged={stats['unchanged']}, "
+            f"extracted={stats['processed']}, scanned/empty={stats['scanned_skipped']}, documents={stats['documents']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
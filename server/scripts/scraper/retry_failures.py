@@ -0,0 +1,223 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from catalog import Catalog, add_catalog_arguments, open_catalog
+from download_pdfs import download_all
+from http_cache import HttpCache
+from manifest import Manifest, default_manifest_path, write_if_changed
+from metrics import RETRIES, add_metrics_arguments, start_stage
+from retry_queue import Job, RetryQueue, default_queue_path, is_retryable_exception, is_retryable_reason
+from scrape_urls import collect_links, fetch_page, finalize_links, page_doc_links, queue_fetch_failure
+
+
+JOB_KINDS = ("listing", "doc_page", "download")
+
+
+def merge_urls(script_dir: Path, subject_slug: str, links: List[Dict[str, str]]) -> int:
+    urls_path = script_dir / f"urls_{subject_slug}.json"
+    existing = json.loads(urls_path.read_text(encoding="utf-8")) if urls_path.exists() else []
+    merged = finalize_links(existing + links)
+    write_if_changed(urls_path, json.dumps(merged, ensure_ascii=False, indent=2))
+    return len(merged) - len(existing)
+
+
+def prune_failed_urls(script_dir: Path, subject_slug: str, recovered: List[str]) -> None:
+    failed_path = script_dir / f"failed_urls_{subject_slug}.json"
+    if not recovered or not failed_path.exists():
+        return
+    done = set(recovered)
+    failures = json.loads(failed_path.read_text(encoding="utf-8"))
+    failed_path.write_text(
+        json.dumps([item for item in failures if item.get("url") not in done], ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+
+
+def retry_pages(
+    jobs: List[Job],
+    queue: RetryQueue,
+    script_dir: Path,
+    cache: Optional[HttpCache],
+    stats: Dict[str, int],
+    catalog: Optional[Catalog] = None,
+) -> None:
+    for job in jobs:
+        subject_slug = str(job.payload["subject"])
+        source_type = str(job.payload["sourceType"])
+        url = str(job.payload["url"])
+        RETRIES.inc(stage="retry", host=job.host)
+        try:
+            page = fetch_page(url, cache=cache)
+        except Exception as exc:
+            status = queue.fail(job, f"{type(exc).__name__}:{exc}", retryable=is_retryable_exception(exc))
+            stats[status] += 1
+            print(f"  ! {job.kind} {url} failed again ({exc}) -> {status}")
+            continue
+
+        if job.kind == "listing":
+            links = collect_links(
+                page.text,
+                url,
+                source_type,
+                subject_slug,
+                cache=cache,
+                on_failure=lambda kind, source, doc_url, owners, exc: queue_fetch_failure(
+                    queue, owners, kind, source, doc_url, exc
+                ),
+            )
+        else:
+            links = page_doc_links(page, source_type, subject_slug, cache)
+        added = merge_urls(script_dir, subject_slug, links)
+        if catalog is not None:
+            catalog.add_urls(subject_slug, links)
+        queue.complete(job)
+        stats["recovered"] += 1
+        print(f"  -> {job.kind} {url}: {len(links)} links, {added} new in urls_{subject_slug}.json")
+
+
+def retry_downloads(
+    jobs: List[Job],
+    queue: RetryQueue,
+    server_root: Path,
+    script_dir: Path,
+    manifest: Manifest,
+    workers: int,
+    per_host: int,
+    stats: Dict[str, int],
+    catalog: Optional[Catalog] = None,
+) -> None:
+    planned: List[Tuple[str, Path, Dict[str, str]]] = []
+    for job in jobs:
+        destination = server_root / str(job.payload["file"])
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        RETRIES.inc(stage="retry", host=job.host)
+        # Keys are subject|url; the payload carries the bare url.
+        planned.append((str(job.payload["url"]), destination, {}))
+
+    recovered: Dict[str, List[str]] = {}
+    for job, (url, destination, _), result in zip(jobs, planned, download_all(planned, workers=workers, per_host=per_host)):
+        reason = str(result["reason"])
+        if result["status"] == "failed":
+            status = queue.fail(job, reason, retryable=is_retryable_reason(reason))
+            stats[status] += 1
+            print(f"  ! download {url} failed again ({reason}) -> {status}")
+            continue
+        manifest.record(
+            "download",
+            url,
+            {"url": url},
+            [destination],
+            etag=result.get("etag"),
+            lastModified=result.get("lastModified"),
+        )
+        queue.complete(job)
+        stats["recovered"] += 1
+        recovered.setdefault(str(job.payload["subject"]), []).append(url)
+        if catalog is not None:
+            catalog.add_download(
+                str(job.payload["subject"]),
+                {
+                    **job.payload,
+                    "status": "downloaded",
+                    "reason": reason,
+                    "validation": result.get("validation"),
+                    "pages": result.get("pages"),
+                },
+                size=int(result["bytes"]) if result.get("bytes") else None,  # type: ignore[call-overload]
+                etag=result.get("etag"),  # type: ignore[arg-type]
+                last_modified=result.get("lastModified"),  # type: ignore[arg-type]
+            )
+        print(f"  -> downloaded {destination.name} (attempt {job.attempts + 1})")
+
+    for subject_slug, urls in recovered.items():
+        prune_failed_urls(script_dir, subject_slug, urls)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Retry failed crawls and downloads recorded in the retry queue")
+    parser.add_argument(
+        "--subject",
+        default=None,
+        help="Optional subject slug. If set, only retries jobs queued for that subject.",
+    )
+    parser.add_argument("--kind", choices=JOB_KINDS, action="append", help="Job kinds to retry (default: all)")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum jobs leased per round")
+    parser.add_argument("--workers", type=int, default=8, help="Number of parallel downloads")
+    parser.add_argument("--per-host", type=int, default=2, help="Maximum concurrent downloads per host")
+    parser.add_argument(
+        "--until-empty",
+        action="store_true",
+        help="Keep sleeping until the next job is due and retry it, instead of a single pass",
+    )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=3600.0,
+        help="With --until-empty: stop once the next due job is further away than this many seconds",
+    )
+    parser.add_argument("--retry-queue", default=None, help="Retry queue path (default: data/retry_queue.sqlite3)")
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--cache-dir", default=None, help="HTTP cache directory (default: data/http_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk HTTP cache")
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    script_dir = Path(__file__).resolve().parent
+    server_root = script_dir.parents[1]
+    kinds = args.kind or list(JOB_KINDS)
+    with start_stage("retry", args, server_root):
+        queue = RetryQueue(Path(args.retry_queue) if args.retry_queue else default_queue_path(server_root))
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+        cache = None
+        if not args.no_cache:
+            cache = HttpCache(Path(args.cache_dir) if args.cache_dir else server_root / "data" / "http_cache")
+        catalog = open_catalog(args, server_root)
+        stats = {"recovered": 0, "pending": 0, "dead": 0}
+
+        while True:
+            jobs = queue.lease(kinds, limit=args.limit, subject=args.subject)
+            if jobs:
+                print(f"Retrying {len(jobs)} jobs")
+                # Listings first: they can queue new doc pages, which in turn feed downloads.
+                retry_pages([job for job in jobs if job.kind != "download"], queue, script_dir, cache, stats, catalog)
+                downloads = [job for job in jobs if job.kind == "download"]
+                if downloads:
+                    retry_downloads(
+                        downloads, queue, server_root, script_dir, manifest, args.workers, args.per_host, stats, catalog
+                    )
+                    manifest.save()
+                continue
+            if not args.until_empty:
+                break
+            due = queue.next_due(kinds, subject=args.subject)
+            if due is None:
+                break
+            wait = due - time.time()
+            if wait > args.max_wait:
+                print(f"Next job is due in {wait:.0f}s, stopping")
+                break
+            if wait > 0:
+                print(f"Waiting {wait:.0f}s for the next due job")
+                time.sleep(wait)
+
+        open_hosts = queue.open_hosts()
+        print(
+            f"Retry summary: recovered={stats['recovered']}, rescheduled={stats['pending']}, dead={stats['dead']}"
+            + (f", open circuits: {', '.join(open_hosts)}" if open_hosts else "")
+        )
+        for kind, counts in sorted(queue.stats().items()):
+            print(f"  {kind}: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+        queue.close()
+        if catalog is not None:
+            catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import json
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BASE_DELAY = 30.0
+DEFAULT_MAX_DELAY = 6 * 3600.0
+DEFAULT_LEASE_SECONDS = 15 * 60.0
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 10 * 60.0
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    host TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt_at, priority);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    open_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def default_queue_path(server_root: Path) -> Path:
+    return server_root / "data" / "retry_queue.sqlite3"
+
+
+def retry_key(subject_slug: str, url: str) -> str:
+    # Page and download jobs are per subject: the same url can be queued for several subjects.
+    return f"{subject_slug}|{url}"
+
+
+def is_retryable_reason(reason: str) -> bool:
+    if reason.startswith(("request_error", "stream_error")):
+        return True
+    if reason.startswith("http_"):
+        status = reason[len("http_"):]
+        return status.isdigit() and int(status) in RETRYABLE_STATUS
+    return False
+
+
+def is_retryable_exception(exc: Exception) -> bool:
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, (requests.RequestException, OSError))
+
+
+def backoff_delay(attempts: int, base: float = DEFAULT_BASE_DELAY, cap: float = DEFAULT_MAX_DELAY) -> float:
+    # Exponential backoff with "equal jitter": half the window is fixed, half is random.
+    window = min(cap, base * (2 ** max(0, attempts - 1)))
+    return window / 2 + random.uniform(0, window / 2)
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    key: str
+    host: str
+    payload: Dict[str, object]
+    priority: int
+    attempts: int
+    last_error: Optional[str]
+
+
+class RetryQueue:
+    def __init__(
+        self,
+        path: Path,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        breaker_threshold: int = BREAKER_THRESHOLD,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+    ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        # Callers that share a queue across threads serialize access themselves.
+        self.conn = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "RetryQueue":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def enqueue_failure(
+        self,
+        kind: str,
+        key: str,
+        host: str,
+        payload: Dict[str, object],
+        error: str,
+        retryable: bool = True,
+        priority: int = 0,
+        count_host: bool = True,
+    ) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT attempts, status FROM jobs WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            attempts = (row[0] if row and row[1] != "done" else 0) + 1
+            status = "pending" if retryable and attempts < self.max_attempts else "dead"
+            next_attempt = now + backoff_delay(attempts, self.base_delay, self.max_delay)
+            self.conn.execute(
+                """
+                INSERT INTO jobs (kind, key, host, payload, priority, status, attempts, next_attempt_at,
+                                  lease_until, last_error, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET
+                    host = excluded.host, payload = excluded.payload,
+                    priority = MAX(jobs.priority, excluded.priority), status = excluded.status,
+                    attempts = excluded.attempts, next_attempt_at = excluded.next_attempt_at,
+                    lease_until = NULL, last_error = excluded.last_error, updated_at = excluded.updated_at
+                """,
+                (kind, key, host, json.dumps(payload, ensure_ascii=False), priority, status, attempts, next_attempt, error, now, now),
+            )
+            if count_host:
+                self._record_host(host, success=False, now=now)
+
+    def resolve(self, kind: str, key: str) -> bool:
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT host FROM jobs WHERE kind = ? AND key = ? AND status != 'done'", (kind, key)
+            ).fetchone()
+            if row is None:
+                return False
+            self.conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, updated_at = ? WHERE kind = ? AND key = ?",
+                (now, kind, key),
+            )
+            self._record_host(row[0], success=True, now=now)
+        return True
+
+    def record_success(self, host: str) -> None:
+        with self.conn:
+            self._record_host(host, success=True, now=time.time())
+
+    def _record_host(self, host: str, success: bool, now: float) -> None:
+        if success:
+            self.conn.execute("UPDATE hosts SET consecutive_failures = 0, open_until = 0 WHERE host = ?", (host,))
+            return
+        self.conn.execute(
+            "INSERT INTO hosts (host, consecutive_failures) VALUES (?, 1) "
+            "ON CONFLICT (host) DO UPDATE SET consecutive_failures = consecutive_failures + 1",
+            (host,),
+        )
+        failures = self.conn.execute("SELECT consecutive_failures FROM hosts WHERE host = ?", (host,)).fetchone()[0]
+        if failures >= self.breaker_threshold:
+            self.conn.execute("UPDATE hosts SET open_until = ? WHERE host = ?", (now + self.breaker_cooldown, host))
+
+    def open_hosts(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        return [row[0] for row in self.conn.execute("SELECT host FROM hosts WHERE open_until > ?", (now,))]
+
+    def lease(
+        self,
+        kinds: Sequence[str],
+        limit: int = 100,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        subject: Optional[str] = None,
+    ) -> List[Job]:
+        now = time.time()
+        placeholders = ",".join("?" for _ in kinds)
+        subject_filter = "AND json_extract(payload, '$.subject') = ?" if subject else ""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Leases left behind by a crashed run expire and become due again.
+            rows = self.conn.execute(
+                f"""
+                SELECT id, kind, key, jobs.host, payload, priority, attempts, last_error FROM jobs
+                LEFT JOIN hosts ON hosts.host = jobs.host
+                WHERE kind IN ({placeholders})
+                  AND ((status = 'pending' AND next_attempt_at <= ?) OR (status = 'leased' AND lease_until <= ?))
+                  AND COALESCE(hosts.open_until, 0) <= ?
+                  {subject_filter}
+                ORDER BY priority DESC, next_attempt_at ASC
+                LIMIT ?
+                """,
+                (*kinds, now, now, now, *([subject] if subject else []), limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'leased', lease_until = ?, updated_at = ? WHERE id = ?",
+                [(now + lease_seconds, now, row[0]) for row in rows],
+            )
+        return [
+            Job(id=row[0], kind=row[1], key=row[2], host=row[3], payload=json.loads(row[4]), priority=row[5], attempts=row[6], last_error=row[7])
+            for row in rows
+        ]
+
+    def complete(self, job: Job) -> None:
+        self.resolve(job.kind, job.key)
+
+    def fail(self, job: Job, error: str, retryable: bool = True) -> str:
+        self.enqueue_failure(job.kind, job.key, job.host, job.payload, error, retryable, job.priority)
+        row = self.conn.execute("SELECT status FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        return str(row[0]) if row else "pending"
+
+    def next_due(self, kinds: Sequence[str], subject: Optional[str] = None) -> Optional[float]:
+        placeholders = ",".join("?" for _ in kinds)
+        subject_filter = "AND json_extract(payload, '$.subject') = ?" if subject else ""
+        # A job behind an open circuit is not due before its host cools down.
+        row = self.conn.execute(
+            f"""
+            SELECT MIN(MAX(COALESCE(lease_until, next_attempt_at), COALESCE(hosts.open_until, 0))) FROM jobs
+            LEFT JOIN hosts ON hosts.host = jobs.host
+            WHERE kind IN ({placeholders}) AND status IN ('pending', 'leased') {subject_filter}
+            """,
+            (*kinds, *([subject] if subject else [])),
+        ).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in self.conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"):
+            counts.setdefault(kind, {})[status] = count
+        return counts
@@ -1,17 +1,28 @@
 import argparse
 import json
 import re
+import time
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
 from urllib.parse import urljoin, urlparse
 
 import requests
-from bs4 import BeautifulSoup
+
+from catalog import add_catalog_arguments, open_catalog
+from crawler import crawl
+from discovery import DEFAULT_MAX_DEPTH, DEFAULT_MAX_PAGES, DEFAULT_MAX_SITEMAP_PAGES, Discovery, page_offset, pagination_links, same_listing
+from classifier import KeywordMatcher, Scan
+from html_backends import BACKENDS, Anchor, HtmlBackend, get_backend, set_default_backend
+from http_cache import CachedPage, HttpCache
+from http_client import build_session, host_of
+from manifest import Manifest, default_manifest_path, sha256_file, sha256_text, write_if_changed
+from metrics import FETCH_SECONDS, LINKS_FOUND, TRACER, add_metrics_arguments, start_stage
+from retry_queue import RetryQueue, default_queue_path, is_retryable_exception, retry_key
 
 
 BASE_URL = "https://www.fomesoutra.com"
 DEFAULT_SOURCE_PAGES: List[Tuple[str, str]] = [
-    ("livre", f"{BASE_URL}/les-livres/livres-et-annales-de-la-troisieme?limit=100"),
+    ("livre", f"{BASE_URL}/les-livres/livres-et-annales-de-la-troisieme"),
     ("annale", "https://www.banquedesepreuves.com/index.php/component/edocman/cote-d-ivoire/bepc"),
     ("annale", "https://epreuvesetcorriges.com/categories/cote-d-ivoire/examens/bepc"),
     ("annale", "https://sujetcorrige.com/sujets-bepc-cote-d-ivoire"),
@@ -23,21 +34,20 @@ SUBJECT_CONFIGS: Dict[str, Dict[str, object]] = {
         "source_pages": [
             ("exercice", f"{BASE_URL}/cours/secondaire/3eme/maths"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/calcul-litteral-guide-pedagogique-maths-3eme?sort=title"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/calculs-numeriques-guide-pedagogique-maths-3eme?sort=title"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/configuration-de-l-espace-guide-pedagogique-maths-3eme?sort=title"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/geometrie-analytique-guide-pedagogique-maths-3eme?sort=title"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/pyramides-et-cones-guide-pedagogique-maths-3eme?sort=title"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/configuration-du-plan-guide-pedagogique-maths-3eme?sort=title"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/calcul-litteral-guide-pedagogique-maths-3eme"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/calculs-numeriques-guide-pedagogique-maths-3eme"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/configuration-de-l-espace-guide-pedagogique-maths-3eme"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/geometrie-analytique-guide-pedagogique-maths-3eme"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/pyramides-et-cones-guide-pedagogique-maths-3eme"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/guide-pedagogique-cours-de-maths-3eme/configuration-du-plan-guide-pedagogique-maths-3eme"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/maths/mathematiques-3ieme-apc"),
         ],
     },
     "francais": {
         "aliases": ["francais", "grammaire", "conjugaison", "dictee", "redaction", "resume", "composition"],
         "source_pages": [
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/cours-de-francais-3eme?sort=title&limit=100"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/cours-de-francais-3eme"),
-            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-composition-francaise-3eme?limit=100"),
+            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-composition-francaise-3eme"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-composition-francaise-3eme/anciens-sujets-de-composition-francaise-du-bepc"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-composition-francaise-3eme/sujets-de-composition-francaise-bepc-blanc-lycee-sainte-marie-de-cocody"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-composition-francaise-3eme/sujets-de-composition-francaise-bepc-blanc-empt-bingerville"),
@@ -50,10 +60,9 @@ SUBJECT_CONFIGS: Dict[str, Dict[str, object]] = {
     "anglais": {
         "aliases": ["anglais", "english", "grammar", "vocabulary", "reading", "essay"],
         "source_pages": [
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/anglais?limit=100"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/anglais"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/anglais/anglais-3ieme-apc"),
-            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-d-anglais-3eme?limit=100"),
+            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-d-anglais-3eme"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-d-anglais-3eme/anciens-sujets-d-anglais-du-bepc"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-d-anglais-3eme/sujets-d-anglais-bepc-blanc-lycee-sainte-marie-de-cocody"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-d-anglais-3eme/sujets-d-anglais-bepc-blanc-empt-bingerville"),
@@ -69,7 +78,7 @@ SUBJECT_CONFIGS: Dict[str, Dict[str, object]] = {
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-svt-3eme/sujets-de-svt-bepc-blancs-lycee-sainte-marie-de-cocody"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-svt-3eme/sujets-de-svt-bepc-blanc-empt-bingerville"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-svt-3eme/sujets-de-svt-bepc-blanc-lycee-mamie-faitai-de-bingerville"),
-            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-svt-3eme/sujets-svt-3ieme?limit=100"),
+            ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-svt-3eme/sujets-svt-3ieme"),
         ],
     },
     "physique-chimie": {
@@ -78,7 +87,7 @@ SUBJECT_CONFIGS: Dict[str, Dict[str, object]] = {
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/physique-1"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/chimie-1"),
-            ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/chimie-1/chimie-3ieme-apc?sort=title"),
+            ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/chimie-1/chimie-3ieme-apc"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/physique-1/supports-cours-de-physique-3eme"),
             ("cours", f"{BASE_URL}/cours/secondaire/3eme/dossier-cours-de-physique-chimie-3eme/physique-1/physique-3ieme-apc"),
             ("annale", f"{BASE_URL}/sujets/secondaire-1/troisieme/sujets-de-physique-chimie-3eme"),
@@ -108,53 +117,90 @@ SUBJECT_BLACKLIST = {
     "philosophie",
 }
 
+PDF_MARKERS = [".pdf", "/file", "download", "/edocman/", "task=document.download"]
+LEVEL_MARKERS = ["3eme", "troisieme", "3e", "bepc", "zone"]
+ANNALE_MARKERS = ["bepc", "zone", "blanc"]
+DOC_PAGE_MARKERS = ["bepc", "zone", "sujet", "edocman", "blanc"]
+DOWNLOAD_LABEL_TOKENS = ["telecharger", "download", "file", "pdf", "voir", "ouvrir"]
+
+
+def build_link_matcher() -> KeywordMatcher:
+    tagged: List[Tuple[str, Hashable]] = []
+    for slug, conf in SUBJECT_CONFIGS.items():
+        tagged.extend((alias, ("alias", slug)) for alias in conf.get("aliases", []))  # type: ignore[union-attr]
+    tagged.extend((alias, "exam") for alias in COMMON_EXAM_ALIASES)
+    tagged.extend((keyword, "blacklist") for keyword in SUBJECT_BLACKLIST)
+    tagged.extend((marker, "pdf") for marker in PDF_MARKERS)
+    tagged.extend((marker, "level") for marker in LEVEL_MARKERS)
+    tagged.extend((marker, "annale") for marker in ANNALE_MARKERS)
+    tagged.extend((marker, "doc_page") for marker in DOC_PAGE_MARKERS)
+    tagged.extend((token, "download_label") for token in DOWNLOAD_LABEL_TOKENS)
+    tagged.append(("download", "download"))
+    return KeywordMatcher(tagged)
+
+
+LINK_MATCHER = build_link_matcher()
+PARSE_FINGERPRINT = sha256_text(
+    sha256_file(Path(__file__))
+    + sha256_file(Path(__file__).with_name("classifier.py"))
+    + sha256_file(Path(__file__).with_name("html_backends.py"))
+    + sha256_file(Path(__file__).with_name("discovery.py"))
+)[:16]
+
+STRICT_SOURCE_TYPES = {"livre", "annale", "exercice", "cours"}
+
+# Links found for each subject slug.
+SubjectLinks = Dict[str, List[Dict[str, str]]]
+# (kind, source_type, url, subjects, exc) for a listing or doc page that could not be fetched.
+FailureFn = Callable[[str, str, str, Tuple[str, ...], Exception], None]
+
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
     "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36"
 )
 
 
+def scan_link(title: str, url: str) -> Scan:
+    return LINK_MATCHER.scan(f"{title} {url}")
+
+
 def is_pdf_candidate(url: str) -> bool:
-    lowered = url.lower()
-    pdf_markers = [".pdf", "/file", "download", "/edocman/", "task=document.download"]
-    return any(marker in lowered for marker in pdf_markers)
+    return LINK_MATCHER.scan(url).has("pdf")
 
 
-def is_subject_candidate(title: str, url: str, subject_slug: str) -> bool:
-    subject_conf = SUBJECT_CONFIGS[subject_slug]
-    subject_aliases = list(subject_conf.get("aliases", []))
-    haystack = f"{title} {url}".lower()
-    positive = subject_aliases + COMMON_EXAM_ALIASES
-    has_subject_marker = any(alias in haystack for alias in subject_aliases)
-    has_exam_marker = any(alias in haystack for alias in COMMON_EXAM_ALIASES)
-    if not any(keyword in haystack for keyword in positive):
-        return False
+def subject_candidate_from_scan(scan: Scan, subject_slug: str) -> bool:
+    has_subject_marker = scan.has(("alias", subject_slug))
+    has_exam_marker = scan.has("exam")
     if not (has_subject_marker or (has_exam_marker and subject_slug == "mathematiques")):
         return False
 
     if has_subject_marker:
-        blacklist = set(SUBJECT_BLACKLIST) - set(subject_aliases)
-        if any(keyword in haystack for keyword in blacklist):
+        subject_aliases = set(SUBJECT_CONFIGS[subject_slug].get("aliases", []))  # type: ignore[arg-type]
+        if scan.hits("blacklist") - subject_aliases:
             return False
     return True
 
 
+def strict_filters_from_scan(scan: Scan, source_type: str, subject_slug: str) -> bool:
+    if not subject_candidate_from_scan(scan, subject_slug):
+        return False
+    if not scan.has("level"):
+        return False
+    if source_type == "annale" and not scan.has("annale"):
+        return False
+    return True
+
+
+def is_subject_candidate(title: str, url: str, subject_slug: str) -> bool:
+    return subject_candidate_from_scan(scan_link(title, url), subject_slug)
+
+
 def is_bepc_3eme_candidate(title: str, url: str) -> bool:
-    haystack = f"{title} {url}".lower()
-    level_markers = ["3eme", "troisieme", "3e", "bepc", "zone"]
-    return any(marker in haystack for marker in level_markers)
+    return scan_link(title, url).has("level")
 
 
 def passes_strict_filters(source_type: str, title: str, url: str, subject_slug: str) -> bool:
-    if not is_subject_candidate(title, url, subject_slug):
-        return False
-    if not is_bepc_3eme_candidate(title, url):
-        return False
-    if source_type == "annale":
-        haystack = f"{title} {url}".lower()
-        if "bepc" not in haystack and "zone" not in haystack and "blanc" not in haystack:
-            return False
-    return True
+    return strict_filters_from_scan(scan_link(title, url), source_type, subject_slug)
 
 
 def normalize_title(text: str, url: str) -> str:
@@ -166,108 +212,412 @@ def normalize_title(text: str, url: str) -> str:
 
 
 def looks_like_download_label(text: str) -> bool:
-    lowered = text.lower()
-    generic_tokens = ["telecharger", "download", "file", "pdf", "voir", "ouvrir"]
-    return not text or any(token in lowered for token in generic_tokens)
+    return not text or LINK_MATCHER.scan(text).has("download_label")
 
 
-def derive_link_title(anchor, absolute_url: str) -> str:
-    direct = normalize_title(anchor.get_text(" ", strip=True), absolute_url)
+def derive_link_title(anchor: Anchor, absolute_url: str) -> str:
+    direct = normalize_title(anchor.text(), absolute_url)
     if not looks_like_download_label(direct):
         return direct
 
-    card = anchor.find_parent(["article", "div", "li"])
-    if card:
-        candidate = card.find(["h1", "h2", "h3", "h4", "strong"])
-        if candidate:
-            title = normalize_title(candidate.get_text(" ", strip=True), absolute_url)
-            if not looks_like_download_label(title):
-                return title
+    heading = anchor.card_heading()
+    if heading is not None:
+        title = normalize_title(heading, absolute_url)
+        if not looks_like_download_label(title):
+            return title
     return direct
 
 
-def fetch_html(url: str) -> str:
-    response = requests.get(
+def fetch_html(
+    url: str,
+    session: Optional[requests.Session] = None,
+    cache: Optional[HttpCache] = None,
+) -> str:
+    return fetch_page(url, session=session, cache=cache).text
+
+
+def fetch_page(
+    url: str,
+    session: Optional[requests.Session] = None,
+    cache: Optional[HttpCache] = None,
+) -> CachedPage:
+    started = time.perf_counter()
+    outcome = "error"
+    with TRACER.span("fetch_page", **{"http.url": url}) as span:
+        try:
+            page = _fetch_page(url, session, cache)
+            outcome = page.status
+            if span is not None:
+                span.set("cache.status", page.status)
+            return page
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - started, stage="scrape", host=host_of(url), outcome=outcome)
+
+
+def _fetch_page(url: str, session: Optional[requests.Session], cache: Optional[HttpCache]) -> CachedPage:
+    if cache is not None:
+        return cache.fetch(url, session=session)
+    client = session or requests
+    response = client.get(
         url,
         headers={"User-Agent": USER_AGENT},
         timeout=25,
     )
     response.raise_for_status()
-    return response.text
+    return CachedPage(url=url, text=response.text, sha256=sha256_text(response.text), status="fetched")
+
+
+def memoized_links(cache: Optional[HttpCache], page: CachedPage, name: str, compute: Callable[[], object]) -> object:
+    if cache is None:
+        return compute()
+    stored = cache.get_derived(page, name)
+    if isinstance(stored, dict) and stored.get("fingerprint") == PARSE_FINGERPRINT:
+        return stored["value"]
+    value = compute()
+    cache.set_derived(page, name, {"fingerprint": PARSE_FINGERPRINT, "value": value})
+    return value
+
+
+def page_listing_links(
+    page: CachedPage, source_type: str, subject_slug: str, cache: Optional[HttpCache] = None
+) -> Tuple[List[Dict[str, str]], List[str]]:
+    return page_subject_listing_links(page, source_type, (subject_slug,), cache)[subject_slug]
+
+
+def page_subject_listing_links(
+    page: CachedPage, source_type: str, subjects: Sequence[str], cache: Optional[HttpCache] = None
+) -> Dict[str, Tuple[List[Dict[str, str]], List[str]]]:
+    found = memoized_links(
+        cache,
+        page,
+        f"listing:{source_type}:{'+'.join(subjects)}",
+        lambda: extract_subject_listing_links(page.text, page.url, source_type, subjects),
+    )
+    return {slug: (results, doc_pages) for slug, (results, doc_pages) in found.items()}  # type: ignore[union-attr]
 
 
-def should_crawl_doc_page(link_url: str, source_type: str, subject_slug: str) -> bool:
-    lowered = link_url.lower()
-    if source_type != "annale":
-        return False
-    subject_conf = SUBJECT_CONFIGS[subject_slug]
-    subject_aliases = list(subject_conf.get("aliases", []))
-    markers = ["bepc", "zone", "sujet", "edocman", "blanc"] + subject_aliases
-    return any(marker in lowered for marker in markers) and "download" not in lowered
+def page_doc_links(
+    page: CachedPage, source_type: str, subject_slug: str, cache: Optional[HttpCache] = None
+) -> List[Dict[str, str]]:
+    return page_subject_doc_links(page, source_type, (subject_slug,), cache)[subject_slug]
 
 
-def collect_links(page_html: str, page_url: str, source_type: str, subject_slug: str) -> List[Dict[str, str]]:
-    soup = BeautifulSoup(page_html, "html.parser")
-    seen: Set[str] = set()
-    results: List[Dict[str, str]] = []
-    doc_pages: Set[str] = set()
+def page_subject_doc_links(
+    page: CachedPage, source_type: str, subjects: Sequence[str], cache: Optional[HttpCache] = None
+) -> SubjectLinks:
+    return memoized_links(  # type: ignore[return-value]
+        cache,
+        page,
+        f"doc:{source_type}:{'+'.join(subjects)}",
+        lambda: extract_subject_doc_page_links(page.text, page.url, source_type, subjects),
+    )
 
-    for anchor in soup.find_all("a", href=True):
-        href = anchor["href"].strip()
-        absolute_url = urljoin(page_url, href)
-        title_text = derive_link_title(anchor, absolute_url)
 
-        if source_type in {"livre", "annale", "exercice", "cours"} and not passes_strict_filters(
-            source_type, title_text, absolute_url, subject_slug
-        ):
-            continue
+def page_pagination_links(page: CachedPage, cache: Optional[HttpCache] = None) -> List[str]:
+    return memoized_links(  # type: ignore[return-value]
+        cache,
+        page,
+        "pagination",
+        lambda: pagination_links(page.url, [anchor.href for anchor in get_backend().parse(page.text).anchors()]),
+    )
 
-        if is_pdf_candidate(absolute_url):
-            if absolute_url in seen:
-                continue
-            seen.add(absolute_url)
-            results.append(
-                {
-                    "url": absolute_url,
-                    "title": title_text,
-                    "sourceType": source_type,
-                }
-            )
-            continue
 
-        if should_crawl_doc_page(absolute_url, source_type, subject_slug):
-            doc_pages.add(absolute_url)
+def should_crawl_doc_page(link_url: str, source_type: str, subject_slug: str) -> bool:
+    return doc_page_from_scan(LINK_MATCHER.scan(link_url), source_type, subject_slug)
 
-    for doc_page in doc_pages:
-        try:
-            doc_html = fetch_html(doc_page)
-        except Exception:
+
+def doc_page_from_scan(url_scan: Scan, source_type: str, subject_slug: str) -> bool:
+    if source_type != "annale":
+        return False
+    return (url_scan.has("doc_page") or url_scan.has(("alias", subject_slug))) and not url_scan.has("download")
+
+
+def extract_listing_links(
+    page_html: str, page_url: str, source_type: str, subject_slug: str, backend: Optional[HtmlBackend] = None
+) -> Tuple[List[Dict[str, str]], List[str]]:
+    return extract_subject_listing_links(page_html, page_url, source_type, (subject_slug,), backend)[subject_slug]
+
+
+def extract_subject_listing_links(
+    page_html: str,
+    page_url: str,
+    source_type: str,
+    subjects: Sequence[str],
+    backend: Optional[HtmlBackend] = None,
+) -> Dict[str, Tuple[List[Dict[str, str]], List[str]]]:
+    # Each anchor is parsed and scanned once, then checked against every subject's filters.
+    document = (backend or get_backend()).parse(page_html)
+    strict = source_type in STRICT_SOURCE_TYPES
+    found: Dict[str, Tuple[List[Dict[str, str]], List[str]]] = {slug: ([], []) for slug in subjects}
+    seen: Dict[str, Set[str]] = {slug: set() for slug in subjects}
+
+    for anchor in document.anchors():
+        href = anchor.href.strip()
+        absolute_url = urljoin(page_url, href)
+        # Page numbers of the listing itself (?start=20 under /edocman/) look like downloads otherwise.
+        if same_listing(absolute_url, page_url):
             continue
-        doc_soup = BeautifulSoup(doc_html, "html.parser")
-        page_title = normalize_title(doc_soup.title.get_text(" ", strip=True) if doc_soup.title else "", doc_page)
+        title_text = derive_link_title(anchor, absolute_url)
+        scan = scan_link(title_text, absolute_url)
+        url_scan = LINK_MATCHER.scan(absolute_url)
 
-        for doc_anchor in doc_soup.find_all("a", href=True):
-            doc_url = urljoin(doc_page, doc_anchor["href"].strip())
-            if not is_pdf_candidate(doc_url):
+        for slug in subjects:
+            if strict and not strict_filters_from_scan(scan, source_type, slug):
                 continue
-            if doc_url in seen:
+            results, doc_pages = found[slug]
+            if url_scan.has("pdf"):
+                if absolute_url in seen[slug]:
+                    continue
+                seen[slug].add(absolute_url)
+                results.append(
+                    {
+                        "url": absolute_url,
+                        "title": title_text,
+                        "sourceType": source_type,
+                    }
+                )
                 continue
-            anchor_title = derive_link_title(doc_anchor, doc_url)
-            title = anchor_title if not looks_like_download_label(anchor_title) else page_title
-            if source_type in {"livre", "annale", "exercice", "cours"} and not passes_strict_filters(
-                source_type, title, doc_url, subject_slug
-            ):
+
+            if doc_page_from_scan(url_scan, source_type, slug) and absolute_url not in doc_pages:
+                doc_pages.append(absolute_url)
+
+    return found
+
+
+def extract_doc_page_links(
+    doc_html: str, doc_page: str, source_type: str, subject_slug: str, backend: Optional[HtmlBackend] = None
+) -> List[Dict[str, str]]:
+    return extract_subject_doc_page_links(doc_html, doc_page, source_type, (subject_slug,), backend)[subject_slug]
+
+
+def extract_subject_doc_page_links(
+    doc_html: str,
+    doc_page: str,
+    source_type: str,
+    subjects: Sequence[str],
+    backend: Optional[HtmlBackend] = None,
+) -> SubjectLinks:
+    document = (backend or get_backend()).parse(doc_html)
+    page_title = normalize_title(document.title() or "", doc_page)
+    strict = source_type in STRICT_SOURCE_TYPES
+    found: SubjectLinks = {slug: [] for slug in subjects}
+    seen: Dict[str, Set[str]] = {slug: set() for slug in subjects}
+
+    for doc_anchor in document.anchors():
+        doc_url = urljoin(doc_page, doc_anchor.href.strip())
+        if not is_pdf_candidate(doc_url) or same_listing(doc_url, doc_page):
+            continue
+        pending = [slug for slug in subjects if doc_url not in seen[slug]]
+        if not pending:
+            continue
+        anchor_title = derive_link_title(doc_anchor, doc_url)
+        title = anchor_title if not looks_like_download_label(anchor_title) else page_title
+        scan = scan_link(title, doc_url)
+        for slug in pending:
+            if strict and not strict_filters_from_scan(scan, source_type, slug):
                 continue
-            seen.add(doc_url)
-            results.append(
+            seen[slug].add(doc_url)
+            found[slug].append(
                 {
                     "url": doc_url,
                     "title": title,
                     "sourceType": source_type,
                 }
             )
+    return found
+
+
+def merge_links(results: List[Dict[str, str]], seen: Set[str], links: List[Dict[str, str]]) -> None:
+    for link in links:
+        if link["url"] in seen:
+            continue
+        seen.add(link["url"])
+        results.append(link)
+
+
+def merge_doc_links(
+    listing: Dict[str, Tuple[List[Dict[str, str]], List[str]]],
+    doc_links: Callable[[str], SubjectLinks],
+) -> SubjectLinks:
+    # Each subject keeps its own listing order, then its doc pages in the order they were found.
+    merged: SubjectLinks = {}
+    for slug, (results, doc_pages) in listing.items():
+        links = list(results)
+        seen = {item["url"] for item in links}
+        for doc_page in doc_pages:
+            merge_links(links, seen, doc_links(doc_page).get(slug, []))
+        merged[slug] = links
+    return merged
+
+
+def merge_subject_links(parts: Iterable[SubjectLinks]) -> SubjectLinks:
+    # Links of the pages of one listing, in page order.
+    merged: SubjectLinks = {}
+    seen: Dict[str, Set[str]] = {}
+    for part in parts:
+        for slug, links in part.items():
+            merge_links(merged.setdefault(slug, []), seen.setdefault(slug, set()), links)
+    return merged
+
+
+def doc_page_owners(listing: Dict[str, Tuple[List[Dict[str, str]], List[str]]]) -> Dict[str, Tuple[str, ...]]:
+    owners: Dict[str, List[str]] = {}
+    for slug, (_, doc_pages) in listing.items():
+        for doc_page in doc_pages:
+            owners.setdefault(doc_page, []).append(slug)
+    return {doc_page: tuple(slugs) for doc_page, slugs in owners.items()}
+
+
+def collect_links(
+    page_html: str,
+    page_url: str,
+    source_type: str,
+    subject_slug: str,
+    cache: Optional[HttpCache] = None,
+    page_hashes: Optional[Dict[str, str]] = None,
+    on_failure: Optional[FailureFn] = None,
+) -> List[Dict[str, str]]:
+    return collect_subject_links(
+        page_html, page_url, source_type, (subject_slug,), cache, page_hashes, on_failure
+    )[subject_slug]
+
+
+def collect_subject_links(
+    page_html: str,
+    page_url: str,
+    source_type: str,
+    subjects: Sequence[str],
+    cache: Optional[HttpCache] = None,
+    page_hashes: Optional[Dict[str, str]] = None,
+    on_failure: Optional[FailureFn] = None,
+) -> SubjectLinks:
+    page = CachedPage(url=page_url, text=page_html, sha256=sha256_text(page_html), status="fetched")
+    listing = page_subject_listing_links(page, source_type, subjects, cache)
+    doc_results: Dict[str, SubjectLinks] = {}
+
+    for doc_page, owners in doc_page_owners(listing).items():
+        try:
+            doc = fetch_page(doc_page, cache=cache)
+        except Exception as exc:
+            if on_failure is not None:
+                on_failure("doc_page", source_type, doc_page, owners, exc)
+            continue
+        if page_hashes is not None:
+            page_hashes[doc_page] = doc.sha256
+        doc_results[doc_page] = page_subject_doc_links(doc, source_type, owners, cache)
+
+    return merge_doc_links(listing, lambda doc_page: doc_results.get(doc_page, {}))
+
+
+def crawl_source_pages(
+    source_pages: List[Tuple[str, str]],
+    subject_slug: str,
+    concurrency: int = 8,
+    per_host: int = 2,
+    delay: float = 0.5,
+    page_hashes: Optional[Dict[str, str]] = None,
+    cache: Optional[HttpCache] = None,
+    on_failure: Optional[FailureFn] = None,
+    discovery: Optional[Discovery] = None,
+) -> List[Dict[str, str]]:
+    found = crawl_subject_pages(
+        [(source_type, page_url, (subject_slug,)) for source_type, page_url in source_pages],
+        concurrency=concurrency,
+        per_host=per_host,
+        delay=delay,
+        page_hashes=page_hashes,
+        cache=cache,
+        on_failure=on_failure,
+        discovery=discovery,
+    )
+    return [link for index in sorted(found) for link in found[index][subject_slug]]
+
+
+def listing_order(discovery: Optional[Discovery], page_url: str) -> Tuple[int, int, str]:
+    return (discovery.depth.get(page_url, 0) if discovery is not None else 0), page_offset(page_url), page_url
+
+
+def crawl_subject_pages(
+    source_pages: List[Tuple[str, str, Tuple[str, ...]]],
+    concurrency: int = 8,
+    per_host: int = 2,
+    delay: float = 0.5,
+    page_hashes: Optional[Dict[str, str]] = None,
+    cache: Optional[HttpCache] = None,
+    on_failure: Optional[FailureFn] = None,
+    discovery: Optional[Discovery] = None,
+) -> Dict[int, SubjectLinks]:
+    # Every listing and doc page is fetched once and classified for all the subjects that share it.
+    # With discovery, the pages of a listing and its sitemap children are merged into the seed's links.
+    listings: Dict[int, Dict[str, Dict[str, Tuple[List[Dict[str, str]], List[str]]]]] = {}
+    doc_results: Dict[Tuple[int, str], SubjectLinks] = {}
+    session = build_session(pool_size=concurrency)
+
+    def fetch(url: str) -> CachedPage:
+        return fetch_page(url, session=session, cache=cache)
+
+    def handle(url: str, page: CachedPage, context: Hashable) -> List[Tuple[str, Hashable]]:
+        kind, index, source_type, subjects = context  # type: ignore[misc]
+        if page_hashes is not None:
+            page_hashes[url] = page.sha256
+        if kind == "doc":
+            doc_results[(index, url)] = page_subject_doc_links(page, source_type, subjects, cache)
+            return []
+        listing = page_subject_listing_links(page, source_type, subjects, cache)
+        listings.setdefault(index, {})[url] = listing
+        owners = doc_page_owners(listing)
+        links = sum(len(results) for results, _ in listing.values())
+        print(f"Scraped {source_type}: {url} ({links} links, {len(owners)} doc pages)")
+        tasks: List[Tuple[str, Hashable]] = [
+            (doc_page, ("doc", index, source_type, slugs)) for doc_page, slugs in owners.items()
+        ]
+        if discovery is not None:
+            for next_page in discovery.follow(page, page_pagination_links(page, cache)):
+                tasks.append((next_page, ("listing", index, source_type, subjects)))
+        return tasks
+
+    def on_error(url: str, context: Hashable, exc: Exception) -> None:
+        kind, _, source_type, subjects = context  # type: ignore[misc]
+        if kind == "listing":
+            print(f"Scraping {source_type}: {url}\n  -> failed: {exc}")
+        if on_failure is not None:
+            on_failure("listing" if kind == "listing" else "doc_page", source_type, url, subjects, exc)
+
+    seeds = [
+        (page_url, ("listing", index, source_type, subjects))
+        for index, (source_type, page_url, subjects) in enumerate(source_pages)
+    ]
+    if discovery is not None:
+        for index, page_url in discovery.read_sitemaps(fetch):
+            source_type, _, subjects = source_pages[index]
+            seeds.append((page_url, ("listing", index, source_type, subjects)))
+    stats = crawl(
+        seeds,
+        (lambda url: discovery.fetch(url, fetch)) if discovery is not None else fetch,
+        handle,
+        on_error=on_error,
+        concurrency=concurrency,
+        per_host=per_host,
+        delay=delay,
+    )
+    session.close()
 
-    return results
+    found: Dict[int, SubjectLinks] = {}
+    for index, (_, page_url, _) in enumerate(source_pages):
+        if index not in listings:
+            continue
+        found[index] = merge_subject_links(
+            merge_doc_links(listing, lambda doc_page: doc_results.get((index, doc_page), {}))
+            for _, listing in sorted(listings[index].items(), key=lambda item: listing_order(discovery, item[0]))
+        )
+        pages = f" from {len(listings[index])} pages" if len(listings[index]) > 1 else ""
+        print(f"  {page_url} -> found {sum(len(links) for links in found[index].values())} links{pages}")
+
+    print(
+        f"Crawl stats: tasks={stats['tasks']}, fetches={stats['fetches']}, "
+        f"shared_fetches={stats['shared_fetches']}"
+    )
+    return found
 
 
 def parse_args() -> argparse.Namespace:
@@ -278,6 +628,65 @@ def parse_args() -> argparse.Namespace:
         default="mathematiques",
         help="Subject slug to scrape",
     )
+    parser.add_argument(
+        "--all-subjects",
+        action="store_true",
+        help="Crawl the source pages of every subject in one run and write every urls_<subject>.json",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["serial", "async"],
+        default=None,
+        help="serial fetches pages one by one; async crawls them with a bounded worker pool "
+        "(default: serial, or async with --all-subjects)",
+    )
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--cache-dir", default=None, help="HTTP cache directory (default: data/http_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk HTTP cache")
+    parser.add_argument("--offline", action="store_true", help="Replay pages from the HTTP cache without network access")
+    parser.add_argument(
+        "--cache-fresh-for",
+        type=float,
+        default=0.0,
+        help="Seconds a cached page is reused without revalidation (0 always sends a conditional request)",
+    )
+    parser.add_argument("--cache-ttl-days", type=float, default=30.0, help="Evict cache entries unused for this long")
+    parser.add_argument("--cache-max-entries", type=int, default=5000, help="LRU bound on cached pages")
+    parser.add_argument("--concurrency", type=int, default=8, help="Async mode: total concurrent fetches")
+    parser.add_argument("--per-host", type=int, default=2, help="Async mode: concurrent fetches per host")
+    parser.add_argument("--delay", type=float, default=0.5, help="Async mode: seconds between request starts per host")
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help="Pagination links followed from each source page (0 only scrapes the configured pages)",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=DEFAULT_MAX_PAGES,
+        help="Pagination pages fetched beyond the configured ones",
+    )
+    parser.add_argument(
+        "--max-sitemap-pages",
+        type=int,
+        default=DEFAULT_MAX_SITEMAP_PAGES,
+        help="Pages of the configured listings taken from sitemaps, on top of --max-pages",
+    )
+    parser.add_argument("--no-sitemaps", action="store_true", help="Do not read robots.txt/sitemap.xml for listing pages")
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument(
+        "--html-parser",
+        choices=BACKENDS,
+        default="auto",
+        help="HTML backend for link extraction (auto uses lxml when installed, else BeautifulSoup html.parser)",
+    )
+    parser.add_argument(
+        "--retry-queue",
+        default=None,
+        help="Failure queue drained by retry_failures.py (default: data/retry_queue.sqlite3)",
+    )
     return parser.parse_args()
 
 
@@ -294,30 +703,193 @@ def resolve_source_pages(subject_slug: str) -> List[Tuple[str, str]]:
     return deduped
 
 
-def main() -> None:
-    args = parse_args()
-    subject_slug = args.subject
-    script_dir = Path(__file__).resolve().parent
-    output_path = script_dir / f"urls_{subject_slug}.json"
-    source_pages = resolve_source_pages(subject_slug)
+def resolve_subject_source_pages(subjects: Sequence[str]) -> List[Tuple[str, str, Tuple[str, ...]]]:
+    # Pages shared by several subjects (the default catalogs) appear once, tagged with all of them.
+    owners: Dict[Tuple[str, str], List[str]] = {}
+    for slug in subjects:
+        for entry in resolve_source_pages(slug):
+            owners.setdefault(entry, []).append(slug)
+    return [(source_type, page_url, tuple(slugs)) for (source_type, page_url), slugs in owners.items()]
 
-    all_links: List[Dict[str, str]] = []
-    for source_type, page_url in source_pages:
-        print(f"Scraping {source_type}: {page_url}")
-        try:
-            html = fetch_html(page_url)
-            links = collect_links(html, page_url, source_type, subject_slug)
-            print(f"  -> found {len(links)} links")
-            all_links.extend(links)
-        except Exception as exc:
-            print(f"  -> failed: {exc}")
 
-    deduped = {(item["url"], item["sourceType"]): item for item in all_links}
+def finalize_links(links: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    deduped = {(item["url"], item["sourceType"]): item for item in links}
     final_data = list(deduped.values())
     final_data.sort(key=lambda x: (x["sourceType"], x["title"].lower()))
+    return final_data
+
+
+def queue_fetch_failure(
+    queue: RetryQueue, subjects: Sequence[str], kind: str, source_type: str, url: str, exc: Exception
+) -> None:
+    for index, subject_slug in enumerate(subjects):
+        queue.enqueue_failure(
+            kind,
+            retry_key(subject_slug, url),
+            host_of(url),
+            {"subject": subject_slug, "sourceType": source_type, "url": url},
+            f"{type(exc).__name__}:{exc}",
+            retryable=is_retryable_exception(exc),
+            priority=1 if kind == "listing" else 0,
+            # One fetch failed, however many subjects wanted the page.
+            count_host=index == 0,
+        )
+
 
-    output_path.write_text(json.dumps(final_data, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"Saved {len(final_data)} urls to {output_path}")
+def main() -> None:
+    args = parse_args()
+    subjects = sorted(SUBJECT_CONFIGS) if args.all_subjects else [args.subject]
+    mode = args.mode or ("async" if args.all_subjects else "serial")
+    script_dir = Path(__file__).resolve().parent
+    source_pages = resolve_subject_source_pages(subjects)
+    with start_stage("scrape", args, script_dir.parents[1]):
+        backend = set_default_backend(args.html_parser)
+        print(f"HTML parser backend: {backend.name}")
+        if args.all_subjects:
+            print(f"Crawling {len(source_pages)} source pages for {len(subjects)} subjects")
+
+        manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(script_dir.parents[1]))
+        page_hashes: Dict[str, str] = {}
+        cache = None
+        if not args.no_cache:
+            cache_dir = Path(args.cache_dir) if args.cache_dir else script_dir.parents[1] / "data" / "http_cache"
+            cache = HttpCache(
+                cache_dir,
+                mode="offline" if args.offline else "default",
+                fresh_for=args.cache_fresh_for,
+                ttl=args.cache_ttl_days * 24 * 3600,
+                max_entries=args.cache_max_entries,
+            )
+        queue = RetryQueue(Path(args.retry_queue) if args.retry_queue else default_queue_path(script_dir.parents[1]))
+        catalog = open_catalog(args, script_dir.parents[1])
+        previous_lastmod: Dict[str, str] = {}
+        for subject_slug in subjects:
+            entry = manifest.get("scrape", subject_slug) or {}
+            previous_lastmod.update(entry.get("sitemapLastmod") or {})  # type: ignore[arg-type]
+        discovery = Discovery(
+            source_pages,
+            previous_lastmod,
+            cache=cache,
+            max_depth=args.max_depth,
+            max_pages=args.max_pages,
+            max_sitemap_pages=args.max_sitemap_pages,
+            sitemaps=not args.no_sitemaps,
+        )
+
+        def on_failure(kind: str, source_type: str, url: str, owners: Tuple[str, ...], exc: Exception) -> None:
+            if not args.offline:
+                queue_fetch_failure(queue, owners, kind, source_type, url, exc)
+
+        if mode == "async":
+            found = crawl_subject_pages(
+                source_pages,
+                concurrency=args.concurrency,
+                per_host=args.per_host,
+                delay=args.delay,
+                page_hashes=page_hashes,
+                cache=cache,
+                on_failure=on_failure,
+                discovery=discovery,
+            )
+        else:
+            pages: Dict[int, List[SubjectLinks]] = {}
+            pending = [(index, page_url) for index, (_, page_url, _) in enumerate(source_pages)]
+            pending.extend(discovery.read_sitemaps(lambda url: fetch_page(url, cache=cache)))
+            while pending:
+                index, page_url = pending.pop(0)
+                source_type, _, owners = source_pages[index]
+                print(f"Scraping {source_type}: {page_url}")
+                try:
+                    page = discovery.fetch(page_url, lambda url: fetch_page(url, cache=cache))
+                    page_hashes[page_url] = page.sha256
+                    links = collect_subject_links(
+                        page.text, page_url, source_type, owners, cache=cache, page_hashes=page_hashes, on_failure=on_failure
+                    )
+                    print(f"  -> found {sum(len(items) for items in links.values())} links")
+                except Exception as exc:
+                    print(f"  -> failed: {exc}")
+                    on_failure("listing", source_type, page_url, owners, exc)
+                    continue
+                pages.setdefault(index, []).append(links)
+                pending.extend((index, next_page) for next_page in discovery.follow(page, page_pagination_links(page, cache)))
+            found = {index: merge_subject_links(parts) for index, parts in pages.items()}
+        print(
+            "Discovery: "
+            + ", ".join(f"{name}={count}" for name, count in discovery.stats.items())
+            + f", reused={cache.stats['reused'] if cache is not None else 0}"
+        )
+
+        resolved = sum(
+            queue.resolve(kind, retry_key(subject_slug, url))
+            for subject_slug in subjects
+            for url in page_hashes
+            for kind in ("listing", "doc_page")
+        )
+        page_index = {(source_type, page_url): index for index, (source_type, page_url, _) in enumerate(source_pages)}
+        listing_urls = set(discovery.owner)
+        for subject_slug in subjects:
+            subject_pages = resolve_source_pages(subject_slug)
+            own_indexes = {page_index[entry] for entry in subject_pages}
+            own_urls = {page_url for page_url, index in discovery.owner.items() if index in own_indexes}
+            all_links = [
+                link
+                for entry in subject_pages
+                for link in found.get(page_index[entry], {}).get(subject_slug, [])
+            ]
+            final_data = finalize_links(all_links)
+            save_subject_links(
+                script_dir,
+                manifest,
+                subject_slug,
+                subject_pages,
+                final_data,
+                {url: digest for url, digest in page_hashes.items() if url in own_urls or url not in listing_urls},
+                {url: lastmod for url, lastmod in discovery.lastmod.items() if url in own_urls and lastmod},
+            )
+            if catalog is not None:
+                catalog.add_urls(subject_slug, final_data)
+        manifest.save()
+        if catalog is not None:
+            catalog.close()
+        if cache is not None:
+            evicted = cache.prune()
+            print(
+                "HTTP cache: "
+                + ", ".join(f"{name}={count}" for name, count in cache.stats.items())
+                + f", evicted={evicted}"
+            )
+        pending = queue.stats()
+        print(
+            f"Retry queue: resolved={resolved}, "
+            + ", ".join(f"{kind}={counts}" for kind, counts in sorted(pending.items()) if kind != "download")
+        )
+        queue.close()
+
+
+def save_subject_links(
+    script_dir: Path,
+    manifest: Manifest,
+    subject_slug: str,
+    source_pages: List[Tuple[str, str]],
+    final_data: List[Dict[str, str]],
+    page_hashes: Dict[str, str],
+    sitemap_lastmod: Optional[Dict[str, str]] = None,
+) -> None:
+    output_path = script_dir / f"urls_{subject_slug}.json"
+    LINKS_FOUND.inc(len(final_data), subject=subject_slug)
+    changed = write_if_changed(output_path, json.dumps(final_data, ensure_ascii=False, indent=2))
+    manifest.record(
+        "scrape",
+        subject_slug,
+        {"sourcePages": sha256_text(json.dumps(source_pages))},
+        [output_path],
+        pageHashes=page_hashes,
+        sitemapLastmod=sitemap_lastmod or {},
+    )
+    if changed:
+        print(f"Saved {len(final_data)} urls to {output_path}")
+    else:
+        print(f"Unchanged {len(final_data)} urls in {output_path}")
 
 
 if __name__ == "__main__":
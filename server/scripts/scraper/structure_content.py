@@ -1,8 +1,22 @@
 import json
 import re
 import argparse
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from annale_segments import Segment, link_corrections, segment_annale
+from boilerplate import BOILERPLATE_VERSION, clean_content
+from catalog import add_catalog_arguments, open_catalog
+from chunker import Chunk, Chunker
+from classifier import KeywordMatcher
+from corpus import iter_extracted
+from dedupe_text import load_duplicate_map
+from jsonl_store import COMPRESSIONS, ShardedJsonlWriter
+from manifest import Manifest, default_manifest_path, sha256_text, write_if_changed
+from metrics import CHUNKS_EMITTED, TRACER, add_metrics_arguments, start_stage
 
 
 CHAPTER_MAP = {
@@ -49,41 +63,64 @@ SUBJECT_KEYWORDS = {
     "histoire-geographie": ["histoire", "geographie", "géographie", "histoire-geo", "histoire geo"],
 }
 
+MAX_TOKENS_LIVRE = 5000
+MAX_TOKENS_DEFAULT = 9000
+LINK_FIELDS = ("correction", "exerciseOf")
+OUTPUT_NAMING_VERSION = "content-id-1"
+# Bump when segmentation changes, so annales already structured are split again.
+ANNALE_SEGMENTS_VERSION = "1"
+
+SOURCE_TYPE_MARKERS = {
+    "annale": ["annale", "bepc"],
+    "exercice": ["exercice"],
+    "livre": ["livre", "namo", "fascicule"],
+}
+
+
+def build_content_matcher() -> KeywordMatcher:
+    tagged: List[Tuple[str, Hashable]] = [(key, ("chapter", key)) for key in CHAPTER_MAP]
+    for slug, keywords in SUBJECT_KEYWORDS.items():
+        tagged.extend((keyword, ("subject", slug)) for keyword in keywords)
+    for source_type, markers in SOURCE_TYPE_MARKERS.items():
+        tagged.extend((marker, ("source", source_type)) for marker in markers)
+    return KeywordMatcher(tagged, cache_size=1024)
+
 
-def normalize_text(text: str) -> str:
-    text = text.replace("\r\n", "\n")
-    text = re.sub(r"[ \t]+", " ", text)
-    lines = [line.strip() for line in text.split("\n")]
-    lines = [line for line in lines if line]
-    return "\n\n".join(lines)
+CONTENT_MATCHER = build_content_matcher()
 
 
-def strip_repeated_lines(text: str) -> str:
-    lines = [line.strip() for line in text.split("\n") if line.strip()]
-    freq: Dict[str, int] = {}
-    for line in lines:
-        freq[line] = freq.get(line, 0) + 1
-    repeated = {line for line, count in freq.items() if count >= 8 and len(line) <= 120}
-    cleaned = [line for line in lines if line not in repeated]
-    return "\n".join(cleaned)
+def paragraph_starts(cleaned: str) -> List[int]:
+    line_starts: List[int] = []
+    offset = 0
+    for line in cleaned.split("\n\n"):
+        line_starts.append(offset)
+        offset += len(line) + 2
+    return line_starts
+
+
+def chunk_page_span(
+    line_starts: List[int], line_pages: List[int], start: int, end: int
+) -> Tuple[Optional[int], Optional[int]]:
+    if not line_pages or len(line_starts) != len(line_pages):
+        return None, None
+    first = line_pages[max(0, bisect_right(line_starts, start) - 1)]
+    last = line_pages[max(0, bisect_right(line_starts, max(start, end - 1)) - 1)]
+    return first, last
 
 
 def find_chapter(title: str, content: str) -> Optional[str]:
-    haystack = f"{title} {content[:2000]}".lower()
+    scan = CONTENT_MATCHER.scan(f"{title} {content[:2000]}")
     for key, chapter in CHAPTER_MAP.items():
-        if key in haystack:
+        if scan.has(("chapter", key)):
             return chapter
     return None
 
 
 def detect_source_type(path_name: str) -> str:
-    lowered = path_name.lower()
-    if "annale" in lowered or "bepc" in lowered:
-        return "annale"
-    if "exercice" in lowered:
-        return "exercice"
-    if "livre" in lowered or "namo" in lowered or "fascicule" in lowered:
-        return "livre"
+    scan = CONTENT_MATCHER.scan(path_name)
+    for source_type in ("annale", "exercice", "livre"):
+        if scan.has(("source", source_type)):
+            return source_type
     return "cours"
 
 
@@ -99,32 +136,12 @@ def parse_year_zone(text: str) -> Dict[str, Optional[str]]:
     }
 
 
-def estimate_tokens(text: str) -> int:
-    return len(text.split())
-
+def estimate_tokens(text: str, chunker: Optional[Chunker] = None) -> int:
+    return (chunker or Chunker()).count(text)
 
-def split_long_content(text: str, max_tokens: int = 5000) -> List[str]:
-    if estimate_tokens(text) <= max_tokens:
-        return [text]
 
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks: List[str] = []
-    current: List[str] = []
-    current_tokens = 0
-
-    for paragraph in paragraphs:
-        p_tokens = estimate_tokens(paragraph)
-        if current and current_tokens + p_tokens > max_tokens:
-            chunks.append("\n\n".join(current))
-            current = [paragraph]
-            current_tokens = p_tokens
-        else:
-            current.append(paragraph)
-            current_tokens += p_tokens
-
-    if current:
-        chunks.append("\n\n".join(current))
-    return chunks
+def split_long_content(text: str, max_tokens: int = 5000, chunker: Optional[Chunker] = None) -> List[str]:
+    return [chunk.text for chunk in (chunker or Chunker()).chunk(text, max_tokens)]
 
 
 def slugify(value: str) -> str:
@@ -140,9 +157,9 @@ def resolve_subject(subject_slug: Optional[str], title: str, relative_path: str,
     if subject_slug and subject_slug in SUBJECT_LABELS:
         return SUBJECT_LABELS[subject_slug]
 
-    haystack = f"{title} {relative_path} {content[:3000]}".lower()
-    for slug, keywords in SUBJECT_KEYWORDS.items():
-        if any(keyword in haystack for keyword in keywords):
+    scan = CONTENT_MATCHER.scan(f"{title} {relative_path} {content[:3000]}")
+    for slug in SUBJECT_KEYWORDS:
+        if scan.has(("subject", slug)):
             return SUBJECT_LABELS[slug]
     return SUBJECT_LABELS["mathematiques"]
 
@@ -151,11 +168,221 @@ def source_dir_name(source_type: str) -> str:
     return mapping.get(source_type, f"{source_type}s")
 
 
-def build_output_name(source_type: str, chapter: Optional[str], title: str, index: int) -> str:
+def content_id(source_key: str, text: str) -> str:
+    # Output names end with a hash of the source file and the part content: stable across runs and
+    # workers, and two sources that land on the same chapter or title no longer overwrite each other.
+    return sha256_text(f"{source_key}\0{text}")[:10]
+
+
+def build_output_name(source_type: str, chapter: Optional[str], title: str, index: int, digest: str) -> str:
     base = chapter or slugify(title)
     if source_type == "livre" and index > 0:
-        return f"{base}_part_{index + 1}.json"
-    return f"{base}.json"
+        return f"{base}_part_{index + 1}_{digest}.json"
+    return f"{base}_{digest}.json"
+
+
+def annale_pieces(
+    cleaned: str, segments: List[Segment], title: str, source_key: str, chunker: Chunker, max_tokens: int
+) -> List[Tuple[Chunk, str, str, Dict[str, object]]]:
+    # One record per exercise; an exercise over the token budget is still split into parts.
+    base = slugify(title)
+    links = link_corrections(segments)
+    segment_parts = [chunker.chunk(cleaned[segment.start:segment.end], max_tokens) for segment in segments]
+    # Links point at the first record of the linked exercise.
+    names = [
+        f"{base}_{segment.slug}{'_part_1' if len(parts) > 1 else ''}_{content_id(source_key, parts[0].text)}.json"
+        for segment, parts in zip(segments, segment_parts)
+    ]
+    pieces: List[Tuple[Chunk, str, str, Dict[str, object]]] = []
+    for index, (segment, parts) in enumerate(zip(segments, segment_parts)):
+        linked = names[links[index]] if index in links else None
+        for part_index, part in enumerate(parts):
+            final_title = f"{title} - {segment.label}"
+            output_name = names[index]
+            if len(parts) > 1:
+                final_title += f" - part {part_index + 1}"
+                output_name = f"{base}_{segment.slug}_part_{part_index + 1}_{content_id(source_key, part.text)}.json"
+            shifted = Chunk(part.text, segment.start + part.start, segment.start + part.end, part.token_count)
+            pieces.append(
+                (
+                    shifted,
+                    final_title,
+                    output_name,
+                    {
+                        "segment": {
+                            "kind": segment.kind,
+                            "number": segment.number,
+                            "section": segment.section,
+                            "paper": segment.paper + 1,
+                        },
+                        "questions": segment.questions,
+                        "correction": linked if segment.section == "sujet" else None,
+                        "exerciseOf": linked if segment.section == "corrige" else None,
+                    },
+                )
+            )
+    return pieces
+
+
+def build_documents(
+    payload: Dict[str, object],
+    subject_slug: Optional[str],
+    fallback_name: str,
+    chunker: Optional[Chunker] = None,
+    segment_annales: bool = True,
+) -> Tuple[List[Tuple[str, Dict[str, object]]], Optional[str]]:
+    chunker = chunker or Chunker()
+    relative_path = str(payload.get("relativePath", ""))
+    pdf_file = str(payload.get("pdfFile", fallback_name))
+    raw_content = str(payload.get("content", ""))
+    is_scanned = payload.get("isScanned", False)
+
+    if is_scanned:
+        return [], f"Skip scanned file: {relative_path}"
+
+    source_type = detect_source_type(relative_path)
+    title = Path(pdf_file).stem.replace("_", " ").strip()
+    pages = payload.get("pages")
+    cleaned, line_pages = clean_content(raw_content, pages if isinstance(pages, list) else None)  # type: ignore[arg-type]
+    if not cleaned.strip():
+        return [], f"Skip empty content: {relative_path}"
+    subject_label = resolve_subject(subject_slug, title, relative_path, cleaned)
+    chapter = find_chapter(title, cleaned) if subject_label == "Mathématiques" else None
+    meta_year_zone = parse_year_zone(f"{title} {relative_path} {cleaned[:2000]}")
+
+    documents: List[Tuple[str, Dict[str, object]]] = []
+    max_tokens = MAX_TOKENS_LIVRE if source_type == "livre" else MAX_TOKENS_DEFAULT
+    output_dir = f"{subject_slug or to_subject_slug(subject_label)}/{source_dir_name(source_type)}"
+    segments = segment_annale(cleaned) if source_type == "annale" and segment_annales else []
+    if segments:
+        pieces = annale_pieces(cleaned, segments, title, relative_path or pdf_file, chunker, max_tokens)
+    else:
+        parts = chunker.chunk(cleaned, max_tokens)
+        pieces = []
+        for index, part in enumerate(parts):
+            final_title = title if len(parts) == 1 else f"{title} - part {index + 1}"
+            output_name = build_output_name(
+                source_type,
+                chapter if source_type != "annale" else None,
+                final_title,
+                index,
+                content_id(relative_path or pdf_file, part.text),
+            )
+            pieces.append((part, final_title, output_name, {}))
+
+    line_starts = paragraph_starts(cleaned) if line_pages else []
+    for part, final_title, output_name, extra in pieces:
+        part_content = part.text
+        page_start, page_end = chunk_page_span(line_starts, line_pages, part.start, part.end)
+        document = {
+            "sourceType": source_type,
+            "subject": subject_label,
+            "grade": "3eme",
+            "chapter": chapter if source_type != "annale" else None,
+            "title": final_title,
+            "content": part_content,
+            "metadata": {
+                "source": "fomesoutra",
+                "pdfFile": pdf_file,
+                "year": meta_year_zone["year"],
+                "zone": meta_year_zone["zone"],
+                "hasCorrection": "corrige" in cleaned.lower() or "correction" in cleaned.lower(),
+                "tokenCount": part.token_count,
+                "tokenizer": chunker.tokenizer_spec,
+                "pageStart": page_start,
+                "pageEnd": page_end,
+            },
+        }
+        if extra:
+            metadata = document["metadata"]
+            metadata.update(  # type: ignore[union-attr]
+                {name: f"{output_dir}/{value}" if name in LINK_FIELDS and value else value for name, value in extra.items()}
+            )
+        documents.append((f"{output_dir}/{output_name}", document))
+    return documents, None
+
+
+def write_documents(
+    documents: List[Tuple[str, Dict[str, object]]],
+    output_root: Path,
+    server_root: Path,
+    writer: Optional[ShardedJsonlWriter] = None,
+) -> List[Path]:
+    written: List[Path] = []
+    for relative_output, document in documents:
+        CHUNKS_EMITTED.inc(subject=relative_output.split("/")[0], source_type=str(document["sourceType"]))
+        if writer is not None:
+            writer.write(relative_output, document)
+            print(f"Structured -> {relative_output} (jsonl)")
+            continue
+        output_path = output_root / relative_output
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(output_path, json.dumps(document, ensure_ascii=False, indent=2))
+        written.append(output_path)
+        print(f"Structured -> {output_path.relative_to(server_root)}")
+    return written
+
+
+def structure_settings(args: argparse.Namespace, chunker: Chunker) -> Dict[str, str]:
+    # Everything besides the extracted file itself that changes the structured output.
+    return {
+        "outputFormat": args.output_format,
+        "chunker": f"{chunker.tokenizer_spec}:{chunker.overlap_tokens}",
+        "annaleSegments": "0" if args.no_segment_annales else ANNALE_SEGMENTS_VERSION,
+        "boilerplate": BOILERPLATE_VERSION,
+        "naming": OUTPUT_NAMING_VERSION,
+    }
+
+
+WORKER_STATE: Dict[str, object] = {}
+StructureTask = Tuple[str, Dict[str, object], Callable[[], Dict[str, object]], str]
+StructureResult = Tuple[str, Dict[str, object], List[Tuple[str, Dict[str, object]]], Optional[str]]
+
+
+def init_worker(tokenizer_spec: str, overlap_tokens: int, subject_slug: Optional[str], segment_annales: bool) -> None:
+    WORKER_STATE.update(
+        chunker=Chunker(tokenizer_spec, overlap_tokens), subject_slug=subject_slug, segment_annales=segment_annales
+    )
+
+
+def structure_payload(
+    payload: Dict[str, object], fallback_name: str
+) -> Tuple[List[Tuple[str, Dict[str, object]]], Optional[str]]:
+    return build_documents(
+        payload,
+        WORKER_STATE["subject_slug"],  # type: ignore[arg-type]
+        fallback_name,
+        WORKER_STATE["chunker"],  # type: ignore[arg-type]
+        segment_annales=bool(WORKER_STATE["segment_annales"]),
+    )
+
+
+def structure_all(
+    tasks: Iterable[StructureTask], workers: int, init_args: Tuple[str, int, Optional[str], bool]
+) -> Iterator[StructureResult]:
+    # Results come back in task order, so output and manifest are the same for any worker count.
+    if workers <= 1:
+        init_worker(*init_args)
+        for key, inputs, load_payload, fallback_name in tasks:
+            with TRACER.span("structure_document", key=key) as span:
+                documents, skip_reason = structure_payload(load_payload(), fallback_name)
+                if span is not None:
+                    span.set("chunks", len(documents))
+            yield key, inputs, documents, skip_reason
+        return
+
+    # Payloads are read here and parsed, cleaned and chunked in the workers; a bounded window of
+    # pending files keeps memory flat on large corpora.
+    window: Deque[Tuple[str, Dict[str, object], "Future[Tuple[List[Tuple[str, Dict[str, object]]], Optional[str]]]"]] = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as pool:
+        for key, inputs, load_payload, fallback_name in tasks:
+            window.append((key, inputs, pool.submit(structure_payload, load_payload(), fallback_name)))
+            if len(window) >= workers * 4:
+                key, inputs, future = window.popleft()
+                yield (key, inputs, *future.result())
+        while window:
+            key, inputs, future = window.popleft()
+            yield (key, inputs, *future.result())
 
 
 def parse_args() -> argparse.Namespace:
@@ -165,6 +392,39 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Optional subject slug. If set, reads extracted/<subject> and outputs raw/<subject>/...",
     )
+    parser.add_argument("--manifest", default=None, help="Pipeline manifest path (default: data/pipeline_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="Restructure every file, even when its hash is unchanged")
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json writes one file per document; jsonl appends to sharded files under raw/jsonl/<subject>",
+    )
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="none", help="jsonl shard compression")
+    parser.add_argument(
+        "--tokenizer",
+        default="approx",
+        help="Tokenizer used for chunk budgets: approx, whitespace, tiktoken:<encoding> or hf:<tokenizer.json>",
+    )
+    parser.add_argument(
+        "--keep-duplicates",
+        action="store_true",
+        help="Structure every extracted file even if dedupe_text.py marked it as a duplicate",
+    )
+    parser.add_argument(
+        "--no-segment-annales",
+        action="store_true",
+        help="Keep annales as token-budget parts instead of one record per exercise and correction",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes that parse, clean and chunk extracted files (1 structures in this process)",
+    )
+    add_catalog_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--overlap-tokens", type=int, default=0, help="Tokens repeated between consecutive parts")
     return parser.parse_args()
 
 
@@ -182,53 +442,60 @@ def main() -> None:
     if not extracted_root.exists():
         raise FileNotFoundError("Missing server/data/extracted. Run extract_text.py first.")
 
-    for extracted_file in extracted_root.rglob("*.json"):
-        payload = json.loads(extracted_file.read_text(encoding="utf-8"))
-        relative_path = payload.get("relativePath", "")
-        pdf_file = payload.get("pdfFile", extracted_file.stem)
-        raw_content = payload.get("content", "")
-        is_scanned = payload.get("isScanned", False)
-
-        if is_scanned:
-            print(f"Skip scanned file: {relative_path}")
-            continue
-
-        source_type = detect_source_type(relative_path)
-        title = Path(pdf_file).stem.replace("_", " ").strip()
-        cleaned = normalize_text(strip_repeated_lines(raw_content))
-        if not cleaned.strip():
-            print(f"Skip empty content: {relative_path}")
-            continue
-        subject_label = resolve_subject(subject_slug, title, relative_path, cleaned)
-        chapter = find_chapter(title, cleaned) if subject_label == "Mathématiques" else None
-        meta_year_zone = parse_year_zone(f"{title} {relative_path} {cleaned[:2000]}")
-
-        parts = split_long_content(cleaned, max_tokens=5000 if source_type == "livre" else 9000)
-        for index, part_content in enumerate(parts):
-            final_title = title if len(parts) == 1 else f"{title} - part {index + 1}"
-            document = {
-                "sourceType": source_type,
-                "subject": subject_label,
-                "grade": "3eme",
-                "chapter": chapter if source_type != "annale" else None,
-                "title": final_title,
-                "content": part_content,
-                "metadata": {
-                    "source": "fomesoutra",
-                    "pdfFile": pdf_file,
-                    "year": meta_year_zone["year"],
-                    "zone": meta_year_zone["zone"],
-                    "hasCorrection": "corrige" in cleaned.lower() or "correction" in cleaned.lower(),
-                },
-            }
-
-            output_dir = output_root / (subject_slug or to_subject_slug(subject_label)) / source_dir_name(source_type)
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            output_name = build_output_name(source_type, document["chapter"], final_title, index)
-            output_path = output_dir / output_name
-            output_path.write_text(json.dumps(document, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"Structured -> {output_path.relative_to(server_root)}")
+    manifest = Manifest.load(Path(args.manifest) if args.manifest else default_manifest_path(server_root))
+    with start_stage("structure", args, server_root):
+        catalog = open_catalog(args, server_root)
+        writer: Optional[ShardedJsonlWriter] = None
+        if args.output_format == "jsonl":
+            writer = ShardedJsonlWriter(output_root / "jsonl" / (subject_slug or "all"), compression=args.compression)
+        chunker = Chunker(args.tokenizer, args.overlap_tokens)
+        duplicates = {} if args.keep_duplicates else load_duplicate_map(server_root, subject_slug)
+        live_outputs: Set[Path] = set()
+        stale_outputs: Set[Path] = set()
+
+        settings = structure_settings(args, chunker)
+        stats = {"unchanged": 0, "documents": 0}
+
+        def pending() -> Iterator[StructureTask]:
+            for key, inputs, load_payload, fallback_name in iter_extracted(extracted_root, server_root, manifest):
+                inputs.update(settings)
+                inputs["duplicateOf"] = duplicates.get(key, "")
+                previous_outputs = manifest.outputs("structure", key)
+                if not args.force and manifest.is_fresh("structure", key, inputs):
+                    live_outputs.update(previous_outputs)
+                    stats["unchanged"] += 1
+                    continue
+                stale_outputs.update(previous_outputs)
+
+                if inputs["duplicateOf"]:
+                    print(f"Skip duplicate of {inputs['duplicateOf']}: {key}")
+                    manifest.record("structure", key, inputs, [])
+                    continue
+                yield key, inputs, load_payload, fallback_name
+
+        init_args = (args.tokenizer, args.overlap_tokens, subject_slug, not args.no_segment_annales)
+        for key, inputs, documents, skip_reason in structure_all(pending(), args.workers, init_args):
+            if skip_reason:
+                print(skip_reason)
+            written = write_documents(documents, output_root, server_root, writer)
+            if catalog is not None:
+                catalog.add_documents(documents)
+            live_outputs.update(path.resolve() for path in written)
+            manifest.record("structure", key, inputs, written)
+            stats["documents"] += len(documents)
+
+        if writer is not None:
+            writer.close()
+        for stale_path in sorted(stale_outputs - live_outputs):
+            if stale_path.exists():
+                stale_path.unlink()
+                print(f"Removed stale -> {stale_path.relative_to(server_root)}")
+                if catalog is not None:
+                    catalog.remove_documents([stale_path.relative_to(output_root).as_posix()])
+        if catalog is not None:
+            catalog.close()
+        manifest.save()
+        print(f"Wrote {stats['documents']} documents, skipped {stats['unchanged']} unchanged extracted files")
 
 
 if __name__ == "__main__":
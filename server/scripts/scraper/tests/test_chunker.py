@@ -0,0 +1,25 @@
+import pytest
+
+from chunker import Chunker
+
+
+CASES = [
+    ("whitespace", 5, "a b c d e.\n\nf g h i j.\n\n" + "k " * 10, 10),
+    ("whitespace", 3, " ".join(f"w{i}." + ("\n\n" if i % 3 == 2 else "") for i in range(40)), 6),
+    ("whitespace", 4, "\n\n".join(" ".join(f"p{i}w{j}" for j in range(i % 7 + 1)) + "." for i in range(30)), 8),
+    ("approx", 20, "\n\n".join(f"Paragraphe {i} avec quelques mots de plus." for i in range(50)), 40),
+]
+
+
+@pytest.mark.parametrize("tokenizer, overlap, text, max_tokens", CASES)
+def test_overlap_never_repeats_only_the_previous_tail(tokenizer, overlap, text, max_tokens):
+    chunks = Chunker(tokenizer, overlap).chunk(text, max_tokens)
+    assert chunks
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.text not in previous.text
+        assert chunk.end > previous.end
+
+
+def test_overlap_dropped_when_no_room_for_new_unit():
+    chunks = Chunker("whitespace", 5).chunk("a b c d e.\n\nf g h i j.\n\n" + "k " * 10, 10)
+    assert [chunk.text for chunk in chunks] == ["a b c d e.\n\nf g h i j.", "k " * 10]
@@ -0,0 +1,41 @@
+import json
+import os
+
+from dedupe_text import DUPLICATES_NAME, load_duplicate_map
+
+
+def write_duplicates(folder, pairs, mtime):
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / DUPLICATES_NAME
+    clusters = [{"canonical": canonical, "duplicates": [{"key": key, "similarity": 1.0}]} for key, canonical in pairs]
+    path.write_text(json.dumps({"clusters": clusters}), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_subject_run_found_from_every_scope(tmp_path):
+    extracted = tmp_path / "data" / "extracted"
+    write_duplicates(extracted / "maths", [("data/extracted/maths/b.json", "data/extracted/maths/a.json")], 100)
+    (extracted / "svt").mkdir()
+
+    expected = {"data/extracted/maths/b.json": "data/extracted/maths/a.json"}
+    assert load_duplicate_map(tmp_path, "maths") == expected
+    assert load_duplicate_map(tmp_path) == expected
+    assert load_duplicate_map(tmp_path, "svt") == {}
+
+
+def test_newest_run_decides_for_the_documents_it_covers(tmp_path):
+    extracted = tmp_path / "data" / "extracted"
+    write_duplicates(
+        extracted,
+        [
+            ("data/extracted/maths/b.json", "data/extracted/maths/a.json"),
+            ("data/extracted/svt/d.json", "data/extracted/svt/c.json"),
+        ],
+        100,
+    )
+    write_duplicates(extracted / "maths", [("data/extracted/maths/e.json", "data/extracted/maths/a.json")], 200)
+
+    assert load_duplicate_map(tmp_path) == {
+        "data/extracted/maths/e.json": "data/extracted/maths/a.json",
+        "data/extracted/svt/d.json": "data/extracted/svt/c.json",
+    }
@@ -0,0 +1,37 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from extract_text import extract_parallel, stream_payload
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        if text:
+            page.insert_text((72, 72), text)
+            page.insert_text((72, 144), "Deuxième bloc « é » \\ \"quoted\"")
+    doc.save(path)
+    doc.close()
+
+
+@pytest.mark.parametrize(
+    "pages",
+    [
+        ["Sujet BEPC 2019 — mathématiques", "Exercice 1 : calculer la somme des termes.", "Corrigé"],
+        ["court"],
+        [""],
+    ],
+)
+def test_streamed_json_matches_parallel_json(tmp_path, pages):
+    pdf_path = tmp_path / "sujet.pdf"
+    make_pdf(pdf_path, pages)
+    streamed = tmp_path / "streamed.json"
+    assembled = tmp_path / "assembled.json"
+    stats = {"processed": 0, "scanned_skipped": 0}
+
+    stream_payload(pdf_path, pdf_path.relative_to(tmp_path), streamed)
+    extract_parallel([(pdf_path, pdf_path.relative_to(tmp_path), assembled)], stats, workers=2, pages_per_task=1)
+
+    assert streamed.read_bytes() == assembled.read_bytes()
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("lxml")
+
+from html_backends import LxmlDocument, get_backend
+
+
+PAGES = [
+    '<div class="card"><h3>Sujet BEPC 2019</h3><a href="/a.pdf">Télécharger <b>le sujet</b></a></div>',
+    '<a href="1">one <a href="2">two</a></a>',
+    '<a href="1">one <a href="2">two</a> three</a> four',
+    '<A HREF="1">one <A HREF="2">two</A></A>',
+    '<a href="1">one<a name="x">two</a>three</a>',
+    '<ul><li><a href="1">a <a href="2">b</li><li><a href="3">c</a></li></ul>',
+    '<a href="1">x<!-- </a> --><a href="2">y</a></a>',
+    '<a href="1">one<table><tr><td>cell</td></tr></table>after</a> out',
+    '<a href="1">x</b>y</a>',
+    '<a href="1"/>text<a href="2">two</a>',
+    '<p><a href="1">one <b>bold <a href="2">two</b> three</a> four</p>',
+    '<a href="1">one<div><a href="2">two</a></div>tail</a>',
+    '<a href="1">unclosed <span>x</span><p>para',
+    '<p><a href="1">one</p><p>two</a></p> out',
+    '<a href="1">x<br>y<img src="z.png">z</a><script>var s = "<a href=\'3\'>";</script>',
+    '<li><a href="1">one<li>two</a>',
+    '<ul><li><a href="a.pdf">Télécharger</a><li><h3>Sujet BEPC 2019</h3></ul>',
+    '<ul><li><a href="a.pdf">Télécharger</a><li><h3>Sujet BEPC 2019</h3>',
+    '<div><p><a href="a.pdf">Télécharger</a><div><h3>Sujet BEPC 2019</h3></div></div>',
+    '<div class="card"><p>Sujet<p><a href="a.pdf">PDF</a></div><h3>Autre</h3>',
+    '<p><a href="a.pdf">PDF</a><article><h3>Sujet</h3></article>',
+    '<div><a href="a.pdf">PDF<html>x</html>y</a></div>',
+    '<title>Sujet <b>BEPC</b></title><div><a href="a.pdf">PDF<tbody></a>&amp; co</div>',
+    '<!DOCTYPE html><html><head><title>Annales</title></head><body><div><a href="a.pdf">PDF</a></div></body></html>',
+]
+
+
+def anchors(backend, html):
+    return [(anchor.href, anchor.text(), anchor.card_heading()) for anchor in get_backend(backend).parse(html).anchors()]
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_lxml_anchors_match_bs4(html):
+    assert anchors("lxml", html) == anchors("bs4", html)
+
+
+def test_lxml_title_matches_bs4():
+    for html in PAGES:
+        assert get_backend("lxml").parse(html).title() == get_backend("bs4").parse(html).title()
+
+
+def test_well_formed_pages_stay_on_lxml():
+    assert isinstance(get_backend("lxml").parse(PAGES[0]), LxmlDocument)
+    assert isinstance(get_backend("lxml").parse(PAGES[-1]), LxmlDocument)
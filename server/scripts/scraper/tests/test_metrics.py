@@ -0,0 +1,22 @@
+import argparse
+import json
+
+import pytest
+
+from metrics import start_stage
+
+
+def test_failed_stage_still_writes_metrics_and_trace(tmp_path):
+    args = argparse.Namespace(
+        metrics_file=str(tmp_path / "stage.prom"), metrics_port=None, trace_file=str(tmp_path / "trace.jsonl")
+    )
+    with pytest.raises(ValueError):
+        with start_stage("broken", args, tmp_path):
+            raise ValueError("bad input")
+
+    metrics = (tmp_path / "stage.prom").read_text(encoding="utf-8")
+    assert 'scraper_stage_last_failure_timestamp_seconds{stage="broken"}' in metrics
+    assert 'scraper_stage_last_success_timestamp_seconds{stage="broken"}' not in metrics
+    assert 'scraper_stage_duration_seconds{stage="broken"}' in metrics
+    spans = json.loads((tmp_path / "trace.jsonl").read_text(encoding="utf-8"))["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[-1]["status"] == {"code": 2, "message": "ValueError: bad input"}
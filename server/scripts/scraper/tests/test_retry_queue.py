@@ -0,0 +1,17 @@
+from download_pdfs import queue_download_failure
+from retry_queue import RetryQueue, retry_key
+
+
+def test_download_jobs_are_kept_per_subject(tmp_path):
+    url = "https://example.org/bepc-2019.pdf"
+    entry = {"url": url, "sourceType": "annale", "title": "BEPC 2019"}
+    with RetryQueue(tmp_path / "queue.sqlite3", base_delay=0, max_delay=0) as queue:
+        for subject in ("mathematiques", "physique-chimie"):
+            destination = tmp_path / "data" / "pdfs" / subject / "annales" / "bepc_2019.pdf"
+            queue_download_failure(queue, entry, subject, destination, tmp_path, "http_503")
+
+        assert queue.resolve("download", retry_key("physique-chimie", url))
+        jobs = queue.lease(["download"], subject="mathematiques")
+        assert [job.key for job in jobs] == [retry_key("mathematiques", url)]
+        assert jobs[0].payload["file"] == "data/pdfs/mathematiques/annales/bepc_2019.pdf"
+        assert queue.lease(["download"], subject="physique-chimie") == []